@@ -0,0 +1,108 @@
+#! /usr/bin/env python3
+#
+# measured recomputation cost of the elements of X dropped by an attacker,
+# on the actual dependency graph of python/itsuku.py: the phi and PHI_K
+# functions with seeds drawn from a real X segment built by build_X,
+# where mtp_half_array_eval.c uses a random quadratic-bias PHI.
+#
+# usage: itsuku_half_array_eval.py n ll N [nthreads] [var=val]*
+#   n: number of dependencies, ll: log2 of the segment length l,
+#   N: number of segments (each with a random challenge)
+#   drop=0.5: fraction of dropped elements
+#   mode=alt: dropped elements are regularly spaced, or random
+#   x=64: size of X elements
+#   seed=None: seed for random drops and challenges
+#
+# As in mtp_half_array_eval.c, the first n elements of a segment are free,
+# an element already recomputed for the same target is not counted twice,
+# and the cost is the average number of F calls per segment element.
+
+import os
+import sys
+import random
+from math import sqrt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'python'))
+from itsuku import fast_build_X, phis_bulk, PHI_K
+
+# whether X[i] is dropped, for a fraction drop of the elements
+def dropped_table(l, n, drop, mode, rnd):
+    if mode == 'alt':
+        # i is dropped when i*drop crosses an integer
+        d = [ int((i + 1) * drop) > int(i * drop) for i in range(l) ]
+    elif mode == 'random':
+        d = [ rnd() < drop for i in range(l) ]
+    else:
+        raise Exception("unexpected mode=%s" % mode)
+    d[:n] = [False] * n
+    return d
+
+# average recomputation cost over the elements of one random segment
+def average_cost(args):
+    n, l, x, drop, mode, seed = args
+    rnd = random.Random(seed)
+    I = rnd.getrandbits(512).to_bytes(64, 'big')
+    X = fast_build_X(I, l, l, n, x, threads=1)
+    # real dependencies of i in [n, l), seeded by X[i-1]
+    deps = [None] * n + \
+        phis_bulk([ X[i-1][:4] for i in range(n, l) ], list(range(n, l)), n)
+    dropped = dropped_table(l, n, drop, mode, rnd.random)
+    # used[j] == i if X[j] was already recomputed for X[i]
+    used = [-1] * l
+    cost = 0
+    for i in range(n, l):
+        if not dropped[i]:
+            continue
+        used[i] = i
+        todo = [i]
+        while todo:
+            j = todo.pop()
+            cost += 1
+            for k in deps[j]:
+                if dropped[k] and used[k] != i:
+                    used[k] = i
+                    todo.append(k)
+    print('.', file=sys.stderr, end='', flush=True)
+    return cost / l
+
+def main(argv):
+    pos = [ a for a in argv if '=' not in a ]
+    opts = dict(a.split('=', 1) for a in argv if '=' in a)
+    if len(pos) not in [3, 4]:
+        print("usage: %s n ll N [nthreads] [drop=0.5] [mode=alt|random] [x=64] [seed=S]"
+              % sys.argv[0], file=sys.stderr)
+        return 1
+    n, ll, N = int(pos[0]), int(pos[1]), int(pos[2])
+    nthreads = int(pos[3]) if len(pos) == 4 else (os.cpu_count() or 1)
+    drop = float(opts.get('drop', 0.5))
+    mode = opts.get('mode', 'alt')
+    x = int(opts.get('x', 64))
+    seed = int(opts['seed']) if 'seed' in opts else \
+        int.from_bytes(os.urandom(8), 'big')
+    assert 1 <= n <= len(PHI_K)
+    assert 2 <= ll <= 32 and n < 2 ** ll
+    assert 1 <= N and 1 <= nthreads
+    assert 0.0 <= drop <= 1.0 and 4 <= x <= 64
+
+    l = 2 ** ll
+    print("N=%d n=%d l=%d (2^%d) drop=%.3f mode=%s" % (N, n, l, ll, drop, mode))
+
+    trials = [ (n, l, x, drop, mode, seed + k) for k in range(N) ]
+    if nthreads > 1:
+        from multiprocessing import Pool
+        with Pool(nthreads) as pool:
+            costs = pool.map(average_cost, trials)
+    else:
+        costs = list(map(average_cost, trials))
+    print('', file=sys.stderr)
+
+    s, s2 = sum(costs), sum(c * c for c in costs)
+    average = s / N
+    stddev = sqrt(max(0.0, s2 - s * s / N) / N)
+    print("N=%d n=%d l=%d (2^%d) drop=%.3f mode=%s cost: %.3f +- %.3f" %
+          (N, n, l, ll, drop, mode, average, stddev))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -4,103 +4,204 @@
 #
 # expected number of H calls to process when looking for a special X sequence
 #
+# Usable as a library: attack_costs() evaluates one parameter set, sweep()
+# a grid of parameter sets, as plain records which can be written as CSV or
+# JSON. On the command line, a comma separated value (eg "p=21,25 n=2,4")
+# sweeps over all combinations:
+#
+#   mtp_attack_costs.py [-hs01] [--csv|--json] [var=val[,val...]]*
 
-# defaults values
-p = 21
-L = 70
-c_F = 11
-c_X = 9
-back_sweep = False
-with_precomp = False
-tmax = 20
-n = 2 # how many dependencies, including previous element
-dmax = 70 # max d
-
-# get arguments
 import sys
-
-# -s & cold-blooded settings
-for a in sys.argv[1:]:
-    if a == '-h' or a == '--help':
-        print("%s [-hs01] [var=val]*" % sys.argv[0], file=sys.stderr)
-        sys.exit(0)
-    elif a == '-s':
-        back_sweep = True
-    elif a == '-0':
-        # defaults
-        p, L, c_F, c_X, back_sweep, with_precomp, n, dmax = \
-            21, 70, 11, 9, False, False, 2, 100
-    elif a == '-1':
-        # new defaults
-        p, L, c_F, c_X, back_sweep, with_precomp, n, dmax = \
-            25, 31, 1, 1, True, True, 6, 100
-    else:
-        exec(a)
-
-assert n >= 2, "attack requires at least one other dependency"
-assert dmax > 15
-
 from math import log2
+from functools import lru_cache
+from itertools import product
 
-# define T unless explicitely
-try:
-    p = log2(T)
-except NameError:
-    T = 2 ** p
+# defaults values
+DEFAULTS = {
+    'p': 21,
+    'L': 70,
+    'c_F': 11,
+    'c_X': 9,
+    'back_sweep': False,
+    'with_precomp': False,
+    'tmax': 20,
+    'n': 2, # how many dependencies, including previous element
+    'dmax': 70, # max d
+    'T': None, # 2**p unless explicitely
+}
+
+# -0 & -1 settings
+PROFILES = {
+    # defaults
+    '-0': dict(p=21, L=70, c_F=11, c_X=9, back_sweep=False, with_precomp=False,
+               n=2, dmax=100),
+    # new defaults
+    '-1': dict(p=25, L=31, c_F=1, c_X=1, back_sweep=True, with_precomp=True,
+               n=6, dmax=100),
+}
 
-# helper functions
+# helper functions, memoized as sweeps evaluate them repeatedly
+@lru_cache(maxsize=None)
 def sequence_weighted_cost(t, n):
     return sum(i * (1.0 - t ** (1-n)) * (t ** -((n-1)*(i-1))) \
                for i in range(t-2, 0, -1)) + (t-2) * t ** -((n-1)*(t-2))
 
-def search_weighted_cost(t, L, bs):
+@lru_cache(maxsize=None)
+def search_weighted_cost(t, L, bs, c_X, c_F):
     return sum((1 + c_X * i + 0.5 * c_F * t * i) * ((t-1)/t) ** i * (1/t)
                for i in range(0, L)) + \
                    ( 1 + c_X * L + 0.5 * c_F * t * L + \
-                     ((0.5 * L) if back_sweep else 0)) * ((t-1)/t) ** L
-
-print("p=%d (T=2^%d=%d) L=%d c_F=%d c_X=%d back_sweep=%s with_precomp=%s tmax=%d n=%d dmax=%d" %
-      (p, p, T, L, c_F, c_X, back_sweep, with_precomp, tmax, n, dmax))
-
-# non cheating (nc) cost of computing X
-sq_nc = c_F * T
-
-# non cheating (nc) cost of computing an omega
-se_nc = 1 + c_X * L + ((0.5 * L) if back_sweep else 0)
-
-print("non cheating cost: 2^%.2f + 2^{d+%.2f} | 2^{%.2f}" %
-      (log2(sq_nc), log2(se_nc), log2(sq_nc + se_nc * 2**dmax)))
-
-print(" t | DN-FC & DN-DN | TOTAL for dmax (multiplier)")
-for t in range(3, tmax + 1):
-    # number of F computation per attempt
-    sq_wc = sequence_weighted_cost(t, n)
-    # sequence expected number of attempts
-    sq_na = t ** ((n-1)*(t-2))
-    # log2 cost of computing one sequence
-    sq_lc = log2(c_F * sq_wc * sq_na)
-    # number of needed sequences
-    sq_nb = T / t
-    # total cost
-    sq_ltc = c_F * sq_wc * sq_na * sq_nb
-    # cost in H calls of one search with t compression
-    se_wc = search_weighted_cost(t, L, back_sweep)
-    # number of expected attempts for ONE omega,
-    # because of missing array X elements...
-    se_na = (t/(t-1)) ** L
-    # Dinur & Nadler approximated evaluations of their attack, with n...
-    sq_dn = c_F * T * t ** ((n-1)*(t-2)-1)
-    se_dn = c_F * 0.5 * t * t * (1-1/t) ** -L
-    # total cost
-    total = (sq_ltc if with_precomp else 0) + se_wc * se_na * 2 ** dmax
-    # show result
-    print("%2d | 2^%.2f + 2^{d+%.2f} | 2^%.2f + 2^{d+%.2f} | 2^{%.2f} (x %.1f)" %
-          ( t,
+                     ((0.5 * L) if bs else 0)) * ((t-1)/t) ** L
+
+# complete and check a parameter set
+def params(**kwargs):
+    unknown = set(kwargs) - set(DEFAULTS)
+    if unknown:
+        raise Exception("unexpected parameters: %s" % sorted(unknown))
+    P = dict(DEFAULTS, **kwargs)
+    # define T unless explicitely
+    if P['T'] is None:
+        P['T'] = 2 ** P['p']
+    else:
+        P['p'] = log2(P['T'])
+    assert P['n'] >= 2, "attack requires at least one other dependency"
+    assert P['dmax'] > 15
+    return P
+
+# non cheating costs, in H calls
+def non_cheating_costs(P):
+    # non cheating (nc) cost of computing X
+    sq_nc = P['c_F'] * P['T']
+    # non cheating (nc) cost of computing an omega
+    se_nc = 1 + P['c_X'] * P['L'] + ((0.5 * P['L']) if P['back_sweep'] else 0)
+    return sq_nc, se_nc
+
+# evaluate the attack for t in [3, tmax], return one record per t
+# log2 values are named l*, costs are in H calls
+def attack_costs(**kwargs):
+    P = params(**kwargs)
+    T, L, n, c_F, c_X = P['T'], P['L'], P['n'], P['c_F'], P['c_X']
+    back_sweep, with_precomp, dmax = P['back_sweep'], P['with_precomp'], P['dmax']
+    sq_nc, se_nc = non_cheating_costs(P)
+    records = []
+    for t in range(3, P['tmax'] + 1):
+        # number of F computation per attempt
+        sq_wc = sequence_weighted_cost(t, n)
+        # sequence expected number of attempts
+        sq_na = t ** ((n-1)*(t-2))
+        # number of needed sequences
+        sq_nb = T / t
+        # total cost
+        sq_ltc = c_F * sq_wc * sq_na * sq_nb
+        # cost in H calls of one search with t compression
+        se_wc = search_weighted_cost(t, L, back_sweep, c_X, c_F)
+        # number of expected attempts for ONE omega,
+        # because of missing array X elements...
+        se_na = (t/(t-1)) ** L
+        # Dinur & Nadler approximated evaluations of their attack, with n...
+        sq_dn = c_F * T * t ** ((n-1)*(t-2)-1)
+        se_dn = c_F * 0.5 * t * t * (1-1/t) ** -L
+        # total cost
+        total = (sq_ltc if with_precomp else 0) + se_wc * se_na * 2 ** dmax
+        records.append(dict(P,
+            t = t,
             # my Dinur & Nadler cost evaluation
-            log2(sq_ltc), log2(se_wc*se_na),
+            lsequence = log2(sq_ltc), lsearch = log2(se_wc*se_na),
             # Dinur & Nadler evaluations
-            log2(sq_dn), log2(se_dn),
+            lsequence_dn = log2(sq_dn), lsearch_dn = log2(se_dn),
             # total cost for dmax
-            log2(total),
-            total / ((sq_nc if with_precomp else 0) + se_nc * 2 ** dmax)
-          ))
+            ltotal = log2(total),
+            multiplier = total / ((sq_nc if with_precomp else 0) + se_nc * 2 ** dmax)))
+    return records
+
+# evaluate all combinations of a grid { name: [values] }, plus fixed values
+def sweep(grid, **fixed):
+    names = sorted(grid)
+    records = []
+    for values in product(*(grid[k] for k in names)):
+        records += attack_costs(**dict(fixed, **dict(zip(names, values))))
+    return records
+
+# as one table per parameter set
+def show(**kwargs):
+    P = params(**kwargs)
+    print("p=%d (T=2^%d=%d) L=%d c_F=%d c_X=%d back_sweep=%s with_precomp=%s tmax=%d n=%d dmax=%d" %
+          (P['p'], P['p'], P['T'], P['L'], P['c_F'], P['c_X'], P['back_sweep'],
+           P['with_precomp'], P['tmax'], P['n'], P['dmax']))
+    sq_nc, se_nc = non_cheating_costs(P)
+    print("non cheating cost: 2^%.2f + 2^{d+%.2f} | 2^{%.2f}" %
+          (log2(sq_nc), log2(se_nc), log2(sq_nc + se_nc * 2**P['dmax'])))
+    print(" t | DN-FC & DN-DN | TOTAL for dmax (multiplier)")
+    for r in attack_costs(**kwargs):
+        # show result
+        print("%2d | 2^%.2f + 2^{d+%.2f} | 2^%.2f + 2^{d+%.2f} | 2^{%.2f} (x %.1f)" %
+              (r['t'], r['lsequence'], r['lsearch'], r['lsequence_dn'],
+               r['lsearch_dn'], r['ltotal'], r['multiplier']))
+
+def write_csv(records, out=sys.stdout):
+    import csv
+    if records:
+        w = csv.DictWriter(out, fieldnames=list(records[0]))
+        w.writeheader()
+        w.writerows(records)
+
+def write_json(records, out=sys.stdout):
+    import json
+    json.dump(records, out, indent=1)
+    out.write('\n')
+
+# parse "val[,val...]" as python literals, or powers of integers (2**20)
+def _value(v):
+    import ast
+    try:
+        return ast.literal_eval(v)
+    except (ValueError, SyntaxError):
+        pass
+    try:
+        e = ast.parse(v, mode='eval').body
+    except SyntaxError:
+        e = None
+    if isinstance(e, ast.BinOp) and isinstance(e.op, ast.Pow):
+        a, b = (ast.literal_eval(o) if isinstance(o, (ast.Constant, ast.UnaryOp))
+                else None for o in (e.left, e.right))
+        if type(a) is int and type(b) is int and b >= 0:
+            return a ** b
+    raise Exception("invalid value: %s (a literal or a**b of integers)" % v)
+
+def _values(s):
+    return [ _value(v) for v in s.split(',') ]
+
+def main(argv):
+    settings, grid, output = {}, {}, None
+    for a in argv:
+        if a == '-h' or a == '--help':
+            print("%s [-hs01] [--csv|--json] [var=val[,val...]]*" % sys.argv[0],
+                  file=sys.stderr)
+            return 0
+        elif a == '-s':
+            settings['back_sweep'] = True
+        elif a in PROFILES:
+            settings.update(PROFILES[a])
+            for k in PROFILES[a]:
+                grid.pop(k, None)
+        elif a in ['--csv', '--json']:
+            output = a[2:]
+        elif '=' in a:
+            k, v = a.split('=', 1)
+            values = _values(v)
+            if len(values) == 1:
+                settings[k] = values[0]
+                grid.pop(k, None)
+            else:
+                grid[k] = values
+        else:
+            raise Exception("unexpected argument: %s" % a)
+    if output is None and not grid:
+        show(**settings)
+    else:
+        records = sweep(grid, **settings)
+        (write_json if output == 'json' else write_csv)(records)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -2,10 +2,21 @@
 #
 # $Id: mtp_hardware.py 2046 2017-11-23 15:30:39Z fabien $
 #
+# Throughput of PoW solvers on dedicated hardware.
+#
+# Usable as a library: algorithms and hardware are Algo and Hardware
+# parameter objects, each model (direct, half_array, transposed_sram,
+# transposed_dram, dinur_nadler, pra) returns a record for one pair, and
+# evaluate() runs all models over all combinations of several profiles.
+# On the command line, several algorithm and hardware options may be given:
+#
+#   mtp_hardware.py [-0|-0a|-0b|-1|-2|-3]+ [-V100|-21.1|-30|-50|-75|-100]+
 
 import sys
 import math
 from math import ceil
+from collections import namedtuple
+from itertools import product
 
 # units
 k, M, G  = 1000, 1000**2, 1000**3
@@ -20,45 +31,36 @@ F = 30 * M # BLAKE2 core frequency in Hz
 Ma = 8 # 4T SRAM
 tr = 4 # transistors per GE
 
-for a in sys.argv[1:]:
-    if a in ['-0', '-0a', '-0b' ]: # MTP-Argon2
-        algo = 'MTP-Argon2'
-        T, x, n, S, L, theta, bs = 2**21, 1024, 2, 16, 70, 9, False
-        cX, cF, cR, cDN = 9, 11, 1.0, 68.4
-        if a == '-0b':
-            cDN = 116.2
-    elif a == '-1': # prop1
-        algo = 'prop1'
-        T, x, n, S, L, theta, bs = 2**25, 64, 0, 64, 16, 9, True
-        cX, cF, cR, cDN = 1, math.inf, math.inf, math.inf
-    elif a == '-2': # prop2
-        algo = 'prop2'
-        T, x, n, S, L, theta, bs = 2**25, 64, 2, 64, 84, 9, True
-        cX, cF, cR, cDN = 1, 1, 1.0, 98.0
-    elif a == '-3': # prop3
-        algo = 'Itsuku'
-        T, x, n, S, L, theta, bs= 2**25, 64, 4, 64, 9, 9, True
-        cX, cF, cR, cDN = 1, 1, 278.4, None
-    elif a == '-21.1' or a == '-V100':
-        hw, Ga, Bw = 'V100', 21.1 * G / tr, 1000.0 * G
-    elif a == '-30':
-        hw, Ga, Bw = '30bn', 30.0 * G / tr, 1300.0 * G
-    elif a == '-50':
-        hw, Ga, Bw = '50bn', 50.0 * G / tr, 2000.0 * G
-    elif a == '-75':
-        hw, Ga, Bw = '75bn', 75.0 * G / tr, 2500.0 * G
-    elif a == '-100':
-        hw, Ga, Bw = '100bn', 100.0 * G / tr, 3000.0 * G
-    else:
-        raise Exception("not implemented yet: %s" % a)
-
-array_size = T * x
-
-# (average) search state size
-# 11 for N, 1 for L, hash size S
-SS = (12 + S) * (((L + 1) // 2) if bs else 1)
-
-print("S=%d SS=%d" % (S, SS))
+# PoW algorithm parameters
+Algo = namedtuple('Algo', ['name', 'T', 'x', 'n', 'S', 'L', 'theta', 'bs',
+                           'cX', 'cF', 'cR', 'cDN'])
+
+# hardware: name, gate-equivalent area, memory bandwidth in bytes per second,
+# and hash core area, frequency and memory cell area
+Hardware = namedtuple('Hardware', ['name', 'Ga', 'Bw', 'Ha', 'F', 'Ma'],
+                      defaults=[Ha, F, Ma])
+
+ALGOS = {
+    # MTP-Argon2
+    '-0': Algo('MTP-Argon2', 2**21, 1024, 2, 16, 70, 9, False, 9, 11, 1.0, 68.4),
+    '-0a': Algo('MTP-Argon2', 2**21, 1024, 2, 16, 70, 9, False, 9, 11, 1.0, 68.4),
+    '-0b': Algo('MTP-Argon2', 2**21, 1024, 2, 16, 70, 9, False, 9, 11, 1.0, 116.2),
+    # prop1
+    '-1': Algo('prop1', 2**25, 64, 0, 64, 16, 9, True, 1, math.inf, math.inf, math.inf),
+    # prop2
+    '-2': Algo('prop2', 2**25, 64, 2, 64, 84, 9, True, 1, 1, 1.0, 98.0),
+    # prop3
+    '-3': Algo('Itsuku', 2**25, 64, 4, 64, 9, 9, True, 1, 1, 278.4, None),
+}
+
+HARDWARE = {
+    '-V100': Hardware('V100', 21.1 * G / tr, 1000.0 * G),
+    '-30': Hardware('30bn', 30.0 * G / tr, 1300.0 * G),
+    '-50': Hardware('50bn', 50.0 * G / tr, 2000.0 * G),
+    '-75': Hardware('75bn', 75.0 * G / tr, 2500.0 * G),
+    '-100': Hardware('100bn', 100.0 * G / tr, 3000.0 * G),
+}
+HARDWARE['-21.1'] = HARDWARE['-V100']
 
 def unit(v):
     if v is None:
@@ -74,156 +76,204 @@ def unit(v):
     else:
         return "%.2f" % v
 
+# (average) search state size
+# 11 for N, 1 for L, hash size S
+def state_size(a):
+    return (12 + a.S) * (((a.L + 1) // 2) if a.bs else 1)
+
+# number of core for a fully pipelined PoW solver
+def cores(a):
+    return 1 + a.cX * a.L + (((a.L + 1) // 2) if a.bs else 0)
+
+def _record(a, h, model, imp, C, Ndie, Nbw, N, **extra):
+    return dict(algo=a.name, hw=h.name, model=model, imp=imp, C=C,
+                Ndie=Ndie, Nbw=Nbw, N=N, throughput=N * h.F, **extra)
+
 ##
 ## Direct method
 ##
 
-# number of core for a fully pipelined PoW solver
-C0 = 1 + cX * L + (((L + 1) // 2) if bs else 0)
-Ca = C0 * Ha + theta * L * SS * Ma
-
-# maximum number of solvers on die
-Ndie = Ga / Ca
-# maximum number of pipelined PoW solvers for the bandwidth
-# print("Bw=%s x=%s L=%s F=%s" % (Bw, x, L, F))
-Nbw = Bw / (x * L * F)
-
-assert Nbw < Ndie, "bandwidth limited"
-
-if array_size * Ma < Ga:
-    # array in SRAM, threads not nedded
-    imp = 'Array in SRAM'
-    N = (Ga - array_size * Ma) / (C0 * Ha)
-    Nbw, hit = None, None
-else: # array in DRAM + on die cache
-    # find fix point
-    imp = 'Array in DRAM + cache'
-    hit = 1.0
-    new_hit = 0.0
-    while abs(hit - new_hit) > epsilon:
-        hit = new_hit
-        N = Bw / ((1.0 - new_hit) * x * L * F)
-        new_hit = (Ga - N * Ca) / (T * x * Ma)
-
-print("%s on %s (%s): C=%d Ndie=%s Nbw=%s N=%.2f throuput=%s (%.1fM)" %
-      (algo, hw, imp, C0, unit(Ndie), unit(Nbw), N, unit(N * F), N * F / M))
+def direct(a, h):
+    C0 = cores(a)
+    Ca = C0 * h.Ha + a.theta * a.L * state_size(a) * h.Ma
+    array_size = a.T * a.x
+
+    # maximum number of solvers on die
+    Ndie = h.Ga / Ca
+    # maximum number of pipelined PoW solvers for the bandwidth
+    Nbw = h.Bw / (a.x * a.L * h.F)
+
+    assert Nbw < Ndie, "bandwidth limited"
+
+    if array_size * h.Ma < h.Ga:
+        # array in SRAM, threads not nedded
+        imp = 'Array in SRAM'
+        N = (h.Ga - array_size * h.Ma) / (C0 * h.Ha)
+        Nbw, hit = None, None
+    else: # array in DRAM + on die cache
+        # find fix point
+        imp = 'Array in DRAM + cache'
+        hit = 1.0
+        new_hit = 0.0
+        while abs(hit - new_hit) > epsilon:
+            hit = new_hit
+            N = h.Bw / ((1.0 - new_hit) * a.x * a.L * h.F)
+            new_hit = (h.Ga - N * Ca) / (a.T * a.x * h.Ma)
+
+    return _record(a, h, 'direct', imp, C0, Ndie, Nbw, N, hit=hit)
 
 ##
 ## Half Array
 ##
 
-CR = C0 + cR * cF * L
-nloads = (n-1) * cR + 1
-CRa = CR * Ha + nloads * theta * L * SS * Ma
-
-#print("cR=%d nloads=%d" % (cR, nloads))
-
-NRdie = Ga / CRa
-# maximum number of pipelined PoW solvers for the bandwidth
-# print("Bw=%s x=%s L=%s F=%s" % (Bw, x, L, F))
-NRbw = Bw / (nloads * x * L * F)
-
-if 0.5 * array_size * Ma < Ga:
-    # half array in SRAM, threads not really nedded
-    imp = 'Half array in SRAM'
-    NR = (Ga - 0.5 * array_size * Ma) / (CR * Ha)
-    NRbw = None
-else: # array in DRAM + on die cache
-    # find fix point
-    imp = 'Half array in DRAM + cache'
-    hit = 1.0
-    new_hit = 0.0
-    while abs(hit - new_hit) > epsilon:
-        hit = new_hit
-        NR = Bw / ((1.0 - new_hit) * nloads * x * L * F)
-        new_hit = (Ga - NR * CRa) / (0.5 * array_size * Ma)
-
-print("%s on %s (%s): C=%.0f Ndie=%s Nbw=%s N=%.2f throuput=%s (%.1fM)" %
-      (algo, hw, imp,
-       CR, unit(NRdie), unit(NRbw), NR, unit(NR * F), NR * F / M))
+def half_array(a, h):
+    C0 = cores(a)
+    CR = C0 + a.cR * a.cF * a.L
+    nloads = (a.n-1) * a.cR + 1
+    CRa = CR * h.Ha + nloads * a.theta * a.L * state_size(a) * h.Ma
+    array_size = a.T * a.x
+
+    NRdie = h.Ga / CRa
+    # maximum number of pipelined PoW solvers for the bandwidth
+    NRbw = h.Bw / (nloads * a.x * a.L * h.F)
+
+    if 0.5 * array_size * h.Ma < h.Ga:
+        # half array in SRAM, threads not really nedded
+        imp = 'Half array in SRAM'
+        NR = (h.Ga - 0.5 * array_size * h.Ma) / (CR * h.Ha)
+        NRbw, hit = None, None
+    else: # array in DRAM + on die cache
+        # find fix point
+        imp = 'Half array in DRAM + cache'
+        hit = 1.0
+        new_hit = 0.0
+        while abs(hit - new_hit) > epsilon:
+            hit = new_hit
+            NR = h.Bw / ((1.0 - new_hit) * nloads * a.x * a.L * h.F)
+            new_hit = (h.Ga - NR * CRa) / (0.5 * array_size * h.Ma)
+
+    return _record(a, h, 'half_array', imp, CR, NRdie, NRbw, NR, hit=hit)
 
 ##
 ## Transposed Search
 ##
 
-imp = 'Transposed search in SRAM'
-
-#CT = C0
-#CTa = C0 * Ha # no threads
-#NTdie = Ga / CTa
-
-# number of parallel searches
-nps = Ga // ((SS + 4) * T * Ma)
-#print("nps=%d" % nps)
-if nps > 0:
-    # number of array elements transfered per second
-    nTbw = Bw / x
-    # number of needed cores to process the searches
-    nTx = nps * cX * nTbw / F
-    CT = ceil(nTx / (cX * L) * C0)
-    # check that there is room enough for the hash cores...
-    while CT * Ha + nps * (SS+4) * T * Ma > Ga:
-        print("decrementing number of parallel searches")
-        nps -= 1
-        nTx = nps * cX * nTbw / F
-        CT = ceil(nTx / (cX * L) * C0)
-    assert CT * Ha + nps * (SS+4) * T * Ma <= Ga
-    NTc = CT / C0
-else:
-    CT, NTc = 0, 0
-
-imp += " [nps=%d]" % nps
-print("%s on %s (%s): C=%.0f Ndie=%s Nbw=%s N=%.2f throuput=%s (%.1fM)" %
-      (algo, hw, imp,
-       CT, unit(None), unit(None), NTc, unit(NTc * F), NTc * F / M))
+def transposed_sram(a, h):
+    C0, SS = cores(a), state_size(a)
+    imp = 'Transposed search in SRAM'
+
+    # number of parallel searches
+    nps = h.Ga // ((SS + 4) * a.T * h.Ma)
+    decrements = 0
+    if nps > 0:
+        # number of array elements transfered per second
+        nTbw = h.Bw / a.x
+        # number of needed cores to process the searches
+        nTx = nps * a.cX * nTbw / h.F
+        CT = ceil(nTx / (a.cX * a.L) * C0)
+        # check that there is room enough for the hash cores...
+        while CT * h.Ha + nps * (SS+4) * a.T * h.Ma > h.Ga:
+            decrements += 1
+            nps -= 1
+            nTx = nps * a.cX * nTbw / h.F
+            CT = ceil(nTx / (a.cX * a.L) * C0)
+        assert CT * h.Ha + nps * (SS+4) * a.T * h.Ma <= h.Ga
+        NTc = CT / C0
+    else:
+        CT, NTc = 0, 0
 
+    imp += " [nps=%d]" % nps
+    return _record(a, h, 'transposed_sram', imp, CT, None, None, NTc,
+                   nps=nps, decrements=decrements)
 
 # alternatively, send many search states from DRAM...
 # which is assume large enough so that we can neglect the array elements
 # tranfers, which are amortized over a large number of searches
-imp = 'Transposed search in DRAM'
-
-# NOTE in & out (& in)
-# NOTE the external DRAM storage is much larger with bs!
-mu = 3 if bs else 2
-# number of searches for which states elements transfered per second
-nTbw = Bw / (mu * (SS + 4))
-# number of cores needed to process the corresponding searches
-nTx = cX * nTbw / F
-# total number of needed cores including other stuff (init)
-CT = ceil(nTx / (cX * L) * C0)
-# production per tick
-NTc = CT / C0
-# check that there is room enough for the hash cores...
-assert CT * Ha <= Ga, "large enough for needed cores"
-print("die usage is %.1f%%" % (100.0 * CT * Ha / Ga))
-
-print("%s on %s (%s): C=%.0f Ndie=%s Nbw=%s N=%.2f throuput=%s (%.1fM)" %
-      (algo, hw, imp,
-       CT, unit(None), unit(None), NTc, unit(NTc * F), NTc * F / M))
+def transposed_dram(a, h):
+    C0, SS = cores(a), state_size(a)
+    imp = 'Transposed search in DRAM'
+
+    # NOTE in & out (& in)
+    # NOTE the external DRAM storage is much larger with bs!
+    mu = 3 if a.bs else 2
+    # number of searches for which states elements transfered per second
+    nTbw = h.Bw / (mu * (SS + 4))
+    # number of cores needed to process the corresponding searches
+    nTx = a.cX * nTbw / h.F
+    # total number of needed cores including other stuff (init)
+    CT = ceil(nTx / (a.cX * a.L) * C0)
+    # production per tick
+    NTc = CT / C0
+    # check that there is room enough for the hash cores...
+    assert CT * h.Ha <= h.Ga, "large enough for needed cores"
+    return _record(a, h, 'transposed_dram', imp, CT, None, None, NTc,
+                   usage=CT * h.Ha / h.Ga)
 
 ##
 ## Dinur-Nadler Attack
 ##
 
-imp = "Dinur-Nadler attack [cDN=%s]" % cDN
+def dinur_nadler(a, h):
+    imp = "Dinur-Nadler attack [cDN=%s]" % a.cDN
 
-if cDN is not None:
-    CDN = cDN * C0
-    NDN = Ga / (CDN * Ha)
-else:
-    CDN, NDN = None, 0.0
+    if a.cDN is not None:
+        CDN = a.cDN * cores(a)
+        NDN = h.Ga / (CDN * h.Ha)
+    else:
+        CDN, NDN = None, 0.0
 
-print("%s on %s (%s): C=%.0f Ndie=%s Nbw=%s N=%.2f throuput=%s (%.1fM)" %
-      (algo, hw, imp,
-       CDN if CDN is not None else 0,
-       unit(NDN), unit(None), NDN, unit(NDN * F), NDN * F / M))
+    return _record(a, h, 'dinur_nadler', imp, CDN, NDN, None, NDN)
 
 ##
 ## pseudo random array attack, if applies
 ##
-imp = "PRA attack"
-CRA = C0 + cF * L
-NRA = Ga / ( CRA * Ha)
-print("%s on %s (%s): C=%0.f Ndie=%s throuput=%s (%.1fM)"
-      % (algo, hw, imp, CRA, unit(NRA), unit(NRA * F), NRA * F / M))
+
+def pra(a, h):
+    imp = "PRA attack"
+    CRA = cores(a) + a.cF * a.L
+    NRA = h.Ga / ( CRA * h.Ha)
+    return _record(a, h, 'pra', imp, CRA, NRA, None, NRA)
+
+MODELS = [direct, half_array, transposed_sram, transposed_dram, dinur_nadler, pra]
+
+# all models for all combinations of algorithms and hardware
+def evaluate(algos, hws, models=MODELS):
+    return [ m(a, h) for a, h in product(algos, hws) for m in models ]
+
+# script output for one record
+def show(r):
+    line = "%s on %s (%s): C=%.0f Ndie=%s Nbw=%s N=%.2f throuput=%s (%.1fM)"
+    C = r['C'] if r['C'] is not None else 0
+    if r['model'] == 'direct':
+        line = line.replace('C=%.0f', 'C=%d')
+    elif r['model'] == 'transposed_sram':
+        for i in range(r['decrements']):
+            print("decrementing number of parallel searches")
+    elif r['model'] == 'transposed_dram':
+        print("die usage is %.1f%%" % (100.0 * r['usage']))
+    elif r['model'] == 'pra':
+        print("%s on %s (%s): C=%0.f Ndie=%s throuput=%s (%.1fM)"
+              % (r['algo'], r['hw'], r['imp'], C, unit(r['Ndie']),
+                 unit(r['throughput']), r['throughput'] / M))
+        return
+    print(line % (r['algo'], r['hw'], r['imp'], C, unit(r['Ndie']),
+                  unit(r['Nbw']), r['N'], unit(r['throughput']),
+                  r['throughput'] / M))
+
+def main(argv):
+    algos, hws = [], []
+    for a in argv:
+        if a in ALGOS:
+            algos.append(ALGOS[a])
+        elif a in HARDWARE:
+            hws.append(HARDWARE[a])
+        else:
+            raise Exception("not implemented yet: %s" % a)
+    for a, h in product(algos, hws):
+        print("S=%d SS=%d" % (a.S, state_size(a)))
+        for r in evaluate([a], [h]):
+            show(r)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
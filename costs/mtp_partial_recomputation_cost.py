@@ -15,6 +15,12 @@
 #   intermediate results, so all deps must be recomputed if required
 #   for distinct array elements on the same recomputation of an element.
 #
+# The dependency table of each trial is built at once (with NumPy if
+# available), costs are then computed iteratively in index order, as all
+# dependencies of i are below i, and trials run on a process pool.
+# Trial k uses seed+k if a seed is given, so that results are reproducible,
+# and the same as the previous recursive implementation for the same seed.
+#
 # NOTE
 #   for very small p and many segments, the memory for one segment could
 #   be allocated and the intermediate values kept, so that the recomputation
@@ -31,9 +37,10 @@ p, t, n, N, c_F, tmp, bias = 21, 2, 2, 1, 11, False, 2
 store = 'alt'
 debug = False
 seed = None
+jobs = None # number of processes for N > 1, default is all cpus
 
 import re
-is_direct_eval = re.compile('\w+=([-+]?\d|true|false|none)', re.I).match
+is_direct_eval = re.compile(r'\w+=([-+]?\d|true|false|none)', re.I).match
 
 # handle command line options
 import sys
@@ -57,45 +64,11 @@ for a in sys.argv[1:]:
     else: # put quotes on a string
         exec(re.sub("=(.*)",r"='\1'", a))
 
-# cleanup phi & cost caches
-def reset_cache():
-    global phi_x, cost_F
-    phi_x = [-1 for i in range(0, T)]
-    phi_x[0:n] = [None] * n
-    cost_F = [-1 for i in range(0, T)]
-    for i in range(n):
-        cost_F[i] = 0
-    # precompute phis for determinism
-    for i in range(n, T):
-        phis(i, n)
-
-# possibly biased phi random function implementation
-import random
-if seed is not None:
-    assert N == 1, "only one run with a seed"
-    random.seed(seed)
-
-# biased random generator
-def phi(i, bias=bias):
-    assert 0 <= i < T
-    if phi_x[i] == -1:
-        # get a possibly biased number in [0,1)
-        u = random.random()
-        if bias == 2:
-            r = 1.0 - u * u
-        elif bias == 1:
-            r = 1.0 - u
-        elif bias == 3:
-            r = 1.0 - u * u * u
-        else: # handle any power...
-            r = 1.0 - pow(u, bias)
-        # compute corresponding index
-        phi_x[i] = int((i - 1) * r)
-        assert 0 <= phi_x[i] and phi_x[i] <= i - 1
-        # (2 if bias == 2 else 1)
-    return phi_x[i]
+# options are parsed again when the pool processes import this module,
+# so T is set there as well
+T = 2 ** p
 
-# \phi_k functions for k \in [0, 11]
+# \phi_k functions for k \in [0, 11], on arrays of i and phi(i)
 PHI_K = [
     lambda i, pi, n: i-1,
     lambda i, pi, n: pi,
@@ -111,12 +84,56 @@ PHI_K = [
 #    lambda i, pi, n: (i - 1) // 4,
 ]
 
-# return a set of needed elements, up to n
-def phis(i, n, bias=bias):
-    assert 1 <= n and n <= len(PHI_K)
-    phi_i = phi(i, bias) if n >= 2 else None
-    return [ phi(i, phi_i, n) for phi in PHI_K[:n] ]
+assert 1 <= n and n <= len(PHI_K)
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# possibly biased phi random function, for all i in [n, T)
+# one random draw per element, in index order, if n >= 2
+def phi_table(T, n, bias, rnd):
+    if n < 2:
+        return None
+    u = [ rnd() for i in range(n, T) ]
+    if np is not None:
+        u = np.array(u, dtype=np.float64)
+        i = np.arange(n, T, dtype=np.int64)
+    else:
+        i = range(n, T)
+    # get a possibly biased number in [0,1)
+    if bias == 2:
+        r = [ 1.0 - v * v for v in u ] if np is None else 1.0 - u * u
+    elif bias == 1:
+        r = [ 1.0 - v for v in u ] if np is None else 1.0 - u
+    elif bias == 3:
+        r = [ 1.0 - v * v * v for v in u ] if np is None else 1.0 - u * u * u
+    else: # handle any power...
+        r = [ 1.0 - pow(v, bias) for v in u ] if np is None else \
+            1.0 - np.array([ pow(v, bias) for v in u ])
+    # compute corresponding index
+    if np is not None:
+        phi = ((i - 1) * r).astype(np.int64)
+        assert (0 <= phi).all() and (phi <= i - 1).all()
+        return phi
+    phi = [ int((j - 1) * v) for j, v in zip(i, r) ]
+    assert all(0 <= f <= j - 1 for j, f in zip(i, phi))
+    return phi
+
+# dependencies of i in [n, T), as n columns indexed by i-n
+def deps_table(T, n, bias, rnd):
+    pi = phi_table(T, n, bias, rnd)
+    if np is not None:
+        i = np.arange(n, T, dtype=np.int64)
+        return [ np.broadcast_to(phi(i, pi, n), i.shape).tolist()
+                 for phi in PHI_K[:n] ]
+    i = range(n, T)
+    if pi is None:
+        pi = [None] * len(i)
+    return [ [ phi(j, f, n) for j, f in zip(i, pi) ] for phi in PHI_K[:n] ]
+
+# availability of X[i]
 def isStored(i, store):
     assert 0 <= i < T
     if store == 'alt':
@@ -140,135 +157,124 @@ def isStored(i, store):
         return \
             (t > 0 and i * t <= (t-1) * T) or \
             (t < 0 and i * -t >= T)
-    elif store == 'oq':
-        raise Exception("store='oq' not implemented yet")
     elif store == 'eq':
         raise Exception("store='eq' not implemented yet")
     else:
         raise Exception("invalid store=%s" % store)
 
+# X[i] is kept in memory, first n elements are always recomputed for free
+def stored_table(T, n, store):
+    return [ i < n or isStored(i, store) for i in range(T) ]
 
-# cost in F calls of accessing X[i] (no temporary memory version)
-def costFnt(i, store):
-    #if debug:
-    #    print("costFnt(%d) %s" % (i, phis(i, n)))
-    assert 0 <= i < T
-    # we need to evaluate
-    if cost_F[i] == -1:
-        if isStored(i, store):
-            cost_F[i] = 0
-        else:
-            # first call, record computed items to avoid them
-            # recursive evaluation
-            cost_F[i] = 1 + sum(costFnt(j, store) for j in phis(i, n))
-            # not available, recompute
-            assert cost_F[i] != -1, "some cost"
-    return cost_F[i]
+# cost in F calls of accessing X[i], for all i (no temporary memory version)
+# cost_F[i] = 1 + sum of the costs of its dependencies, which are all below i
+def costs_nt(T, n, deps, stored):
+    cost_F = [0] * T
+    for i, ds in enumerate(zip(*deps), n):
+        if not stored[i]:
+            cost_F[i] = 1 + sum(cost_F[j] for j in ds)
+    return cost_F
 
-# recursive evaluation in F calls for computing X[i] with temporary memory
-def costFt(i, store, done=None):
-    start = False
-    if done is None:
-        start = True
-        # already computed, use memoized value
-        if cost_F[i] >= 0:
-            return cost_F[i]
-        # else compute recursively
-        import numpy as np
-        done = np.zeros(i+1, dtype=np.bool)
-        # VERY INEFFICIENT: [ False for x in range(i+1) ]
-    if done[i]: # déjà vu
-        if debug:
-            print("# already computed: %d" % i)
-        return 0
-    if cost_F[i] == -1 and isStored(i, store):
-        cost_F[i] = 0
-    if cost_F[i] == 0:
-        return 0
-    else:
-        #print("cost_F[%d] = %d" % (i, cost_F[i]))
-        assert not done[i]
-        done[i] = True
-        cost = 1 + sum(costFt(j, store, done) for j in phis(i, n))
+# cost in F calls of accessing X[i] with temporary memory, for all i:
+# number of distinct elements to recompute in the dependency closure of i,
+# where stored elements stop the recursion
+def costs_t(T, n, deps, stored):
+    cost_F = [0] * T
+    rows = list(zip(*deps))
+    # done[j] == i if X[j] was already recomputed for X[i]
+    done = [-1] * T
+    for i in range(n, T):
+        if stored[i]:
+            continue
+        done[i] = i
+        todo, cost = [i], 0
+        while todo:
+            j = todo.pop()
+            cost += 1
+            for k in rows[j - n]:
+                if not stored[k] and done[k] != i:
+                    done[k] = i
+                    todo.append(k)
+        cost_F[i] = cost
         if debug:
-            print("cost(%d) = %d %s (%s)" %
-                  (i, cost, phis(i, n),
-                   ''.join('*' if done[j] else '.' for j in range(len(done)))))
-        if start:
-            cost_F[i] = cost
-        return cost
-
-# cost in F calls of accessing X[i]
-def costF(i, store, tmp):
-    if tmp: # with tmp space
-        return costFt(i, store)
-    else: # without tmp space
-        return costFnt(i, store)
+            print("cost(%d) = %d %s" % (i, cost, list(rows[i - n])))
+    return cost_F
 
 # cost in X accesses of accessing X[i]
-def costX(i):
+def costX(i, cost_F):
     if t > 0 and i % t == 0 or i < 2: # available
         return 1
     elif t < 0 and i % -t != 0 or i < 2: # available
         return 1
     else: # recompute... hmmm, significant collisions?
-        return n * costF(i, store, tmp)
+        return n * cost_F[i]
 
-# total cost accumulated over all cells
-def totals(T):
-    reset_cache()
-    totF, totX = 0, 0
-    for i in range(n, T):
-        if debug:
-            print("* computing i=%d" % i)
-        totF += costF(i, store, tmp)
-        totX += costX(i)
-    return (totF, totX)
+# total cost accumulated over all cells, for one trial seed
+def totals(trial_seed):
+    import random
+    rnd = random.Random(trial_seed).random
+    deps = deps_table(T, n, bias, rnd)
+    stored = stored_table(T, n, store)
+    cost_F = (costs_t if tmp else costs_nt)(T, n, deps, stored)
+    totF = sum(cost_F[n:])
+    totX = sum(costX(i, cost_F) for i in range(n, T))
+    return (totF, totX, cost_F if debug else None)
 
 #
 # COMPUTE AVERAGE COSTS
 #
 
-T = 2 ** p
+def main():
+    print("p=%d t=%d n=%d N=%d store=%s tmp=%s bias=%d seed=%s" %
+          (p, t, n, N, store, tmp, bias, seed))
+
+    # deterministic per trial seeds
+    if seed is None:
+        import os
+        base = int.from_bytes(os.urandom(8), 'big')
+    else:
+        base = seed
+    seeds = [ base + k for k in range(N) ]
 
-print("p=%d t=%d n=%d N=%d store=%s tmp=%s bias=%d seed=%s" %
-      (p, t, n, N, store, tmp, bias, seed))
+    if N == 1:
+        (totF, totX, cost_F) = totals(seeds[0])
+    else:
+        print("computing: ", file=sys.stderr, end='', flush=True)
+        assert N > 1
+        totF, totX = 0.0, 0.0
+        from multiprocessing import Pool
+        with Pool(jobs) as pool:
+            for (tF, tX, cost_F) in pool.imap(totals, seeds):
+                totF += tF
+                totX += tX
+                print("*", file=sys.stderr, end='', flush=True)
+        totF /= N
+        totX /= N
+        print("", file=sys.stderr)
 
-if N == 1:
-    (totF, totX) = totals(T)
-else:
-    print("computing: ", file=sys.stderr, end='', flush=True)
-    assert N > 1
-    totF, totX = 0.0, 0.0
-    for i in range(N):
-        (tF, tX) = totals(T)
-        totF += tF
-        totX += tX
-        print("*", file=sys.stderr, end='', flush=True)
-    totF /= N
-    totX /= N
-    print("", file=sys.stderr)
+    # compute saving ratio alpha
+    alpha = ((t-1.0) / t) if t > 0 else (1.0 / -t)
+    # but at least n to recompute a value!
+    if alpha == 1.0:
+        alpha = 1.0 - n / T
 
-# compute saving ratio alpha
-alpha = ((t-1.0) / t) if t > 0 else (1.0 / -t)
-# but at least n to recompute a value!
-if alpha == 1.0:
-    alpha = 1.0 - n / T
+    # show parameters and result
+    print("p=%d (T=2^p=%d) t=%s (α=%.3f) n=%d N=%d c_F=%d store=%s tmp=%s bias=%d seed=%s" %
+          (p, T, t, alpha, n, N, c_F, store, tmp, bias, seed))
 
-# show parameters and result
-print("p=%d (T=2^p=%d) t=%s (α=%.3f) n=%d N=%d c_F=%d store=%s tmp=%s bias=%d seed=%s" %
-      (p, T, t, alpha, n, N, c_F, store, tmp, bias, seed))
+    if N > 1:
+        print("average over %d" % N)
 
-if N > 1:
-    print("average over %d" % N)
+    try:
+        print("F calls per cell: %f%s" % ((totF / T), " ?" if totF >= T*T else ""))
+        print("cost multiplier: %f" % (c_F * totF / T))
+        print("X accesses per cell: %f" % (totX / T))
+    except OverflowError:
+        print("F calls per cell: ~ 10^%d" % (len(str(totF)) - len(str(T)) - 1))
+        print("X accesses per cell: ~ 10^%d" % (len(str(totX)) - len(str(T)) - 1))
 
-try:
-    print("F calls per cell: %f%s" % ((totF / T), " ?" if totF >= T*T else ""))
-    print("cost multiplier: %f" % (c_F * totF / T))
-    print("X accesses per cell: %f" % (totX / T))
-except OverflowError:
-    print("F calls per cell: ~ 10^%d" % (len(str(totF)) - len(str(T)) - 1))
-    print("X accesses per cell: ~ 10^%d" % (len(str(totX)) - len(str(T)) - 1))
+    if (debug and N == 1):
+        print("F = %s" % cost_F)
 
-if (debug):
-    print("F = %s" % cost_F)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+# itsuku command line tool
+#
+#   itsuku.py solve [params] [--I hex] [--count K] [--index V]
+#     print K proofs as JSON lines { "I": hex, "proof": { "N", "L", "Z" } }
+#   itsuku.py verify [params] [--jobs J] [file]
+#     read such JSON lines from file or stdin, verify them on J processes
+#     with at most 2*J in flight, and print one verdict per line in input
+#     order: { "line": k, "ok": bool, "reason": ProofError reason, "Omega" }
+#     a line may override the params with its own "T", "l", ... "F" keys.
+#     the exit code is 0 only if all proofs are valid.
+#   itsuku.py shares [params] [--I hex] [--share hex]... [--count K]
+#     search K nonces (forever by default) and print a JSON line
+#     { "N", "Omega", "met": [hex], "proof" } for every Omega under d or a
+#     --share threshold, stopping after the first one under d
+#   itsuku.py bench [params] [--count K]
+#     solve and verify K times and print stats as json
+#   itsuku.py estimate [params]
+#     print the memory, proof size and H calls estimates as json
+#
+# solve refuses impossible jobs up front, or jobs over --memory bytes or
+# --hashes expected H calls, see estimate.check.
+# params: --T --l --n --x --M --L --S --d (hex) --F, as for solvePoW.
+# Only the JSON proof format of exportPoW exists, there is no binary one.
+
+import sys
+import os
+import json
+from collections import deque
+
+from itsuku import solvePoW, checkPoW, ProofError, F_METHODS, INDEX_VERSIONS
+import estimate
+
+PARAMS = ['T', 'l', 'n', 'x', 'M', 'L', 'S', 'd', 'F']
+
+# the parameters of solvePoW, as options of an argparse parser
+def add_params(p):
+    p.add_argument('--T', type=int, default=2**12, help='length of X')
+    p.add_argument('--l', type=int, default=2**10, help='segment length')
+    p.add_argument('--n', type=int, default=4, help='number of dependencies')
+    p.add_argument('--x', type=int, default=64, help='size of X elements')
+    p.add_argument('--M', type=int, default=64, help='size of Merkle nodes')
+    p.add_argument('--L', type=int, default=9, help='length of one search')
+    p.add_argument('--S', type=int, default=64, help='size of Omega')
+    p.add_argument('--d', default=None,
+                   help='difficulty in hex, default 00ff...ff')
+    p.add_argument('--F', default='H', choices=F_METHODS,
+                   help='compression function building X')
+
+def _parser():
+    import argparse
+    ap = argparse.ArgumentParser(prog='itsuku')
+    sub = ap.add_subparsers(dest='command', required=True)
+    cmds = {}
+    for name in ['solve', 'verify', 'shares', 'bench', 'estimate']:
+        cmds[name] = sub.add_parser(name)
+        add_params(cmds[name])
+    cmds['solve'].add_argument('--I', default=None, help='challenge in hex')
+    cmds['solve'].add_argument('--count', type=int, default=1)
+    cmds['solve'].add_argument('--memory', type=int, default=None,
+                               help='memory budget in bytes')
+    cmds['solve'].add_argument('--hashes', type=float, default=None,
+                               help='budget of expected H calls')
+    cmds['solve'].add_argument('--index', type=int, default=0,
+                               choices=INDEX_VERSIONS,
+                               help='version of the X index derivation')
+    cmds['verify'].add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    cmds['verify'].add_argument('file', nargs='?', default='-')
+    cmds['shares'].add_argument('--I', default=None, help='challenge in hex')
+    cmds['shares'].add_argument('--share', action='append', default=[],
+                                help='share threshold in hex')
+    cmds['shares'].add_argument('--count', type=int, default=None)
+    cmds['bench'].add_argument('--count', type=int, default=4)
+    return ap
+
+# { name: value } of the options added by add_params, d in hex (00ff...ff
+# by default)
+def params(args):
+    P = { k: getattr(args, k) for k in PARAMS }
+    if P['d'] is None:
+        P['d'] = '00' + 'ff' * (P['S'] - 1)
+    return P
+
+def _solve(I, P, stats=None, index=0):
+    proof, Omega, cnt = solvePoW(I, P['T'], P['l'], P['n'], P['M'], P['L'],
+                                 P['S'], P['x'], bytes.fromhex(P['d']),
+                                 stats=stats, F=P['F'], index=index)
+    return proof
+
+def _check(P, memory=None, hashes=None):
+    estimate.check(P['T'], P['l'], P['n'], P['x'], P['M'], P['L'], P['S'],
+                   bytes.fromhex(P['d']), memory, hashes)
+
+def solve(args, out):
+    P = params(args)
+    try:
+        _check(P, args.memory, args.hashes)
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return 2
+    for k in range(args.count):
+        I = bytes.fromhex(args.I) if args.I is not None else os.urandom(64)
+        proof = _solve(I, P, index=args.index)
+        out.write(json.dumps({ 'I': I.hex(), 'proof': json.loads(proof) }))
+        out.write('\n')
+        out.flush()
+    return 0
+
+# verdict for one input line, run in a worker
+def verify_line(job):
+    k, line, P = job
+    verdict = { 'line': k, 'ok': False, 'reason': None, 'Omega': None }
+    try:
+        data = json.loads(line)
+        P = dict(P, **{ p: data[p] for p in PARAMS if p in data })
+        I, d = bytes.fromhex(data['I']), bytes.fromhex(P['d'])
+        if P['F'] not in F_METHODS:
+            raise ValueError(P['F'])
+        proof = data['proof']
+        if type(proof) is not str:
+            # as produced by exportPoW, for the size limit
+            proof = json.dumps(proof)
+        ok, Omega = checkPoW(I, P['T'], P['l'], P['n'], P['M'], P['L'],
+                             P['S'], P['x'], d, proof, strict=True,
+                             F=P['F'])
+    except ProofError as e:
+        verdict['reason'] = e.reason
+        return verdict
+    except (ValueError, KeyError, TypeError, AttributeError):
+        verdict['reason'] = ProofError.MALFORMED
+        return verdict
+    verdict['ok'], verdict['Omega'] = ok, Omega.hex()
+    if not ok:
+        verdict['reason'] = 'difficulty'
+    return verdict
+
+# verdicts in input order, with at most window jobs in flight
+def verify_stream(lines, P, jobs=1, window=None):
+    jobs_iter = ( (k, line, P) for k, line in enumerate(lines, 1)
+                  if line.strip() )
+    if jobs <= 1:
+        yield from map(verify_line, jobs_iter)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    window = window or 2 * jobs
+    with ProcessPoolExecutor(jobs) as pool:
+        pending = deque()
+        for job in jobs_iter:
+            pending.append(pool.submit(verify_line, job))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def verify(args, out):
+    P = params(args)
+    src = sys.stdin if args.file == '-' else open(args.file)
+    failed = 0
+    try:
+        for verdict in verify_stream(src, P, args.jobs):
+            failed += not verdict['ok']
+            out.write(json.dumps(verdict))
+            out.write('\n')
+            out.flush()
+    finally:
+        if src is not sys.stdin:
+            src.close()
+    return 1 if failed else 0
+
+def shares(args, out):
+    from shares import search_shares
+    P = params(args)
+    I = bytes.fromhex(args.I) if args.I is not None else os.urandom(64)
+    d = bytes.fromhex(P['d'])
+    thresholds = [ bytes.fromhex(t) for t in args.share ] + [d]
+    for share in search_shares(I, P['T'], P['l'], P['n'], P['M'], P['L'],
+                               P['S'], P['x'], thresholds, P['F'],
+                               count=args.count, until=d):
+        out.write(json.dumps({ 'I': I.hex(), 'N': share.N.hex(),
+                               'Omega': share.Omega.hex(),
+                               'met': [ t.hex() for t in share.met ],
+                               'proof': json.loads(share.proof) }))
+        out.write('\n')
+        out.flush()
+    return 0
+
+def bench(args, out):
+    from stats import Stats
+    P = params(args)
+    solving, checking = Stats(), Stats()
+    for k in range(args.count):
+        I = os.urandom(64)
+        proof = _solve(I, P, stats=solving)
+        checkPoW(I, P['T'], P['l'], P['n'], P['M'], P['L'], P['S'], P['x'],
+                 bytes.fromhex(P['d']), proof, stats=checking, F=P['F'])
+    out.write(json.dumps({ 'params': P, 'count': args.count,
+                           'solve': solving.as_dict(),
+                           'verify': checking.as_dict() }, indent=1))
+    out.write('\n')
+    return 0
+
+# not named estimate, which is the module
+def cmd_estimate(args, out):
+    P = params(args)
+    e = estimate.estimate(P['T'], P['l'], P['n'], P['x'], P['M'], P['L'],
+                          P['S'], bytes.fromhex(P['d']))
+    out.write(json.dumps(dict(e._asdict(), params=P), indent=1))
+    out.write('\n')
+    return 0
+
+def main(argv, out=sys.stdout):
+    args = _parser().parse_args(argv)
+    return { 'solve': solve, 'verify': verify, 'shares': shares,
+             'bench': bench, 'estimate': cmd_estimate }[args.command](args, out)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
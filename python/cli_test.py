@@ -0,0 +1,83 @@
+import io
+import json
+from cli import main, verify_stream
+
+PARAMS = ['--T', '64', '--l', '32', '--x', '8', '--M', '8', '--L', '4', '--S', '8']
+P = dict(T=64, l=32, n=4, x=8, M=8, L=4, S=8, d='00' + 'ff' * 7, F='H')
+
+def test_solve_verify(tmp_path):
+    out = io.StringIO()
+    assert main(['solve'] + PARAMS + ['--count', '3'], out) == 0
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 3
+    path = tmp_path / 'proofs.jsonl'
+    path.write_text(out.getvalue())
+    out = io.StringIO()
+    assert main(['verify'] + PARAMS + ['--jobs', '1', str(path)], out) == 0
+    verdicts = [ json.loads(v) for v in out.getvalue().splitlines() ]
+    assert [ v['line'] for v in verdicts ] == [1, 2, 3]
+    assert all(v['ok'] for v in verdicts)
+    # fails with other parameters
+    out = io.StringIO()
+    assert main(['verify'] + PARAMS + ['--n', '3', '--jobs', '1', str(path)], out) == 1
+    out = io.StringIO()
+    assert main(['verify'] + PARAMS + ['--F', 'blake2b', '--jobs', '1', str(path)], out) == 1
+
+def test_verify_stream():
+    out = io.StringIO()
+    main(['solve'] + PARAMS + ['--count', '2'], out)
+    good = out.getvalue().splitlines()
+    bad = json.loads(good[0])
+    bad['proof']['N'] = '00'
+    # per line parameters
+    other = json.loads(good[1])
+    other['d'] = '00' * 8
+    lines = [good[0], 'not json', json.dumps(bad), '', good[1], json.dumps(other)]
+    for jobs in [1, 2]:
+        verdicts = list(verify_stream(lines, P, jobs, window=2))
+        # empty lines are skipped, the others are in input order
+        assert [ v['line'] for v in verdicts ] == [1, 2, 3, 5, 6]
+        assert [ v['ok'] for v in verdicts ] == [True, False, False, True, False]
+        assert verdicts[1]['reason'] == 'malformed'
+        assert verdicts[2]['reason'] is not None
+        assert verdicts[4]['reason'] == 'difficulty'
+
+def test_verify_bad_params():
+    out = io.StringIO()
+    main(['solve'] + PARAMS + ['--count', '1'], out)
+    good = out.getvalue().splitlines()[0]
+    bad = [ json.dumps(dict(json.loads(good), **p))
+            for p in [{ 'd': '00' }, { 'T': 48 }, { 'l': 7 }, { 'x': 100 }] ]
+    for jobs in [1, 2]:
+        verdicts = list(verify_stream(bad + [good], P, jobs))
+        assert [ v['reason'] for v in verdicts ] == ['bad-params'] * 4 + [None]
+        assert [ v['ok'] for v in verdicts ] == [False] * 4 + [True]
+
+def test_bench():
+    out = io.StringIO()
+    assert main(['bench'] + PARAMS + ['--count', '1'], out) == 0
+    res = json.loads(out.getvalue())
+    assert res['solve']['attempts'] >= 1 and res['verify']['attempts'] == 1
+
+def test_estimate():
+    out = io.StringIO()
+    assert main(['estimate'] + PARAMS, out) == 0
+    res = json.loads(out.getvalue())
+    assert res['build'] == 3*64 - 1 and res['memory'] > 0
+    # impossible jobs are refused up front
+    out = io.StringIO()
+    assert main(['solve'] + PARAMS + ['--memory', '1000'], out) == 2
+    assert main(['solve'] + PARAMS + ['--l', '48'], out) == 2
+    assert out.getvalue() == ''
+
+def test_shares():
+    out = io.StringIO()
+    share = '40' + 'ff' * 7
+    assert main(['shares'] + PARAMS + ['--d', '08' + 'ff' * 7,
+                                       '--share', share], out) == 0
+    lines = [ json.loads(s) for s in out.getvalue().splitlines() ]
+    assert lines[-1]['met'] == [share, '08' + 'ff' * 7]
+    assert all(s['met'] == [share] for s in lines[:-1])
+    # shares verify at their threshold
+    src = [ json.dumps(dict(s, d=share)) for s in lines ]
+    assert all(v['ok'] for v in verify_stream(src, P))
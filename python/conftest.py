@@ -0,0 +1,26 @@
+import os
+import shutil
+import pytest
+import itsuku
+import native
+
+# the accelerator compiled once per session in a temporary directory, so
+# that the tests do not leave a library in the source tree
+@pytest.fixture(scope='session')
+def native_library(tmp_path_factory):
+    if os.environ.get('ITSUKU_NATIVE', '1') == '0' or \
+       shutil.which(os.environ.get('CC', 'cc')) is None:
+        pytest.skip("native accelerator not available")
+    path = str(tmp_path_factory.mktemp('native') / '_itsuku_native.so')
+    native.build(path=path)
+    return path
+
+# the accelerator loaded for one test, the following ones run as before
+@pytest.fixture
+def lib(native_library):
+    previous, selected = native.lib, itsuku._phis_bulk_impl
+    itsuku._phis_bulk_impl = None
+    loaded = native.load(native_library)
+    assert loaded is not None
+    yield loaded
+    native.lib, itsuku._phis_bulk_impl = previous, selected
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+
+# distributed nonce search over TCP
+#
+# A Coordinator holds one challenge and hands out disjoint ranges of nonces,
+# 8 bytes big endian counters, to workers connected over TCP. Each worker
+# builds (or loads) X and its Merkle tree, announces its root Psi, which must
+# match the other workers' (or the expected one), then searches the ranges it
+# is given and reports its progress after each batch. The first proof found
+# is checked by the coordinator with checkPoW, then all workers are stopped.
+#
+# Ranges are sized from the rate of each worker so that one lasts about
+# period seconds. When a worker needs work, it first gets ranges given back
+# by lost or stalled workers, else it takes the second half of the range of
+# the worker which would take longest to finish it, if that is over two
+# periods, else a new range. A worker silent for stall seconds is shrunk to
+# where it got, and its remaining range given to the others.
+#
+# Messages are JSON lines:
+#   coordinator -> worker: { "op": "challenge", "I": hex, "T", .., "F" },
+#     { "op": "range", "start", "end" }, { "op": "shrink", "end" },
+#     { "op": "reject", "reason" }, { "op": "stop" }
+#   worker -> coordinator: { "op": "hello", "Psi": hex },
+#     { "op": "progress", "next", "count" }, { "op": "found", "proof" }
+#
+#   with Coordinator(I, T, l, n, M, L, S, x, d) as c:
+#       spawn(c.address, 4)   # or distributed.py worker host:port elsewhere
+#       proof, Omega, counter = c.solve()
+#
+# usage: distributed.py worker host:port [--batch K]
+#        distributed.py solve [params] [--port P] [--workers K] [--I hex]
+
+import sys
+import json
+import time
+import queue
+import socket
+import select
+import threading
+
+import itsuku
+from itsuku import build_X_MT, build_rL, build_rZ, exportPoW
+from search import search_batch
+
+# one JSON message per line over a socket
+class Connection:
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._buf = b''
+        # messages of post, sent in order by a writer thread
+        self._out = None
+
+    def send(self, msg):
+        self.sock.sendall(json.dumps(msg).encode() + b'\n')
+
+    # queue msg for sending without blocking, eg under a lock
+    def post(self, msg):
+        if self._out is None:
+            self._out = queue.SimpleQueue()
+            threading.Thread(target=self._write, daemon=True).start()
+        self._out.put(msg)
+
+    def _write(self):
+        try:
+            while True:
+                msg = self._out.get()
+                if msg is None:
+                    break
+                self.send(msg)
+        except OSError:
+            pass
+        self._close()
+
+    # next message, None if none within timeout seconds (None: wait)
+    # raise EOFError if the connection is closed
+    def recv(self, timeout=None):
+        while b'\n' not in self._buf:
+            if timeout is not None:
+                ready, _, _ = select.select([self.sock], [], [], timeout)
+                if not ready:
+                    return None
+            data = self.sock.recv(65536)
+            if not data:
+                raise EOFError("connection closed")
+            self._buf += data
+        line, self._buf = self._buf.split(b'\n', 1)
+        return json.loads(line)
+
+    # close once the posted messages are sent
+    def close(self):
+        if self._out is not None:
+            self._out.put(None)
+        else:
+            self._close()
+
+    def _close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+# state of a connected worker
+class _Worker:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.ready = False
+        self.start = self.next = self.end = 0
+        self.since = self.last = time.monotonic()
+        self.count = 0
+        # nonces per second, None until measured
+        self.rate = None
+
+    def remaining(self):
+        return max(0, self.end - self.next)
+
+class Coordinator:
+
+    # Psi: expected Merkle root, by default that of the first worker
+    # chunk: size of the first range of a worker
+    def __init__(self, I, T, l, n, M, L, S, x, d, F=itsuku.F,
+                 host='127.0.0.1', port=0, Psi=None, chunk=64, period=1.0,
+                 stall=10.0):
+        self.challenge = itsuku.challenge(I, T, l, n, M, L, S, x, d, F)
+        self.Psi = Psi
+        self.chunk, self.period, self.stall = chunk, period, stall
+        self._cursor = 0
+        # nonces reported by all workers, connected or not
+        self._count = 0
+        # ranges given back, searched first
+        self._pending = []
+        self._workers = []
+        self._result = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._found = threading.Condition(self._lock)
+        self._listener = socket.create_server((host, port))
+        self.address = self._listener.getsockname()[:2]
+        self._threads = [ threading.Thread(target=self._accept, daemon=True),
+                          threading.Thread(target=self._monitor, daemon=True) ]
+        for t in self._threads:
+            t.start()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, addr = self._listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(sock,),
+                             daemon=True).start()
+
+    def _serve(self, sock):
+        conn = Connection(sock)
+        w = _Worker(conn)
+        ch = self.challenge
+        try:
+            with self._lock:
+                if self._closed:
+                    return
+                self._workers.append(w)
+                # messages are posted, so that a slow worker does not block
+                # the others while the lock is held
+                conn.post({ 'op': 'challenge', 'I': ch.I.hex(), 'T': ch.T,
+                            'l': ch.l, 'n': ch.n, 'x': ch.x, 'M': ch.M,
+                            'L': ch.L, 'S': ch.S, 'd': ch.d.hex(), 'F': ch.F })
+            while True:
+                msg = conn.recv()
+                if msg['op'] == 'found':
+                    # checked outside of the lock
+                    ok, Omega = ch.check(msg['proof'])
+                    with self._lock:
+                        if ok and self._result is None:
+                            self._result = (msg['proof'], Omega)
+                            self._stop()
+                    continue
+                with self._lock:
+                    if not self._handle(w, msg):
+                        return
+        except (EOFError, OSError, ValueError, KeyError, TypeError):
+            pass
+        finally:
+            with self._lock:
+                if w in self._workers:
+                    self._workers.remove(w)
+                    if w.remaining() > 0 and self._result is None:
+                        self._pending.append((w.next, w.end))
+            conn.close()
+
+    # under the lock, False to drop the worker
+    def _handle(self, w, msg):
+        now = time.monotonic()
+        if msg['op'] == 'hello':
+            Psi = bytes.fromhex(msg['Psi'])
+            if self.Psi is None:
+                self.Psi = Psi
+            if Psi != self.Psi:
+                w.conn.post({ 'op': 'reject', 'reason': 'Psi mismatch' })
+                return False
+            w.ready = True
+            w.last = now
+            self._assign(w)
+        elif msg['op'] == 'progress' and w.ready:
+            count = int(msg['count'])
+            w.count += count
+            self._count += count
+            w.next = max(w.next, int(msg['next']))
+            w.last = now
+            elapsed = now - w.since
+            if elapsed > 0 and w.next > w.start:
+                w.rate = (w.next - w.start) / elapsed
+            if w.next >= w.end and self._result is None:
+                self._assign(w)
+        else:
+            return False
+        return True
+
+    # give a new range to w
+    def _assign(self, w):
+        if self._pending:
+            start, end = self._pending.pop(0)
+        else:
+            size = self.chunk if w.rate is None else \
+                max(1, int(w.rate * self.period))
+            slow = self._slowest(w)
+            if slow is not None:
+                start, end = (slow.next + slow.end) // 2, slow.end
+                self._shrink(slow, start)
+            else:
+                start, end = self._cursor, self._cursor + size
+                self._cursor = end
+        w.start = w.next = start
+        w.end = end
+        w.since = time.monotonic()
+        w.conn.post({ 'op': 'range', 'start': start, 'end': end })
+
+    # worker other than w which would take more than two periods to finish
+    def _slowest(self, w):
+        slowest, longest = None, 2 * self.period
+        for v in self._workers:
+            if v is w or not v.ready or v.rate is None or v.remaining() < 2:
+                continue
+            left = v.remaining() / v.rate
+            if left > longest:
+                slowest, longest = v, left
+        return slowest
+
+    def _shrink(self, w, end):
+        w.end = end
+        w.conn.post({ 'op': 'shrink', 'end': end })
+
+    # give back the ranges of stalled workers
+    def _monitor(self):
+        while True:
+            time.sleep(min(self.stall, self.period) / 2)
+            with self._lock:
+                if self._closed:
+                    return
+                now = time.monotonic()
+                for w in self._workers:
+                    if w.ready and w.remaining() > 0 and \
+                       now - w.last > self.stall:
+                        self._pending.append((w.next, w.end))
+                        self._shrink(w, w.next)
+
+    # under the lock
+    def _stop(self):
+        for w in self._workers:
+            w.conn.post({ 'op': 'stop' })
+        self._found.notify_all()
+
+    # number of connected workers which announced a matching Psi
+    def workers(self):
+        with self._lock:
+            return sum(w.ready for w in self._workers)
+
+    # wait for a proof, return (proof, Omega, counter) as solvePoW, where
+    # counter is the number of nonces the workers reported, including the
+    # batch of the proof
+    # raise TimeoutError if none within timeout seconds
+    def solve(self, timeout=None):
+        with self._found:
+            if not self._found.wait_for(lambda: self._result is not None,
+                                        timeout):
+                raise TimeoutError("no proof within %ss" % timeout)
+            proof, Omega = self._result
+            counter = self._count
+        return proof, Omega, counter
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._stop()
+            workers = list(self._workers)
+        self._listener.close()
+        for w in workers:
+            w.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+# build X and its Merkle tree for a challenge message
+def _build(I, T, l, n, M, L, S, x, d, F):
+    return build_X_MT(I, T, l, n, x, M, F=F)
+
+# run a worker until stopped, return the number of nonces searched
+# load(I, T, l, n, M, L, S, x, d, F) returns X and B, building them by default
+def work(host, port, batch=16, load=_build):
+    conn = Connection(socket.create_connection((host, port)))
+    counter = 0
+    try:
+        msg = conn.recv()
+        assert msg['op'] == 'challenge'
+        I, d = bytes.fromhex(msg['I']), bytes.fromhex(msg['d'])
+        T, l, n, M, L, S, x = (msg[p] for p in 'TlnMLSx')
+        X, B = load(I, T, l, n, M, L, S, x, d, msg['F'])
+        Psi = B[0]
+        conn.send({ 'op': 'hello', 'Psi': Psi.hex() })
+        start = end = 0
+        while True:
+            # wait for a range only when idle
+            msg = conn.recv(0 if start < end else None)
+            while msg is not None:
+                if msg['op'] == 'range':
+                    start, end = msg['start'], msg['end']
+                elif msg['op'] == 'shrink':
+                    end = min(end, msg['end'])
+                else:
+                    # stop or reject
+                    return counter
+                msg = conn.recv(0)
+            if start >= end:
+                continue
+            nonces = [ k.to_bytes(8, 'big')
+                       for k in range(start, min(end, start + batch)) ]
+            found = [ (N, i) for N, (Omega, i) in
+                      zip(nonces, search_batch(I, X, T, L, S, Psi, nonces))
+                      if Omega < d ]
+            start += len(nonces)
+            counter += len(nonces)
+            # the progress first, so that it is counted with the proof
+            conn.send({ 'op': 'progress', 'next': start,
+                        'count': len(nonces) })
+            for N, i in found:
+                rL = build_rL(i, X, l, n)
+                conn.send({ 'op': 'found', 'proof':
+                            exportPoW(N, rL, build_rZ(rL, B, T, l, n)) })
+    except (EOFError, OSError):
+        return counter
+    finally:
+        conn.close()
+
+# start count local worker processes
+# worker k loads X with layouts[k % len(layouts)].load if given, see
+# placement.Layout, eg one per NUMA node
+def spawn(address, count, batch=16, layouts=None):
+    import multiprocessing
+    procs = [ multiprocessing.Process(
+                  target=work, args=(address[0], address[1], batch) +
+                  ((layouts[k % len(layouts)].load,) if layouts else ()),
+                  daemon=True)
+              for k in range(count) ]
+    for p in procs:
+        p.start()
+    return procs
+
+def main(argv):
+    import os
+    import argparse
+    from cli import add_params, params
+    ap = argparse.ArgumentParser(prog='distributed')
+    sub = ap.add_subparsers(dest='command', required=True)
+    w = sub.add_parser('worker')
+    w.add_argument('address', help='host:port of the coordinator')
+    w.add_argument('--batch', type=int, default=16)
+    s = sub.add_parser('solve')
+    add_params(s)
+    s.add_argument('--I', default=None, help='challenge in hex')
+    s.add_argument('--host', default='127.0.0.1')
+    s.add_argument('--port', type=int, default=0)
+    s.add_argument('--workers', type=int, default=0,
+                   help='number of local worker processes')
+    args = ap.parse_args(argv)
+    if args.command == 'worker':
+        host, port = args.address.rsplit(':', 1)
+        work(host, int(port), args.batch)
+        return 0
+    P = params(args)
+    I = bytes.fromhex(args.I) if args.I is not None else os.urandom(64)
+    with Coordinator(I, P['T'], P['l'], P['n'], P['M'], P['L'], P['S'],
+                     P['x'], bytes.fromhex(P['d']), P['F'], args.host,
+                     args.port) as c:
+        print("listening on %s:%d" % tuple(c.address), file=sys.stderr)
+        procs = spawn(c.address, args.workers)
+        proof, Omega, counter = c.solve()
+    for p in procs:
+        p.join()
+    print(json.dumps({ 'I': I.hex(), 'proof': json.loads(proof),
+                       'counter': counter }))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
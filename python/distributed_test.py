@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import threading
+import distributed
+from distributed import Coordinator, Connection, work, spawn, _Worker
+from itsuku import checkPoW, build_X_MT
+import socket
+
+params = (2**8, 2**4, 4, 64, 9, 64, 64, b'\x00' + b'\xff' * 63)
+
+def thread_worker(c, **kwargs):
+    t = threading.Thread(target=work, args=c.address, kwargs=kwargs,
+                         daemon=True)
+    t.start()
+    return t
+
+def test_solve():
+    I = os.urandom(64)
+    with Coordinator(I, *params) as c:
+        procs = spawn(c.address, 2)
+        proof, Omega, counter = c.solve(timeout=60)
+    for p in procs:
+        p.join(10)
+        assert p.exitcode == 0
+    assert counter >= 1
+    assert checkPoW(I, *params, proof) == (True, Omega)
+
+def test_Psi_mismatch():
+    I = os.urandom(64)
+    T, l, n, M, L, S, x, d = params
+    def other(I, T, l, n, M, L, S, x, d, F):
+        return build_X_MT(os.urandom(64), T, l, n, x, M)
+    X, B = build_X_MT(I, T, l, n, x, M)
+    with Coordinator(I, *params, Psi=B[0]) as c:
+        bad = thread_worker(c, load=other)
+        bad.join(30)
+        assert not bad.is_alive()
+        assert c.workers() == 0
+        thread_worker(c)
+        proof, Omega, counter = c.solve(timeout=60)
+    assert checkPoW(I, *params, proof) == (True, Omega)
+
+def test_stall():
+    # a worker which takes a range and never reports
+    I = os.urandom(64)
+    T, l, n, M, L, S, x, d = params
+    # half of the nonces are solutions, so that there is one in [0, 1000)
+    d = b'\x80' + bytes(S - 1)
+    X, B = build_X_MT(I, T, l, n, x, M)
+    with Coordinator(I, T, l, n, M, L, S, x, d, chunk=1000, stall=0.2,
+                     period=0.1) as c:
+        conn = Connection(socket.create_connection(c.address))
+        assert conn.recv(10)['op'] == 'challenge'
+        conn.send({ 'op': 'hello', 'Psi': B[0].hex() })
+        assert conn.recv(10) == { 'op': 'range', 'start': 0, 'end': 1000 }
+        assert conn.recv(10) == { 'op': 'shrink', 'end': 0 }
+        thread_worker(c)
+        proof, Omega, counter = c.solve(timeout=60)
+        conn.close()
+    # the given back range was searched first
+    N = int(proof[proof.index('"N"'):].split('"')[3], 16)
+    assert N < 1000
+    assert checkPoW(I, T, l, n, M, L, S, x, d, proof) == (True, Omega)
+
+class Sent:
+    def __init__(self):
+        self.msgs = []
+    def post(self, msg):
+        self.msgs.append(msg)
+
+def test_rebalance():
+    c = Coordinator(os.urandom(64), *params, chunk=100, period=1.0)
+    try:
+        slow, fast = _Worker(Sent()), _Worker(Sent())
+        slow.ready = fast.ready = True
+        c._workers += [slow, fast]
+        c._assign(slow)
+        assert slow.conn.msgs == [{ 'op': 'range', 'start': 0, 'end': 100 }]
+        # first range of fast: slow has no rate yet
+        c._assign(fast)
+        assert fast.conn.msgs[-1] == { 'op': 'range', 'start': 100, 'end': 200 }
+        # 10 nonces/s, 90s left: its second half goes to fast
+        slow.next, slow.rate = 10, 10.0
+        fast.rate = 1000.0
+        c._assign(fast)
+        assert fast.conn.msgs[-1] == { 'op': 'range', 'start': 55, 'end': 100 }
+        assert slow.conn.msgs[-1] == { 'op': 'shrink', 'end': 55 }
+        # with 1s left, slow keeps its range
+        slow.end = 20
+        c._assign(fast)
+        assert fast.conn.msgs[-1] == { 'op': 'range', 'start': 200,
+                                       'end': 1200 }
+        # given back ranges first
+        c._pending.append((7, 9))
+        c._assign(fast)
+        assert fast.conn.msgs[-1] == { 'op': 'range', 'start': 7, 'end': 9 }
+    finally:
+        c._workers = []
+        c.close()
+
+def test_counter():
+    # the proof's batch is counted, even from a worker which then leaves
+    I = os.urandom(64)
+    T, l, n, M, L, S, x, d = params
+    with Coordinator(I, *params) as c:
+        t = thread_worker(c, batch=4)
+        proof, Omega, counter = c.solve(timeout=60)
+        t.join(30)
+    N = int(json.loads(proof)['N'], 16)
+    assert counter >= N + 1
+
+class Blocked:
+    # a socket whose sends wait for release
+    def __init__(self):
+        self.release = threading.Event()
+        self.sent = []
+    def sendall(self, data):
+        self.release.wait(30)
+        self.sent.append(data)
+    def close(self):
+        pass
+
+def test_slow_peer():
+    # messages to a peer which does not read are sent outside of the lock
+    c = Coordinator(os.urandom(64), *params, chunk=100)
+    try:
+        sock = Blocked()
+        w = _Worker(Connection(sock))
+        w.ready = True
+        with c._lock:
+            c._workers.append(w)
+            c._assign(w)
+            c._shrink(w, 50)
+            c._stop()
+        # the lock is free while the sends wait
+        assert c.workers() == 1
+        sock.release.set()
+        w.conn.close()
+        for k in range(100):
+            if len(sock.sent) == 3:
+                break
+            time.sleep(0.05)
+        assert [ json.loads(m) for m in sock.sent ] == \
+            [{ 'op': 'range', 'start': 0, 'end': 100 },
+             { 'op': 'shrink', 'end': 50 }, { 'op': 'stop' }]
+    finally:
+        c._workers = []
+        c.close()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# footprint and cost estimates for a parameter set (T, l, n, x, M, L, S, d)
+#
+# computed without running anything, for schedulers and the CLI to refuse
+# impossible jobs up front and for capacity planning:
+# - memory: bytes held by X and B as built by solvePoW (python lists of bytes)
+# - proof_size: expected length of the exportPoW proof, and an upper bound
+# - build, search, solve: expected number of H calls to solve
+# - verify: expected number of H calls to verify, and an upper bound
+#
+# Proof sizes and verification costs depend on how many antecedents and
+# Merkle nodes are shared, which is estimated with independent uniform
+# indexes; as antecedents are close to their element, actual values are
+# usually a little lower. See estimate_test.py for the cross-checks.
+
+import sys
+from collections import namedtuple
+
+import itsuku
+
+Estimate = namedtuple('Estimate', [
+    'memory',          # bytes of X and B
+    'proof_size',      # expected exportPoW length
+    'proof_size_max',  # upper bound, see itsuku.proof_size_limit
+    'attempts',        # expected number of nonces tried
+    'build',           # H calls to build X and B
+    'search',          # expected H calls of the search
+    'solve',           # build + search
+    'verify',          # expected H calls to verify a proof
+    'verify_max'       # upper bound, see itsuku.hash_limit
+])
+
+# bytes held by a list of k references, and by a bytes object of size k
+def _list(k):
+    return sys.getsizeof([]) + 8 * k
+
+def _bytes(k):
+    return sys.getsizeof(b'') + k
+
+# memory of X (T elements of x bytes) and B (2T-1 nodes of M bytes),
+# or only its top levels (see itsuku.PartialMT)
+def memory(T, x, M, levels=None):
+    nodes = 2*T - 1 if levels is None else min(2*T - 1, 2**levels - 1)
+    return _list(T) + T * _bytes(x) + _list(nodes) + nodes * _bytes(M)
+
+# memory of the top levels of the Merkle tree
+def mt_memory(T, M, levels):
+    nodes = min(2*T - 1, 2**levels - 1)
+    return _list(nodes) + nodes * _bytes(M)
+
+# most levels of the Merkle tree which fit in memory bytes, at least 1
+def mt_levels(T, M, memory):
+    levels = 1
+    while 2**levels - 1 < 2*T - 1 and mt_memory(T, M, levels + 1) <= memory:
+        levels += 1
+    return levels
+
+# memory of a solvePoW with these mt_memory and layout arguments: the top
+# levels of B within mt_memory, or X and B as flat buffers with a layout
+def footprint(T, x, M, mt_memory=None, layout=None):
+    if layout is not None:
+        return T * x + (2*T - 1) * M
+    if mt_memory is not None:
+        return memory(T, x, M, mt_levels(T, M, mt_memory))
+    return memory(T, x, M)
+
+# probability that Omega < d
+def success_probability(d):
+    return int.from_bytes(d, 'big') / 256 ** len(d)
+
+# expected number of distinct values among k uniform draws in [0, T)
+def _distinct(T, k):
+    return T * (1.0 - (1.0 - 1.0 / T) ** k)
+
+# expected (selected, provided, opening) counts of a proof
+def proof_counts(T, l, n, L):
+    selected = _distinct(T, L)
+    # elements built at step 1.b provide their n antecedents
+    indirect = selected * (l - n) / l
+    provided = _distinct(T, selected + indirect * n)
+    # a node is in the opening if its subtree has no provided leaf
+    # while its sibling subtree has some
+    opening, size = 0.0, T
+    while size > 1:
+        size //= 2
+        empty = (1.0 - size / T) ** provided
+        opening += (T // size) * empty * (1.0 - empty)
+    return selected, provided, opening
+
+# average number of decimal digits of integers in [0, k)
+def _digits(k):
+    total, low, d = 0, 0, 1
+    while low < k:
+        high = min(k, 10 ** d)
+        total += (high - low) * d
+        low, d = high, d + 1
+    return total / k
+
+# expected length of exportPoW(N, rL, rZ), with a nN bytes nonce
+def proof_size(T, l, n, x, M, L, nN=8):
+    selected, provided, opening = proof_counts(T, l, n, L)
+    indirect = selected * (l - n) / l
+    # {"N": "..", "L": {"i": ["..", ..], "i": [], ..}, "Z": {"j": "..", ..}}
+    skeleton = 28 + 2 * nN
+    entries = selected * (_digits(T) + 8) + indirect * (n * (2*x + 4) - 2)
+    nodes = opening * (_digits(2*T - 1) + 8 + 2*M)
+    return skeleton + entries + nodes
+
+# all estimates for a parameter set
+def estimate(T, l, n, x, M, L, S, d, nN=8):
+    p = success_probability(d)
+    attempts = 1.0 / p if p > 0 else float('inf')
+    # X elements, leaves, nodes
+    build = T + T + (T - 1)
+    # Y chain and Omega per attempt
+    search = attempts * (L + 2)
+    selected, provided, opening = proof_counts(T, l, n, L)
+    # as validatePoW: X elements, leaves, merges, Y and Omega
+    verify = selected + provided + (provided + opening - 1) + L + 2
+    return Estimate(memory(T, x, M), proof_size(T, l, n, x, M, L, nN),
+                    itsuku.proof_size_limit(T, L, n, x, M), attempts,
+                    build, search, build + search, verify,
+                    itsuku.hash_limit(T, L, n))
+
+# raise an itsuku.ParamError if the parameters cannot be solved, or not
+# within the given memory (bytes) and work (expected H calls) budgets
+# with solving=False, only check that the parameters are consistent
+def check(T, l, n, x, M, L, S, d, memory=None, hashes=None, solving=True):
+    errors = []
+    if T < 1 or T & (T-1) != 0:
+        errors.append("T=%d is not a power of 2" % T)
+    if l < 1 or T % l != 0:
+        errors.append("T=%d is not a multiple of l=%d" % (T, l))
+    if l > 2**32:
+        errors.append("l=%d over 2**32" % l)
+    if not 1 <= n <= min(l, len(itsuku.PHI_K)):
+        errors.append("n=%d not in [1, min(l, %d)]" % (n, len(itsuku.PHI_K)))
+    if not 4 <= x <= 64:
+        errors.append("x=%d not in [4, 64]" % x)
+    if not 1 <= M <= 64 or not 1 <= S <= 64:
+        errors.append("M=%d or S=%d not in [1, 64]" % (M, S))
+    if L < 1:
+        errors.append("L=%d < 1" % L)
+    if len(d) != S:
+        errors.append("d is %d bytes instead of S=%d" % (len(d), S))
+    if solving and success_probability(d) == 0:
+        errors.append("d=0 cannot be reached")
+    if not errors and (memory is not None or hashes is not None):
+        e = estimate(T, l, n, x, M, L, S, d)
+        if memory is not None and e.memory > memory:
+            errors.append("needs %d bytes, over the %d bytes budget" %
+                          (e.memory, memory))
+        if hashes is not None and e.solve > hashes:
+            errors.append("needs %.3g H calls, over the %.3g budget" %
+                          (e.solve, hashes))
+    if errors:
+        raise itsuku.ParamError("impossible job: " + ", ".join(errors))
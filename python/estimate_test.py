@@ -0,0 +1,75 @@
+import os
+import sys
+import pytest
+from itsuku import *
+from stats import Stats
+from estimate import *
+
+PARAMS = [(2**8, 2**6, 4, 16, 16, 9, 8), (2**10, 2**10, 3, 8, 8, 20, 8),
+          (2**9, 2**5, 6, 32, 16, 9, 8)]
+
+def test_memory():
+    for T, l, n, x, M, L, S in PARAMS:
+        X, B = build_X_MT(os.urandom(16), T, l, n, x, M)
+        assert memory(T, x, M) == sys.getsizeof(X) + sum(map(sys.getsizeof, X)) + \
+            sys.getsizeof(B) + sum(map(sys.getsizeof, B))
+
+def test_memory_levels():
+    for T, l, n, x, M, L, S in PARAMS:
+        X, B = build_X_MT(os.urandom(16), T, l, n, x, M, levels=4)
+        assert memory(T, x, M, levels=4) == sys.getsizeof(X) + \
+            sum(map(sys.getsizeof, X)) + sys.getsizeof(B.top) + \
+            sum(map(sys.getsizeof, B.top))
+        assert memory(T, x, M, levels=40) == memory(T, x, M)
+
+def test_footprint():
+    from placement import Layout
+    for T, l, n, x, M, L, S in PARAMS:
+        assert footprint(T, x, M) == memory(T, x, M)
+        levels = mt_levels(T, M, 2**10)
+        assert footprint(T, x, M, mt_memory=2**10) == \
+            memory(T, x, M, levels=levels)
+        X, B = Layout().build_X_MT(os.urandom(16), T, l, n, x, M)
+        assert footprint(T, x, M, layout=Layout()) == len(X.buf) + len(B.buf)
+
+def test_estimate():
+    for T, l, n, x, M, L, S in PARAMS:
+        d = b'\x40' + b'\xff' * (S-1)
+        e = estimate(T, l, n, x, M, L, S, d)
+        assert abs(e.attempts - 4) < 0.1
+        sizes, hashes = [], []
+        for k in range(10):
+            I = os.urandom(16)
+            stats = Stats()
+            pow, Omega, cnt = solvePoW(I, T, l, n, M, L, S, x, d, stats=stats)
+            # exact build cost
+            assert stats.total_hashes() - stats.hashes['Y'] == e.build
+            assert stats.hashes['Y'] == cnt * (L + 2)
+            stats = Stats()
+            assert checkPoW(I, T, l, n, M, L, S, x, d, pow, stats=stats)[0]
+            sizes.append(len(pow))
+            hashes.append(stats.total_hashes())
+        assert max(sizes) <= e.proof_size_max and max(hashes) <= e.verify_max
+        # antecedents are close to their elements, so that they share more
+        # Merkle nodes than independent indexes: slightly conservative
+        assert 0.6 * e.proof_size <= sum(sizes) / 10 <= 1.1 * e.proof_size
+        assert 0.6 * e.verify <= sum(hashes) / 10 <= 1.1 * e.verify
+
+def test_check():
+    T, l, n, x, M, L, S = PARAMS[0]
+    d = b'\x40' + b'\xff' * (S-1)
+    check(T, l, n, x, M, L, S, d)
+    check(T, l, n, x, M, L, S, d, memory=memory(T, x, M), hashes=2**20)
+    for bad in [dict(T=T+1), dict(l=3), dict(n=12), dict(x=3), dict(S=65),
+                dict(L=0), dict(d=b'\x00' * S), dict(d=b'\xff')]:
+        P = dict(dict(T=T, l=l, n=n, x=x, M=M, L=L, S=S, d=d), **bad)
+        with pytest.raises(Exception):
+            check(**P)
+    # indexes within a segment are 4 bytes
+    with pytest.raises(Exception):
+        check(2**33, 2**33, n, x, M, L, S, d)
+    check(2**33, 2**32, n, x, M, L, S, d)
+    with pytest.raises(Exception):
+        check(T, l, n, x, M, L, S, d, memory=memory(T, x, M) - 1)
+    with pytest.raises(Exception):
+        check(T, l, n, x, M, L, S, d, hashes=T)
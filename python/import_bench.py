@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+# cold start cost of the verifier
+#
+# time fresh interpreters importing a module, minus an empty interpreter,
+# and list which of the lazily loaded modules it pulled in.
+# without a bytecode cache (eg PYTHONDONTWRITEBYTECODE), the module is
+# compiled on each start, which is then most of its import time.
+#
+# usage: import_bench.py [module] [runs] [code]
+#   eg: import_bench.py itsuku 20 "itsuku.checkPoW"
+
+import sys
+import time
+import subprocess
+
+# loaded on first use by itsuku
+LAZY = ['json', 'collections', 'contextlib', 'sortedcontainers', 'opening',
+        'native', 'ctypes', 'search', 'stats']
+
+def cold_start(code, runs):
+    times = []
+    for r in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+def loaded(module):
+    code = "import sys, %s; print(' '.join(sorted(sys.modules)))" % module
+    out = subprocess.run([sys.executable, '-c', code], check=True,
+                         capture_output=True, text=True).stdout.split()
+    return [ m for m in LAZY if m in out ]
+
+def main(argv):
+    module = argv[0] if len(argv) > 0 else 'itsuku'
+    runs = int(argv[1]) if len(argv) > 1 else 20
+    code = "import %s" % module + ("; %s" % argv[2] if len(argv) > 2 else "")
+    base = cold_start("pass", runs)
+    start = cold_start(code, runs)
+    print("python startup: %.1f ms" % (1000 * base))
+    print("%s: +%.1f ms (median of %d)" % (code, 1000 * (start - base), runs))
+    print("lazy modules loaded: %s" % (' '.join(loaded(module)) or 'none'))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
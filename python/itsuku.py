@@ -1,16 +1,87 @@
 #!/usr/bin/env python3
 
+# verification core: importing this module does no work and only loads
+# cheap standard modules, json, opening and the native accelerator are
+# imported on first use (see import_bench.py)
 import sys
 import os
 import struct
-import json
-from hashlib import sha512
+from hashlib import sha512, blake2b
 from math import floor, ceil, log
-from opening import openingForOneArray as opening
-from collections import OrderedDict
+from heapq import heappush, heappop
+from contextvars import ContextVar
 # TODO : consider adding typing (import typing)
 
 HASH = 'sha512' # hash function
+F = 'H' # compression function building X, see F_METHODS
+
+# active instrumentation collector (see stats.py) of the current thread or
+# task, None when disabled
+_STATS = ContextVar('itsuku_stats', default=None)
+
+def active_stats():
+    return _STATS.get()
+
+# activate a Stats collector for the enclosed computations of this thread
+# (not contextlib, which is slow to import)
+# counts go to a private collector, merged into stats on exit, so that
+# threads sharing stats do not race on its counters
+class instrument:
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __enter__(self):
+        self.local = None if self.stats is None else type(self.stats)()
+        self.token = _STATS.set(self.local)
+        return self.stats
+
+    def __exit__(self, *exc):
+        _STATS.reset(self.token)
+        if self.local is not None:
+            self.stats.merge(self.local)
+        return False
+
+class _NoStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_STAGE = _NoStage()
+
+# time a stage if instrumentation is enabled
+def _stage(name):
+    stats = _STATS.get()
+    return stats.stage(name) if stats is not None else _NO_STAGE
+
+# rejection of a proof by the verifier, with a reason code
+# (data consistency errors must not rely on assert, which vanish under -O)
+class ProofError(Exception):
+    MALFORMED = 'malformed'       # cannot be parsed as a proof
+    TOO_LARGE = 'too-large'       # above the proof size limit
+    BAD_NONCE = 'bad-nonce'       # nonce too long
+    BAD_COUNT = 'bad-count'       # no or more than L selected elements
+    BAD_INDEX = 'bad-index'       # element or node index out of range
+    BAD_ANTECEDENTS = 'bad-antecedents' # wrong number of antecedents
+    BAD_SIZE = 'bad-size'         # element or node of the wrong length
+    BAD_OPENING = 'bad-opening'   # Merkle nodes are not the expected opening
+    OVER_BUDGET = 'over-budget'   # verification needs too many hashes
+    INCONSISTENT = 'inconsistent' # provided values contradict each other
+    BAD_VERSION = 'bad-version'   # unknown or unexpected index derivation
+
+    BAD_PARAMS = 'bad-params'     # the challenge parameters are invalid
+
+    def __init__(self, reason, detail=None):
+        Exception.__init__(self, reason if detail is None else
+                           "%s: %s" % (reason, detail))
+        self.reason = reason
+
+# invalid or impossible parameter set (see estimate.check)
+class ParamError(ValueError):
+    pass
 
 # compute the Argon2 phi function
 def phi(seed, i, byte_order='big'):
@@ -20,8 +91,9 @@ def phi(seed, i, byte_order='big'):
     j = int.from_bytes(seed, byte_order)
 
     # operations page 7 in https://www.cryptolux.org/images/0/0d/Argon2.pdf
-    x = (j**2) // (2**32)
-    y = ((i-1)*x) // (2**32)
+    # x = (j**2) // (2**32), y = ((i-1)*x) // (2**32)
+    x = (j*j) >> 32
+    y = ((i-1)*x) >> 32
     res = i - 1 - y
 
     return res
@@ -48,6 +120,37 @@ def phis(seed, i, n):
     phi_i = phi(seed, i)
     return [ phi(i, phi_i) for phi in PHI_K[:n] ]
 
+# reference bulk version: dependencies for a list of (seed, index)
+def _phis_bulk(seeds, ks, n):
+    assert len(seeds) == len(ks)
+    return [ phis(seed, k, n) for seed, k in zip(seeds, ks) ]
+
+# use the native accelerator if it is built and agrees with the reference
+def _select_phis_bulk():
+    try:
+        import native
+    except ImportError:
+        return _phis_bulk
+    if native.lib is None:
+        return _phis_bulk
+    seeds = [ struct.pack('>I', (0x9e3779b9 * c) % 2**32) for c in range(64) ]
+    seeds[:2] = [ b'\x00' * 4, b'\xff' * 4 ]
+    ks = [ 1 + (c * 0x12345) % 2**32 for c in range(64) ]
+    for n in range(1, len(PHI_K) + 1):
+        if native.phis_bulk(seeds, ks, n) != _phis_bulk(seeds, ks, n):
+            return _phis_bulk
+    return native.phis_bulk
+
+_phis_bulk_impl = None
+
+# phis_bulk(seeds, ks, n) == [ phis(s, k, n) for s, k in zip(seeds, ks) ]
+# the implementation is selected on the first call
+def phis_bulk(seeds, ks, n):
+    global _phis_bulk_impl
+    if _phis_bulk_impl is None:
+        _phis_bulk_impl = _select_phis_bulk()
+    return _phis_bulk_impl(seeds, ks, n)
+
 # return a M bytes hash of x
 def H(M, x, method=HASH):
     # manual type check:-)
@@ -60,33 +163,116 @@ def H(M, x, method=HASH):
     else:
         raise Exception("unexpected hash '%s'" % method)
 
-# ??? TODO: implement function F
+# compression functions building the elements of X
+# - 'H': truncated H of the joined antecedents and I, as initially
+#   implemented, several hash core calls per element (3 for n=4, x=64)
+# - 'blake2b': one BLAKE2b compression per element, as assumed by the cost
+#   models (c_F = 1): the n antecedents are summed as little endian integers
+#   modulo 2^(8x), and hashed with I' = BLAKE2b(I) in a single 128 bytes block
+#     X[p*l+k] = BLAKE2b_x(k || p || I') for k < n
+#     X[p*l+k] = BLAKE2b_x(sum(X[p*l+phi]) || I') otherwise
+F_METHODS = ['H', 'blake2b']
 
 # return int n as a 4 byte string, for hashing purposes
 def int_to_4bytes(n):
     assert type(n) == int
     return struct.pack('>I', n)
 
+# per-challenge hashing context
+#
+# All hashes of the scheme are H(size, data + I), with the constant challenge
+# I as a *suffix*: it cannot be pre-absorbed into a copied hash state without
+# changing every output (and so the proof format). What is precomputed is what
+# does not depend on the data: the checked method, I itself and I as an integer
+# for the Y xor, which avoids the byte per byte xor() on each Y step, and I'
+# for the blake2b F.
+class Hasher:
+
+    __slots__ = ('I', 'method', 'F', '_I', '_nI', '_Ib', 'direct', 'indirect')
+
+    def __init__(self, I, method=HASH, F=F):
+        assert type(I) == bytes
+        if method != 'sha512':
+            raise Exception("unexpected hash '%s'" % method)
+        if F not in F_METHODS:
+            raise Exception("unexpected F '%s'" % F)
+        self.I, self.method, self.F = I, method, F
+        self._I, self._nI = int.from_bytes(I, 'big'), len(I)
+        if F == 'blake2b':
+            self._Ib = blake2b(I).digest()
+            self.direct, self.indirect = self._direct_b, self._indirect_b
+        else:
+            self._Ib = None
+            self.direct, self.indirect = self._direct_H, self._indirect_H
+
+    # direct(x, p, k): X[p*l+k] for k < n
+    def _direct_H(self, x, p, k):
+        return sha512(struct.pack('>II', k, p) + self.I).digest()[:x]
+
+    def _blake2b(self, x, data):
+        return blake2b(data, digest_size=x).digest()
+
+    def _direct_b(self, x, p, k):
+        return self._blake2b(x, struct.pack('>II', k, p) + self._Ib)
+
+    # indirect(x, deps): X[p*l+k] for k >= n, from its antecedents
+    def _indirect_H(self, x, deps):
+        return sha512(b''.join(deps) + self.I).digest()[:x]
+
+    def _indirect_b(self, x, deps):
+        s = 0
+        for v in deps:
+            s += int.from_bytes(v, 'little')
+        s &= (1 << (8*x)) - 1
+        return self._blake2b(x, s.to_bytes(x, 'little') + self._Ib)
+
+    def leaf(self, M, Xi):
+        return sha512(Xi + self.I).digest()[:M]
+
+    def node(self, M, X1, X2):
+        return sha512(X1 + X2 + self.I).digest()[:M]
+
+    # same as xor(v, I)
+    def xor_I(self, v):
+        return (int.from_bytes(v, 'big') ^ self._I) \
+            .to_bytes(max(len(v), self._nI), 'big')
+
+_HASHERS = {}
+
+# contexts are cheap, but keep them for the last challenges
+def hasher(I, method=HASH, F=F):
+    hs = _HASHERS.get((I, method, F))
+    if hs is None:
+        if len(_HASHERS) >= 16:
+            del _HASHERS[next(iter(_HASHERS))]
+        hs = _HASHERS[(I, method, F)] = Hasher(I, method, F)
+    return hs
+
 # help, some redundancy
-def _direct_X_i(x, I, p, k, l, n):
+def _direct_X_i(x, I, p, k, l, n, F=F):
     assert k < n and n <= l
-    return H(x, int_to_4bytes(k) + int_to_4bytes(p) + I)
+    collector = _STATS.get()
+    if collector is not None:
+        collector.hashes['direct'] += 1
+    return hasher(I, F=F).direct(x, p, k)
 
-# ??? FIXME this is not the expected formula
-def _indirect_X_i(x, I, p, k, l, n, X):
+# see F_METHODS for the formulas
+def _indirect_X_i(x, I, p, k, l, n, X, F=F):
     assert n <= k and k < l
     i = p*l + k
     assert ((type(X) is list and i-1 < len(X)) or \
             (type(X) is dict and i-1 in X))
     seed = X[i-1][:4]
-    data = b''
+    data = []
     for phi in phis(seed, k, n):
         assert phi <= i-1 and \
             ((type(X) is list and p*l+phi < len(X)) or \
              (type(X) is dict and p*l+phi in X))
-        data += X[p*l+phi]
-    data += I
-    return H(x, data)
+        data.append(X[p*l+phi])
+    collector = _STATS.get()
+    if collector is not None:
+        collector.hashes['indirect'] += 1
+    return hasher(I, F=F).indirect(x, data)
 
 # computation of X[i]
 def compute_X_i(x, I, i, l, n):
@@ -96,55 +282,208 @@ def compute_X_i(x, I, i, l, n):
     else:
         return _indirect_X_i(x, I, p, k, l, n, X)
 
+# build and return segment p of X, as a list of l elements
+def _build_X_segment(hs, p, l, n, x):
+    seg = [None] * l
+
+    # Step 1.a: build initial elements out of i, p and I
+    for k in range(n):
+        seg[k] = hs.direct(x, p, k)
+
+    # Step 1.b: build elements that depend on antecedents using phi functions
+    indirect = hs.indirect
+    for k in range(n, l):
+        seed = seg[k-1][:4]
+        seg[k] = indirect(x, [seg[phi] for phi in phis(seed, k, n)])
+
+    return seg
+
 # build and return array X
 # ??? this probably does not work if T is not a 2**.
-def build_X(I, T, l, n, x):
+def build_X(I, T, l, n, x, F=F):
     X = [None] * T
     P = (T + (l - 1)) // l
     # ??? particular case
     #assert float(l) == T / P
+    assert P * l == T, "T must be a multiple of l"
+    assert n <= l and 1 <= n <= len(PHI_K)
+    hs = hasher(I, F=F)
     # parallel segments
     for p in range(P):
+        X[p*l:(p+1)*l] = _build_X_segment(hs, p, l, n, x)
+
+    collector = _STATS.get()
+    if collector is not None:
+        collector.hashes['direct'] += n * P
+        collector.hashes['indirect'] += (l - n) * P
 
-        # Step 1.a: build initial elements out of i, p and I
-        for k in range(n):
-            X[p*l+k] = _direct_X_i(x, I, p, k, l, n)
+    return X
 
-        # Step 1.b: build elements that depend on antecedents using phi functions
-        for k in range(n, l):
-            X[p*l+k] = _indirect_X_i(x, I, p, k, l, n, X)
 
+# same result as build_X, with the native segment builder if available,
+# possibly on several threads (None for all cpus)
+def fast_build_X(I, T, l, n, x, threads=None, F=F):
+    import native
+    if native.lib is None or T % l != 0:
+        return build_X(I, T, l, n, x, F)
+    X = native.build_X(I, T, l, n, x, threads, F)
+    collector = _STATS.get()
+    if collector is not None:
+        P = T // l
+        collector.hashes['direct'] += n * P
+        collector.hashes['indirect'] += (l - n) * P
     return X
 
+# yield (p, segment of X) in order, with the native builder if available,
+# which runs up to threads segments ahead of the consumer
+def _X_segments(I, T, l, n, x, threads=None, F=F):
+    import native
+    P = T // l
+    assert P * l == T, "T must be a multiple of l"
+    assert n <= l and 1 <= n <= len(PHI_K)
+    if native.lib is None:
+        hs = hasher(I, F=F)
+        for p in range(P):
+            yield p, _build_X_segment(hs, p, l, n, x)
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    from collections import deque
+    threads = threads or os.cpu_count() or 1
+    with ThreadPoolExecutor(threads) as pool:
+        build = lambda p: native.X_segment(I, p, l, n, x, F)
+        todo = deque(pool.submit(build, p) for p in range(min(P, threads + 1)))
+        for p in range(P):
+            seg = todo.popleft().result()
+            if p + 1 + len(todo) < P:
+                todo.append(pool.submit(build, p + 1 + len(todo)))
+            yield p, seg
+
+# build X and its Merkle tree B in one pass
+#
+# The leaves of each segment are hashed as soon as it is built, while it is
+# still in cache, and complete subtrees are folded on a stack, so that the
+# root is available with the last segment instead of sweeping X again.
+# Same result as build_X then build_MT, for T a power of 2.
+# If levels is given, only the top levels of B are kept, see PartialMT.
+def build_X_MT(I, T, l, n, x, M, threads=None, F=F, levels=None):
+    assert T > 0 and T & (T-1) == 0, "T must be a power of 2"
+    X = [None] * T
+    size = 2*T-1 if levels is None else min(2*T-1, 2**levels - 1)
+    B = [None] * size
+    hs = hasher(I)
+    leaf, node = hs.leaf, hs.node
+    # roots of complete subtrees, as indexes in B and values, left to right
+    stack, values = [], []
+    for p, seg in _X_segments(I, T, l, n, x, threads, F):
+        base = p*l
+        X[base:base+l] = seg
+        for k, Xi in enumerate(seg):
+            j = T - 1 + base + k
+            v = leaf(M, Xi)
+            if j < size:
+                B[j] = v
+            # a right son (even index) completes its parent subtree
+            while j % 2 == 0 and j > 0:
+                left = stack.pop()
+                assert left == j - 1
+                j = left // 2
+                v = node(M, values.pop(), v)
+                if j < size:
+                    B[j] = v
+            stack.append(j)
+            values.append(v)
+    assert stack == [0]
+
+    collector = _STATS.get()
+    if collector is not None:
+        P = T // l
+        collector.hashes['direct'] += n * P
+        collector.hashes['indirect'] += (l - n) * P
+        collector.hashes['leaf'] += T
+        collector.hashes['node'] += T - 1
+
+    if levels is not None:
+        B = PartialMT(I, X, M, B)
+    return X, B
+
+# Merkle tree of X keeping only its top levels
+#
+# The search only needs the root, and the proof a few opening nodes, so the
+# 2T-1 nodes need not stay in memory: nodes of index below len(top) are
+# stored, the others are recomputed from X on demand, at the cost of the
+# T/2^depth leaves of their subtree. Indexed as the full array B.
+class PartialMT:
+
+    def __init__(self, I, X, M, top):
+        self.I, self.X, self.M, self.T = I, X, M, len(X)
+        assert 1 <= len(top) <= 2*self.T - 1
+        self.top = top
+
+    def __len__(self):
+        return 2*self.T - 1
+
+    def __getitem__(self, i):
+        if not 0 <= i < 2*self.T - 1:
+            raise IndexError(i)
+        if i < len(self.top):
+            return self.top[i]
+        # leaves of the subtree of node i, at depth d
+        d = (i + 1).bit_length() - 1
+        span = self.T >> d
+        first = (i + 1 - 2**d) * span
+        hs = hasher(self.I)
+        level = [ hs.leaf(self.M, Xi) for Xi in self.X[first:first+span] ]
+        while len(level) > 1:
+            level = [ hs.node(self.M, level[a], level[a+1])
+                      for a in range(0, len(level), 2) ]
+        collector = _STATS.get()
+        if collector is not None:
+            collector.hashes['leaf'] += span
+            collector.hashes['node'] += span - 1
+        return level[0]
 
 # rebuild a partial X
-def rebuild_X(rL, I, l, n, x):
+# direct(p, k) may provide the X[p*l+k] for k < n, eg from a Challenge
+def rebuild_X(rL, I, l, n, x, F=F, direct=None):
     X = {}
     for i, xs in rL.items():
         p, k = i // l, i % l
         if k < n:
-            X_i = _direct_X_i(x, I, p, k, l, n)
+            if direct is not None:
+                X_i = direct(p, k)
+            else:
+                X_i = _direct_X_i(x, I, p, k, l, n, F)
         else:
             assert type(xs) is list
+            if len(xs) != n:
+                raise ProofError(ProofError.BAD_ANTECEDENTS, i)
             seed = xs[0][:4]
             for j, v in zip(phis(seed, k, n), xs):
                 if p*l+j in X:
-                    assert X[p*l+j] == v
+                    if X[p*l+j] != v:
+                        raise ProofError(ProofError.INCONSISTENT, p*l+j)
                 else:
                     X[p*l+j] = v
-            X_i = _indirect_X_i(x, I, p, k, l, n, X)
+            X_i = _indirect_X_i(x, I, p, k, l, n, X, F)
         if i in X:
-            assert X[i] == X_i
+            if X[i] != X_i:
+                raise ProofError(ProofError.INCONSISTENT, i)
         else:
             X[i] = X_i
     #print("nX=%s" % { k:v.hex() for k,v in X.items() })
     return X
 
 def _cmp_MT_leaf(I, Xi, M):
-    return H(M, Xi + I)
+    collector = _STATS.get()
+    if collector is not None:
+        collector.hashes['leaf'] += 1
+    return hasher(I).leaf(M, Xi)
 
 def _cmp_MT_node(I, X1, X2, M):
-    return H(M, X1 + X2 + I)
+    collector = _STATS.get()
+    if collector is not None:
+        collector.hashes['node'] += 1
+    return hasher(I).node(M, X1, X2)
 
 # build merkle tree
 # ??? TODO should work for non 2**
@@ -154,18 +493,23 @@ def build_MT(I, X, M):
     # Step 2.a. : build Merkle-tree as an array
     B = [None] * (2*T-1)
 
+    hs = hasher(I)
+    leaf, node = hs.leaf, hs.node
+
     # Step 2.b. : Compute leaf elements out of hashes of X
     for i in range(T):
-        B[i + T - 1] = _cmp_MT_leaf(I, X[i], M)
+        B[i + T - 1] = leaf(M, X[i])
 
     # Step 2.c. : Compute intermediate elements as hashes of their sons
     for i in range(T-2, -1, -1): # Downward iteration from T-2 to 0, both included
-        B[i] = _cmp_MT_node(I, B[2*i+1], B[2*i+2], M)
+        B[i] = node(M, B[2*i+1], B[2*i+2])
 
-    return B
+    collector = _STATS.get()
+    if collector is not None:
+        collector.hashes['leaf'] += T
+        collector.hashes['node'] += T - 1
 
-# sigh... this should be in Python
-from sortedcontainers import SortedSet
+    return B
 
 # rebuild partial Merkle Tree from available informations
 # this is a bottom-up version of recursive "compute_MT_node",
@@ -175,17 +519,25 @@ def rebuild_MT(rZ, I, X, M, T):
     for i, v in X.items():
         B[i + T - 1] = _cmp_MT_leaf(I, v, M)
     for i, v in rZ.items():
-        assert i not in B
+        if i in B:
+            raise ProofError(ProofError.BAD_OPENING, i)
         B[i] = v
-    indexes = SortedSet(B.keys())
-    while len(indexes) >= 2:
-        i2, i1 = indexes.pop(), indexes.pop()
-        assert i1 + 1 == i2 and i2 % 2 == 0
+    # pending indexes, largest first: a max-heap of negated indexes
+    heap = [ -i for i in B ]
+    heap.sort()
+    pending = set(B)
+    while len(heap) >= 2:
+        i2, i1 = -heappop(heap), -heappop(heap)
+        if i1 + 1 != i2 or i2 % 2 != 0:
+            raise ProofError(ProofError.BAD_OPENING, i1)
         i0 = i1 // 2
-        assert not i0 in indexes
-        indexes.add(i0)
+        if i0 in pending:
+            raise ProofError(ProofError.BAD_OPENING, i0)
+        pending.add(i0)
+        heappush(heap, -i0)
         B[i0] = _cmp_MT_node(I, B[i1], B[i2], M)
-    assert len(indexes) == 1 and indexes.pop() == 0
+    if len(heap) != 1 or heap[0] != 0:
+        raise ProofError(ProofError.BAD_OPENING)
     return B
 
 # Let's use a recursive function !
@@ -199,6 +551,9 @@ def compute_MT_node(index, known_nodes, I, T, M):
     if index in known_nodes:
         return known_nodes[index]
     else:
+        collector = _STATS.get()
+        if collector is not None:
+            collector.hashes['node'] += 1
         return H(M,
                 compute_MT_node(2*index+1, known_nodes, I, T, M) +
                 compute_MT_node(2*index+2, known_nodes, I, T, M) + I )
@@ -211,27 +566,72 @@ def xor(a,b):
         a, b = b, a
     return bytes(x ^ y for x, y in zip(a, b'\x00' * (len(a) - len(b)) + b))
 
+# versions of the derivation of X indexes from Y values, recorded in proofs
+# 0: Y as an integer modulo T
+# 1: 8 bytes prefix of Y, masked for a power of 2 T, else range reduced by
+#    multiply-shift (shorter Y are taken whole)
+INDEX = 0
+INDEX_VERSIONS = [0, 1]
+
+_PREFIX = { 'big': struct.Struct('>Q'), 'little': struct.Struct('<Q') }
+
+# function of Y values to indexes in [0, T)
+def indexer(T, version=INDEX, byte_order='big'):
+    if version == 0:
+        return lambda y: int.from_bytes(y, byte_order) % T
+    if version != 1:
+        raise Exception("unexpected index version %s" % version)
+    unpack = _PREFIX[byte_order].unpack_from
+    def prefix(y):
+        if len(y) >= 8:
+            return unpack(y)[0], 64
+        return int.from_bytes(y, byte_order), 8 * len(y)
+    if T & (T-1) == 0:
+        mask = T - 1
+        return lambda y: prefix(y)[0] & mask
+    def reduce(y):
+        v, bits = prefix(y)
+        return (v * T) >> bits
+    return reduce
+
 # compute the Y sequence from nonce and other stuff
 # X maybe a full or partial array
-def compute_Y(I, X, T, L, S, N, Psi, byte_order='big'):
+def compute_Y(I, X, T, L, S, N, Psi, byte_order='big', index=INDEX):
     # build array Y of length L+1
     Y = [None] * (L+1)
 
+    hs = hasher(I)
+    xor_I = hs.xor_I
+    # version 1 is inlined for a power of 2 T and S >= 8, as version 0
+    unpack = None
+    if index == 1 and T & (T-1) == 0 and S >= 8:
+        unpack, mask = _PREFIX[byte_order].unpack_from, T - 1
+    elif index != 0:
+        to_index = indexer(T, index, byte_order)
+
     # initialization
-    Y[0] = H(S, N + Psi + I)
+    Y[0] = sha512(N + Psi + I).digest()[:S]
 
     # build array Y and keep used X indexes
     i = [None] * L
     for j in range(1, L+1):
         # Step 5.a
-        # ??? a full modulo is expensive for non 2**
-        # should it rather be on a few bytes?
-        i[j-1] = int.from_bytes(Y[j-1], byte_order) % T
+        # a full modulo is expensive, see indexer for cheaper versions
+        if index == 0:
+            i[j-1] = int.from_bytes(Y[j-1], byte_order) % T
+        elif unpack is not None:
+            i[j-1] = unpack(Y[j-1])[0] & mask
+        else:
+            i[j-1] = to_index(Y[j-1])
         # Step 5.b
-        Y[j] = H(S, Y[j-1] + xor(X[i[j-1]], I))
+        Y[j] = sha512(Y[j-1] + xor_I(X[i[j-1]])).digest()[:S]
 
     # Compute final Omega
-    Omega = H(S, xor(b''.join(Y[:0:-1] if len(Y) % 2 == 1 else Y[::-1]), I))
+    Omega = sha512(xor_I(b''.join(Y[:0:-1] if len(Y) % 2 == 1 else Y[::-1]))).digest()[:S]
+
+    collector = _STATS.get()
+    if collector is not None:
+        collector.hashes['Y'] += L + 2
 
     return Y, Omega, i
 
@@ -255,6 +655,10 @@ def print_rL(name, rL, l, n):
 # which maps selected indexes with their antecedents value in X so that they can be recomputed
 def build_rL(rI, X, l, n):
     rL = {}
+    # i[j] such that X[i[j]] was built at step 1.b
+    rB = [ ij for ij in rI if ij % l >= n ]
+    deps = phis_bulk([ X[ij-1][:4] for ij in rB ], [ ij % l for ij in rB ], n)
+    deps = dict(zip(rB, deps))
     for ij in rI:
         p, k = ij // l, ij % l
         if k < n:
@@ -264,9 +668,8 @@ def build_rL(rI, X, l, n):
             rL[ij] = []
         else :
             # i[j] is such that X[i[j]] was built at step 1.b
-            seed = X[ij-1][:4]
             # ??? we could skip those which can be recomputed?
-            rL[ij] = [ X[p*l + phi] for phi in phis(seed, k, n) ]
+            rL[ij] = [ X[p*l + phi] for phi in deps[ij] ]
 
     return rL
 
@@ -279,18 +682,17 @@ def build_rL(rI, X, l, n):
 
 # returns the set of indexes provided directly or indirectly with in roundL
 def get_provided_indexes(rL, T, l, n):
-    res = set()
-    for i in rL:
-        p, k = i // l, i % l
-        res.add(i)
-        if k >= n:
-            # Case when round_L[i_j] items have been built at step (1.b)
-            seed = rL[i][0][:4]
-            # argh, union is a function...
-            res = res.union((p*l + phi) for phi in phis(seed, k, n))
+    res = set(rL)
+    # Case when round_L[i_j] items have been built at step (1.b)
+    rB = [ i for i in rL if i % l >= n ]
+    for i, deps in zip(rB, phis_bulk([ rL[i][0][:4] for i in rB ],
+                                     [ i % l for i in rB ], n)):
+        p = i // l
+        res.update(p*l + phi for phi in deps)
     return res
 
 def build_rZ(rL, MT, T, l, n):
+    from opening import openingForOneArray as opening
     rZ = {}
     for k in opening(T, get_provided_indexes(rL, T, l, n)):
         rZ[k] = MT[k]
@@ -302,6 +704,7 @@ def clean_Z(Z):
 
 # ???
 def trim_round_L(round_L, P, T, n):
+    from collections import OrderedDict
     l = T//P
     assert l == T/P
 
@@ -321,6 +724,7 @@ def trim_round_L(round_L, P, T, n):
 
 # full version
 def build_JSON_output(N, round_L, Z, P, T, n, I, M, L, S, x, d):
+    import json
     data = {'answer':{}, 'params':{}}
     # needed PoW
     data['answer']['N'] = N.hex()
@@ -331,7 +735,7 @@ def build_JSON_output(N, round_L, Z, P, T, n, I, M, L, S, x, d):
     data['params']['I'] = I.hex()
     data['params']['T'] = T # P * l <= T
     data['params']['P'] = P
-    data['params']['l'] = l
+    data['params']['l'] = T // P
     data['params']['n'] = n
     data['params']['M'] = M
     data['params']['L'] = L
@@ -342,62 +746,334 @@ def build_JSON_output(N, round_L, Z, P, T, n, I, M, L, S, x, d):
     return json.dumps(data, separators=(',',':'))
 
 # minimal json export
-def exportPoW(N, rL, rZ):
+# the index version, if not 0, is recorded as "V"
+def exportPoW(N, rL, rZ, index=0):
+    import json
     data = {
         'N': N.hex(),
         'L': { i: [ j.hex() for j in v ] for i, v in rL.items() },
         'Z': { i: v.hex() for i, v in rZ.items() }
     }
+    if index != 0:
+        data['V'] = index
     return json.dumps(data)
 
-# reverse of exportPoW
-def importPoW(s):
-    data = json.loads(s)
+# N, rL, rZ and index version of parsed json
+def _decodePoW(data):
     N = bytes.fromhex(data['N'])
     rL = { int(i): [ bytes.fromhex(j) for j in v ] for i, v in data['L'].items() }
     rZ = { int(i): bytes.fromhex(v) for i, v in data['Z'].items() }
+    return N, rL, rZ, data.get('V', 0)
+
+# reverse of exportPoW
+def importPoW(s):
+    import json
+    N, rL, rZ, V = _decodePoW(json.loads(s))
     return N, rL, rZ
 
+# longest accepted nonce
+MAX_NONCE = 64
+
+# upper bound of the exportPoW size for valid proofs
+def proof_size_limit(T, L, n, x, M):
+    H = max(1, (T-1).bit_length())
+    # each selected element provides itself and up to n antecedents
+    provided = L * (n + 1)
+    # {"N": ..., "L": {"i": ["..", ...], ...}, "Z": {"j": "..", ...}, "V": .}
+    return 40 + 2 * MAX_NONCE + \
+        L * (24 + n * (2*x + 4)) + \
+        min(2*T, provided * H) * (2*M + 20)
+
+# upper bound of the hashes needed to verify a valid proof
+def hash_limit(T, L, n):
+    H = max(1, (T-1).bit_length())
+    provided = min(T, L * (n + 1))
+    # X elements, leaves, nodes up the tree (merges), Y and Omega
+    return L + provided + (provided + provided * H) + L + 2
+
+# check the shape of an imported proof, without hashing
+# raise a ProofError, or return the number of hashes of the verification
+def validatePoW(T, l, n, M, L, x, N, rL, rZ, max_hashes=None):
+    from opening import openingForOneArray as opening
+    if type(N) is not bytes or len(N) > MAX_NONCE:
+        raise ProofError(ProofError.BAD_NONCE)
+    if not 1 <= len(rL) <= L:
+        raise ProofError(ProofError.BAD_COUNT, len(rL))
+    # antecedents provided by several entries must agree
+    X = {}
+    for i, xs in rL.items():
+        if not 0 <= i < T:
+            raise ProofError(ProofError.BAD_INDEX, i)
+        p, k = i // l, i % l
+        if len(xs) != (0 if k < n else n):
+            raise ProofError(ProofError.BAD_ANTECEDENTS, i)
+        if any(len(v) != x for v in xs):
+            raise ProofError(ProofError.BAD_SIZE, i)
+        if xs:
+            for j, v in zip(phis(xs[0][:4], k, n), xs):
+                if X.setdefault(p*l+j, v) != v:
+                    raise ProofError(ProofError.INCONSISTENT, p*l+j)
+    for j, v in rZ.items():
+        if not 0 < j < 2*T-1:
+            raise ProofError(ProofError.BAD_INDEX, j)
+        if len(v) != M:
+            raise ProofError(ProofError.BAD_SIZE, j)
+    # the Merkle nodes must be exactly the opening of the provided leaves
+    provided = get_provided_indexes(rL, T, l, n)
+    if set(rZ) != set(opening(T, provided)):
+        raise ProofError(ProofError.BAD_OPENING)
+    # X elements, leaves, one node per merge, Y and Omega
+    hashes = len(rL) + len(provided) + (len(provided) + len(rZ) - 1) + L + 2
+    if hashes > (hash_limit(T, L, n) if max_hashes is None else max_hashes):
+        raise ProofError(ProofError.OVER_BUDGET, hashes)
+    return hashes
+
+# importPoW with size limit and parse errors as ProofError, and the index
+# version, which must be index if not None
+def _importPoW(json_in, max_size, index=None):
+    import json
+    if len(json_in) > max_size:
+        raise ProofError(ProofError.TOO_LARGE, len(json_in))
+    try:
+        N, rL, rZ, V = _decodePoW(json.loads(json_in))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise ProofError(ProofError.MALFORMED, e)
+    if type(V) is not int or V not in INDEX_VERSIONS or \
+       index is not None and V != index:
+        raise ProofError(ProofError.BAD_VERSION, V)
+    return N, rL, rZ, V
+
+# prepared challenge
+#
+# The parameters are validated once (see estimate.check, a challenge with
+# an unreachable d may still check proofs) and what only
+# depends on the challenge is computed once for all its proofs: the hashing
+# context, the proof size and hash limits, and the n*P direct elements of X,
+# computed on first use. Attributes cannot be changed.
+#
+#   ch = Challenge(I, T, l, n, M, L, S, x, d)
+#   proof, Omega, counter = ch.solve()
+#   ok, Omega = ch.check(proof)
+class Challenge:
+
+    __slots__ = ('I', 'T', 'l', 'n', 'M', 'L', 'S', 'x', 'd', 'F', 'P',
+                 'hasher', 'max_size', 'max_hashes', 'context', '_direct')
+
+    def __init__(self, I, T, l, n, M, L, S, x, d, F=F):
+        import estimate
+        if type(I) is not bytes or type(d) is not bytes:
+            raise ParamError("I and d must be bytes")
+        if F not in F_METHODS:
+            raise ParamError("unexpected F '%s'" % F)
+        estimate.check(T, l, n, x, M, L, S, d, solving=False)
+        init = lambda name, value: object.__setattr__(self, name, value)
+        for name, value in zip(self.__slots__,
+                               (I, T, l, n, M, L, S, x, d, F, T // l)):
+            init(name, value)
+        init('hasher', hasher(I, F=F))
+        init('max_size', proof_size_limit(T, L, n, x, M))
+        init('max_hashes', hash_limit(T, L, n))
+        # digest of all parameters, to key verdicts (see verify_cache.py)
+        init('context', sha512(repr(self).encode()).digest())
+        init('_direct', {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Challenge is immutable")
+
+    def __repr__(self):
+        return "Challenge(I=%s, T=%d, l=%d, n=%d, M=%d, L=%d, S=%d, x=%d, " \
+            "d=%s, F=%s)" % (self.I.hex(), self.T, self.l, self.n, self.M,
+                             self.L, self.S, self.x, self.d.hex(), self.F)
+
+    # (I, T, l, n, M, L, S, x, d), as the positional parameters
+    def params(self):
+        return (self.I, self.T, self.l, self.n, self.M, self.L, self.S,
+                self.x, self.d)
+
+    # X[p*l+k] for k < n
+    def direct(self, p, k):
+        i = p*self.l + k
+        X_i = self._direct.get(i)
+        if X_i is None:
+            X_i = self._direct[i] = \
+                _direct_X_i(self.x, self.I, p, k, self.l, self.n, self.F)
+        return X_i
+
+    def rebuild_X(self, rL):
+        return rebuild_X(rL, self.I, self.l, self.n, self.x, self.F,
+                         self.direct)
+
+    def rebuild_MT(self, rZ, X):
+        return rebuild_MT(rZ, self.I, X, self.M, self.T)
+
+    def compute_Y(self, X, N, Psi, index=INDEX):
+        return compute_Y(self.I, X, self.T, self.L, self.S, N, Psi,
+                         index=index)
+
+    # see solvePoW
+    def solve(self, stats=None, batch=None, mt_memory=None, layout=None,
+              index=INDEX):
+        if self.d == bytes(self.S):
+            raise Exception("d=0 cannot be reached")
+        if index not in INDEX_VERSIONS:
+            raise Exception("unexpected index version %s" % index)
+        I, T, l, n, M, L, S, x, d = self.params()
+        levels = None
+        if mt_memory is not None:
+            if layout is not None:
+                raise Exception("mt_memory is not supported with a layout")
+            import estimate
+            levels = estimate.mt_levels(T, M, mt_memory)
+        with instrument(stats):
+            with _stage('build'):
+                if layout is not None:
+                    X, B = layout.build_X_MT(I, T, l, n, x, M, self.F)
+                else:
+                    X, B = build_X_MT(I, T, l, n, x, M, F=self.F,
+                                      levels=levels)
+            Psi = B[0]
+            counter = 0
+            # the search runs on the CPUs near X
+            with _stage('search'), \
+                 layout.pinned() if layout is not None else _NO_STAGE:
+                if batch is not None:
+                    from search import transposed_search
+                    N, Omega, rI, counter = \
+                        transposed_search(I, X, T, L, S, Psi, d, batch,
+                                          index=index)
+                else:
+                    while True:
+                        counter += 1
+                        # Choose nonce, could be a counter.
+                        N = os.urandom(8)
+                        Y, Omega, rI = compute_Y(I, X, T, L, S, N, Psi,
+                                                 index=index)
+                        # sigh, Python is still missing a do/while loop
+                        if Omega < d:
+                            break
+            with _stage('proof'):
+                rL = build_rL(rI, X, l, n)
+                rZ = build_rZ(rL, B, T, l, n)
+                proof = exportPoW(N, rL, rZ, index)
+        if stats is not None:
+            stats.count(attempts=counter)
+            stats.emit()
+        return proof, Omega, counter
+
+    # see checkPoW
+    def check(self, json_in, stats=None, strict=False, max_size=None,
+              max_hashes=None, cache=None, index=None):
+        T, l, n, M, L, x = self.T, self.l, self.n, self.M, self.L, self.x
+        if max_size is None:
+            max_size = self.max_size
+        if max_hashes is None:
+            max_hashes = self.max_hashes
+        key = None
+        # an oversized proof is rejected without hashing it
+        if cache is not None and len(json_in) <= max_size:
+            # verdicts also depend on the limits and the required version
+            key = cache.key(self.context + b'%d %d %r' %
+                            (max_size, max_hashes, index), json_in)
+            if stats is not None:
+                stats.count(cache=1)
+            verdict = cache.get(key)
+            if verdict is not None:
+                ok, Omega, reason = verdict
+                if reason is None:
+                    if stats is not None:
+                        stats.count(attempts=1)
+                        stats.emit()
+                    return ok, Omega
+                if stats is not None:
+                    stats.count(rejection=reason)
+                    stats.emit()
+                if strict:
+                    raise ProofError(reason, "cached")
+                return False, None
+        try:
+            with instrument(stats):
+                with _stage('import'):
+                    nN, nrL, nrZ, nV = _importPoW(json_in, max_size, index)
+                    validatePoW(T, l, n, M, L, x, nN, nrL, nrZ, max_hashes)
+                with _stage('X'):
+                    nX = self.rebuild_X(nrL)
+                with _stage('MT'):
+                    nB = self.rebuild_MT(nrZ, nX)
+                nPsi = nB[0]
+                with _stage('search'):
+                    try:
+                        nY, nOmega, nrI = self.compute_Y(nX, nN, nPsi, nV)
+                    except KeyError as e:
+                        # Y goes through an element which is not provided
+                        raise ProofError(ProofError.INCONSISTENT, e)
+        except ProofError as e:
+            if key is not None:
+                cache.put(key, (False, None, e.reason))
+            if stats is not None:
+                stats.count(rejection=e.reason)
+                stats.emit()
+            if strict:
+                raise
+            return False, None
+        if key is not None:
+            cache.put(key, (nOmega < self.d, nOmega, None))
+        if stats is not None:
+            stats.count(attempts=1)
+            stats.emit()
+        return nOmega < self.d, nOmega
+
+_CHALLENGES = {}
+
+# prepared challenges are kept for the last parameter sets, so that
+# positional solvePoW and checkPoW calls share them too
+def challenge(I, T, l, n, M, L, S, x, d, F=F):
+    key = (I, T, l, n, M, L, S, x, d, F)
+    ch = _CHALLENGES.get(key)
+    if ch is None:
+        if len(_CHALLENGES) >= 16:
+            del _CHALLENGES[next(iter(_CHALLENGES))]
+        ch = _CHALLENGES[key] = Challenge(I, T, l, n, M, L, S, x, d, F)
+    return ch
+
 # nonce size?
-def solvePoW(I, T, l, n, M, L, S, x, d):
-    X = build_X(I, T, l, n, x)
-    B = build_MT(I, X, M)
-    Psi = B[0]
-    counter = 0
-    while True:
-        counter += 1
-        # Choose nonce, could be a counter.
-        N = os.urandom(8)
-        Y, Omega, rI = compute_Y(I, X, T, L, S, N, Psi)
-        # sigh, Python is still missing a do/while loop
-        if Omega < d:
-            break
-    rL = build_rL(rI, X, l, n)
-    rZ = build_rZ(rL, B, T, l, n)
-    return exportPoW(N, rL, rZ), Omega, counter
-
-def checkPoW(I, T, l, n, M, L, S, x, d, json_in):
-    nN, nrL, nrZ = importPoW(json_in)
-    nX = rebuild_X(nrL, I, l, n, x)
-    nB = rebuild_MT(nrZ, I, nX, M, T)
-    nPsi = nB[0]
-    nY, nOmega, nrI = compute_Y(I, nX, T, L, S, nN, nPsi)
-    return nOmega < d, nOmega
-
-# UNUSED
-# test values?
-n = 4 # number of dependencies
-T = 2**5 # length of the main array, non power of 2 should be allowed
-x = 64 # size of elements in the main array
-M = 64 # size of elements in the Merkel Tree
-S = 64 # size of elements of Y
-L = 9 # length of one search
-d = b'\x00' + b'\xff' * (S-1) # PoW difficulty (or strength)
-#l = 2**15 # length of segment
-l = 2**5
-P = T/l # number of independent sequences
-I = os.urandom(64) # initial challenge (randomly generated M bytes array)
-
-# needed seed size is 4 bytes
-assert 4 <= x
-assert M <= x
+# if stats (a stats.Stats) is given, it is filled and emitted at the end
+# if batch is given, nonces are searched batch at a time (see search.py),
+# which models the access pattern of a transposed search, at about the
+# same speed
+# F selects the compression function building X, see F_METHODS
+# if mt_memory is given, the Merkle tree is kept within mt_memory bytes and
+# its lower levels are recomputed for the proof, see PartialMT
+# if layout (a placement.Layout) is given, X and B are flat buffers placed
+# and searched as it says
+# index selects the derivation of X indexes from Y, see indexer
+def solvePoW(I, T, l, n, M, L, S, x, d, stats=None, batch=None, F=F,
+             mt_memory=None, layout=None, index=INDEX):
+    return challenge(I, T, l, n, M, L, S, x, d, F) \
+        .solve(stats, batch, mt_memory, layout, index)
+
+# a malformed or inconsistent proof is rejected as (False, None), before any
+# hashing if its shape is wrong, or raises its ProofError if strict.
+# max_size and max_hashes bound the work, see proof_size_limit and hash_limit.
+# if cache (a verify_cache.VerifyCache) is given, a proof already checked
+# for the same challenge costs one H
+# the index version is the one recorded in the proof, which must be index
+# if not None
+# invalid parameters are rejected as bad-params
+def checkPoW(I, T, l, n, M, L, S, x, d, json_in, stats=None,
+             strict=False, max_size=None, max_hashes=None, F=F, cache=None,
+             index=None):
+    try:
+        ch = challenge(I, T, l, n, M, L, S, x, d, F)
+    except ParamError as e:
+        if stats is not None:
+            stats.count(rejection=ProofError.BAD_PARAMS)
+            stats.emit()
+        if strict:
+            raise ProofError(ProofError.BAD_PARAMS, e)
+        return False, None
+    return ch.check(json_in, stats, strict, max_size, max_hashes, cache, index)
+
+# command line tool, see cli.py
+if __name__ == '__main__':
+    from cli import main
+    sys.exit(main(sys.argv[1:]))
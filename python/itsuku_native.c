@@ -0,0 +1,451 @@
+/*
+ * optional native accelerator for itsuku.py, loaded with ctypes by native.py
+ *
+ * build: make native
+ *
+ * Functions must stay bit-for-bit identical to the Python reference,
+ * see native_test.py.
+ */
+
+#include <stdint.h>
+#include <stddef.h>
+#include <string.h>
+
+/* bump when the exported interface changes, checked by native.py */
+#define ITSUKU_NATIVE_VERSION 3
+
+/* number of PHI_K functions */
+#define PHI_K_LEN 11
+
+int itsuku_native_version(void)
+{
+  return ITSUKU_NATIVE_VERSION;
+}
+
+static inline uint32_t seed_to_int(const uint8_t seed[4])
+{
+  /* big endian, as phi(seed, i) */
+  return ((uint32_t) seed[0] << 24) | ((uint32_t) seed[1] << 16) |
+    ((uint32_t) seed[2] << 8) | (uint32_t) seed[3];
+}
+
+/* Argon2 phi function, see phi() and ada/phis.adb */
+uint64_t itsuku_phi(uint32_t j, uint64_t i)
+{
+  uint64_t x = ((uint64_t) j * j) >> 32;
+  /* x < 2^32, so (i-1)*x does not overflow for i <= 2^32 */
+  uint64_t y = ((i - 1) * x) >> 32;
+  return i - 1 - y;
+}
+
+/* fill deps with the n first PHI_K dependencies of index i */
+static inline void phis_one(uint32_t j, uint64_t i, int n, uint64_t *deps)
+{
+  uint64_t pi = itsuku_phi(j, i);
+  switch (n)
+  {
+  case 11: deps[10] = i * 7 / 8;
+  case 10: deps[9] = pi * 7 / 8;
+  case 9: deps[8] = i / 4;
+  case 8: deps[7] = pi / 4;
+  case 7: deps[6] = 3 * i / 4;
+  case 6: deps[5] = 3 * pi / 4;
+  case 5: deps[4] = (pi + i) / 2;
+  case 4: deps[3] = (i - 1) / 2;
+  case 3: deps[2] = pi / 2;
+  case 2: deps[1] = pi;
+  case 1: deps[0] = i - 1;
+  }
+}
+
+/*
+ * SHA-512, FIPS 180-4
+ */
+
+typedef struct
+{
+  uint64_t h[8];
+  uint8_t block[128];
+  size_t used;     /* bytes in block */
+  uint64_t length; /* total bytes, we do not hash 2^61 bytes */
+} sha512_t;
+
+static const uint64_t SHA512_K[80] = {
+  0x428a2f98d728ae22ULL, 0x7137449123ef65cdULL, 0xb5c0fbcfec4d3b2fULL,
+  0xe9b5dba58189dbbcULL, 0x3956c25bf348b538ULL, 0x59f111f1b605d019ULL,
+  0x923f82a4af194f9bULL, 0xab1c5ed5da6d8118ULL, 0xd807aa98a3030242ULL,
+  0x12835b0145706fbeULL, 0x243185be4ee4b28cULL, 0x550c7dc3d5ffb4e2ULL,
+  0x72be5d74f27b896fULL, 0x80deb1fe3b1696b1ULL, 0x9bdc06a725c71235ULL,
+  0xc19bf174cf692694ULL, 0xe49b69c19ef14ad2ULL, 0xefbe4786384f25e3ULL,
+  0x0fc19dc68b8cd5b5ULL, 0x240ca1cc77ac9c65ULL, 0x2de92c6f592b0275ULL,
+  0x4a7484aa6ea6e483ULL, 0x5cb0a9dcbd41fbd4ULL, 0x76f988da831153b5ULL,
+  0x983e5152ee66dfabULL, 0xa831c66d2db43210ULL, 0xb00327c898fb213fULL,
+  0xbf597fc7beef0ee4ULL, 0xc6e00bf33da88fc2ULL, 0xd5a79147930aa725ULL,
+  0x06ca6351e003826fULL, 0x142929670a0e6e70ULL, 0x27b70a8546d22ffcULL,
+  0x2e1b21385c26c926ULL, 0x4d2c6dfc5ac42aedULL, 0x53380d139d95b3dfULL,
+  0x650a73548baf63deULL, 0x766a0abb3c77b2a8ULL, 0x81c2c92e47edaee6ULL,
+  0x92722c851482353bULL, 0xa2bfe8a14cf10364ULL, 0xa81a664bbc423001ULL,
+  0xc24b8b70d0f89791ULL, 0xc76c51a30654be30ULL, 0xd192e819d6ef5218ULL,
+  0xd69906245565a910ULL, 0xf40e35855771202aULL, 0x106aa07032bbd1b8ULL,
+  0x19a4c116b8d2d0c8ULL, 0x1e376c085141ab53ULL, 0x2748774cdf8eeb99ULL,
+  0x34b0bcb5e19b48a8ULL, 0x391c0cb3c5c95a63ULL, 0x4ed8aa4ae3418acbULL,
+  0x5b9cca4f7763e373ULL, 0x682e6ff3d6b2b8a3ULL, 0x748f82ee5defb2fcULL,
+  0x78a5636f43172f60ULL, 0x84c87814a1f0ab72ULL, 0x8cc702081a6439ecULL,
+  0x90befffa23631e28ULL, 0xa4506cebde82bde9ULL, 0xbef9a3f7b2c67915ULL,
+  0xc67178f2e372532bULL, 0xca273eceea26619cULL, 0xd186b8c721c0c207ULL,
+  0xeada7dd6cde0eb1eULL, 0xf57d4f7fee6ed178ULL, 0x06f067aa72176fbaULL,
+  0x0a637dc5a2c898a6ULL, 0x113f9804bef90daeULL, 0x1b710b35131c471bULL,
+  0x28db77f523047d84ULL, 0x32caab7b40c72493ULL, 0x3c9ebe0a15c9bebcULL,
+  0x431d67c49c100d4cULL, 0x4cc5d4becb3e42b6ULL, 0x597f299cfc657e2aULL,
+  0x5fcb6fab3ad6faecULL, 0x6c44198c4a475817ULL
+};
+
+#define ROTR64(x, n) (((x) >> (n)) | ((x) << (64 - (n))))
+
+static void sha512_init(sha512_t *s)
+{
+  static const uint64_t H0[8] = {
+    0x6a09e667f3bcc908ULL, 0xbb67ae8584caa73bULL, 0x3c6ef372fe94f82bULL,
+    0xa54ff53a5f1d36f1ULL, 0x510e527fade682d1ULL, 0x9b05688c2b3e6c1fULL,
+    0x1f83d9abfb41bd6bULL, 0x5be0cd19137e2179ULL
+  };
+  memcpy(s->h, H0, sizeof(H0));
+  s->used = 0;
+  s->length = 0;
+}
+
+static void sha512_compress(sha512_t *s, const uint8_t *block)
+{
+  uint64_t w[80], a, b, c, d, e, f, g, h;
+  for (int t = 0; t < 16; t++)
+  {
+    const uint8_t *q = block + 8 * t;
+    w[t] = ((uint64_t) q[0] << 56) | ((uint64_t) q[1] << 48) |
+      ((uint64_t) q[2] << 40) | ((uint64_t) q[3] << 32) |
+      ((uint64_t) q[4] << 24) | ((uint64_t) q[5] << 16) |
+      ((uint64_t) q[6] << 8) | (uint64_t) q[7];
+  }
+  for (int t = 16; t < 80; t++)
+  {
+    uint64_t s0 = ROTR64(w[t-15], 1) ^ ROTR64(w[t-15], 8) ^ (w[t-15] >> 7);
+    uint64_t s1 = ROTR64(w[t-2], 19) ^ ROTR64(w[t-2], 61) ^ (w[t-2] >> 6);
+    w[t] = w[t-16] + s0 + w[t-7] + s1;
+  }
+  a = s->h[0]; b = s->h[1]; c = s->h[2]; d = s->h[3];
+  e = s->h[4]; f = s->h[5]; g = s->h[6]; h = s->h[7];
+  for (int t = 0; t < 80; t++)
+  {
+    uint64_t S1 = ROTR64(e, 14) ^ ROTR64(e, 18) ^ ROTR64(e, 41);
+    uint64_t ch = (e & f) ^ (~e & g);
+    uint64_t t1 = h + S1 + ch + SHA512_K[t] + w[t];
+    uint64_t S0 = ROTR64(a, 28) ^ ROTR64(a, 34) ^ ROTR64(a, 39);
+    uint64_t maj = (a & b) ^ (a & c) ^ (b & c);
+    uint64_t t2 = S0 + maj;
+    h = g; g = f; f = e; e = d + t1;
+    d = c; c = b; b = a; a = t1 + t2;
+  }
+  s->h[0] += a; s->h[1] += b; s->h[2] += c; s->h[3] += d;
+  s->h[4] += e; s->h[5] += f; s->h[6] += g; s->h[7] += h;
+}
+
+static void sha512_update(sha512_t *s, const uint8_t *data, size_t len)
+{
+  s->length += len;
+  while (len > 0)
+  {
+    if (s->used == 0 && len >= 128)
+    {
+      sha512_compress(s, data);
+      data += 128;
+      len -= 128;
+      continue;
+    }
+    size_t chunk = 128 - s->used;
+    if (chunk > len)
+      chunk = len;
+    memcpy(s->block + s->used, data, chunk);
+    s->used += chunk;
+    data += chunk;
+    len -= chunk;
+    if (s->used == 128)
+    {
+      sha512_compress(s, s->block);
+      s->used = 0;
+    }
+  }
+}
+
+/* write the size first bytes of the digest, size <= 64 */
+static void sha512_final(sha512_t *s, uint8_t *out, size_t size)
+{
+  uint64_t bits = s->length * 8;
+  uint8_t digest[64];
+  s->block[s->used++] = 0x80;
+  if (s->used > 112)
+  {
+    memset(s->block + s->used, 0, 128 - s->used);
+    sha512_compress(s, s->block);
+    s->used = 0;
+  }
+  memset(s->block + s->used, 0, 120 - s->used);
+  for (int b = 0; b < 8; b++)
+    s->block[120 + b] = (uint8_t) (bits >> (56 - 8 * b));
+  sha512_compress(s, s->block);
+  for (int t = 0; t < 8; t++)
+    for (int b = 0; b < 8; b++)
+      digest[8 * t + b] = (uint8_t) (s->h[t] >> (56 - 8 * b));
+  memcpy(out, digest, size);
+}
+
+/* out = sha512(data)[:size], exported for tests */
+void itsuku_sha512(const uint8_t *data, size_t len, uint8_t *out, size_t size)
+{
+  sha512_t s;
+  sha512_init(&s);
+  sha512_update(&s, data, len);
+  sha512_final(&s, out, size);
+}
+
+/*
+ * BLAKE2b, RFC 7693, unkeyed with a digest size of 1 to 64 bytes
+ */
+
+typedef struct
+{
+  uint64_t h[8];
+  uint8_t block[128];
+  size_t used;     /* bytes in block */
+  uint64_t length; /* total bytes */
+  size_t size;     /* digest size */
+} blake2b_t;
+
+static const uint64_t BLAKE2B_IV[8] = {
+  0x6a09e667f3bcc908ULL, 0xbb67ae8584caa73bULL, 0x3c6ef372fe94f82bULL,
+  0xa54ff53a5f1d36f1ULL, 0x510e527fade682d1ULL, 0x9b05688c2b3e6c1fULL,
+  0x1f83d9abfb41bd6bULL, 0x5be0cd19137e2179ULL
+};
+
+static const uint8_t BLAKE2B_SIGMA[12][16] = {
+  { 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15 },
+  { 14, 10, 4, 8, 9, 15, 13, 6, 1, 12, 0, 2, 11, 7, 5, 3 },
+  { 11, 8, 12, 0, 5, 2, 15, 13, 10, 14, 3, 6, 7, 1, 9, 4 },
+  { 7, 9, 3, 1, 13, 12, 11, 14, 2, 6, 5, 10, 4, 0, 15, 8 },
+  { 9, 0, 5, 7, 2, 4, 10, 15, 14, 1, 11, 12, 6, 8, 3, 13 },
+  { 2, 12, 6, 10, 0, 11, 8, 3, 4, 13, 7, 5, 15, 14, 1, 9 },
+  { 12, 5, 1, 15, 14, 13, 4, 10, 0, 7, 6, 3, 9, 2, 8, 11 },
+  { 13, 11, 7, 14, 12, 1, 3, 9, 5, 0, 15, 4, 8, 6, 2, 10 },
+  { 6, 15, 14, 9, 11, 3, 0, 8, 12, 2, 13, 7, 1, 4, 10, 5 },
+  { 10, 2, 8, 4, 7, 6, 1, 5, 15, 11, 9, 14, 3, 12, 13, 0 },
+  { 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15 },
+  { 14, 10, 4, 8, 9, 15, 13, 6, 1, 12, 0, 2, 11, 7, 5, 3 }
+};
+
+static inline uint64_t get_le64(const uint8_t *q)
+{
+  uint64_t v = 0;
+  for (int b = 7; b >= 0; b--)
+    v = (v << 8) | q[b];
+  return v;
+}
+
+#define B2B_G(a, b, c, d, x, y)                 \
+  do {                                          \
+    v[a] = v[a] + v[b] + (x);                   \
+    v[d] = ROTR64(v[d] ^ v[a], 32);             \
+    v[c] = v[c] + v[d];                         \
+    v[b] = ROTR64(v[b] ^ v[c], 24);             \
+    v[a] = v[a] + v[b] + (y);                   \
+    v[d] = ROTR64(v[d] ^ v[a], 16);             \
+    v[c] = v[c] + v[d];                         \
+    v[b] = ROTR64(v[b] ^ v[c], 63);             \
+  } while (0)
+
+static void blake2b_compress(blake2b_t *s, const uint8_t *block, int last)
+{
+  uint64_t v[16], m[16];
+  for (int t = 0; t < 16; t++)
+    m[t] = get_le64(block + 8 * t);
+  for (int t = 0; t < 8; t++)
+  {
+    v[t] = s->h[t];
+    v[t + 8] = BLAKE2B_IV[t];
+  }
+  v[12] ^= s->length; /* we do not hash 2^64 bytes */
+  if (last)
+    v[14] = ~v[14];
+  for (int r = 0; r < 12; r++)
+  {
+    const uint8_t *sg = BLAKE2B_SIGMA[r];
+    B2B_G(0, 4, 8, 12, m[sg[0]], m[sg[1]]);
+    B2B_G(1, 5, 9, 13, m[sg[2]], m[sg[3]]);
+    B2B_G(2, 6, 10, 14, m[sg[4]], m[sg[5]]);
+    B2B_G(3, 7, 11, 15, m[sg[6]], m[sg[7]]);
+    B2B_G(0, 5, 10, 15, m[sg[8]], m[sg[9]]);
+    B2B_G(1, 6, 11, 12, m[sg[10]], m[sg[11]]);
+    B2B_G(2, 7, 8, 13, m[sg[12]], m[sg[13]]);
+    B2B_G(3, 4, 9, 14, m[sg[14]], m[sg[15]]);
+  }
+  for (int t = 0; t < 8; t++)
+    s->h[t] ^= v[t] ^ v[t + 8];
+}
+
+static void blake2b_init(blake2b_t *s, size_t size)
+{
+  for (int t = 0; t < 8; t++)
+    s->h[t] = BLAKE2B_IV[t];
+  /* parameter block: digest length, no key, fanout and depth 1 */
+  s->h[0] ^= 0x01010000ULL ^ (uint64_t) size;
+  s->used = 0;
+  s->length = 0;
+  s->size = size;
+}
+
+static void blake2b_update(blake2b_t *s, const uint8_t *data, size_t len)
+{
+  while (len > 0)
+  {
+    /* the last block is compressed by final */
+    if (s->used == 128)
+    {
+      s->length += 128;
+      blake2b_compress(s, s->block, 0);
+      s->used = 0;
+    }
+    size_t chunk = 128 - s->used;
+    if (chunk > len)
+      chunk = len;
+    memcpy(s->block + s->used, data, chunk);
+    s->used += chunk;
+    data += chunk;
+    len -= chunk;
+  }
+}
+
+static void blake2b_final(blake2b_t *s, uint8_t *out)
+{
+  uint8_t digest[64];
+  s->length += s->used;
+  memset(s->block + s->used, 0, 128 - s->used);
+  blake2b_compress(s, s->block, 1);
+  for (int t = 0; t < 8; t++)
+    for (int b = 0; b < 8; b++)
+      digest[8 * t + b] = (uint8_t) (s->h[t] >> (8 * b));
+  memcpy(out, digest, s->size);
+}
+
+/* out = blake2b(data, digest_size=size), exported for tests */
+void itsuku_blake2b(const uint8_t *data, size_t len, uint8_t *out, size_t size)
+{
+  blake2b_t s;
+  blake2b_init(&s, size);
+  blake2b_update(&s, data, len);
+  blake2b_final(&s, out);
+}
+
+static inline void put_be32(uint8_t *q, uint32_t v)
+{
+  q[0] = (uint8_t) (v >> 24); q[1] = (uint8_t) (v >> 16);
+  q[2] = (uint8_t) (v >> 8); q[3] = (uint8_t) v;
+}
+
+/* compression functions, as itsuku.F_METHODS */
+#define F_H 0
+#define F_BLAKE2B 1
+
+/*
+ * build segment p of X into seg (l elements of x bytes), as build_X:
+ * with F_H:
+ * - X[p*l+k] = H(x, k || p || I) for k < n
+ * - X[p*l+k] = H(x, X[p*l+phi_0] || ... || X[p*l+phi_{n-1}] || I) otherwise
+ * with F_BLAKE2B, I' = BLAKE2b(I):
+ * - X[p*l+k] = BLAKE2b_x(k || p || I') for k < n
+ * - X[p*l+k] = BLAKE2b_x(sum of X[p*l+phi_d] mod 2^(8x) || I') otherwise,
+ *   the sum being on little endian integers, in one compression
+ * return 0, or -1 on invalid parameters
+ */
+int itsuku_build_segment(const uint8_t *I, size_t I_len, uint32_t p,
+                         uint64_t l, int n, size_t x, int f, uint8_t *seg)
+{
+  if (n < 1 || n > PHI_K_LEN || (uint64_t) n > l || x < 4 || x > 64 ||
+      l > ((uint64_t) 1 << 32) || (f != F_H && f != F_BLAKE2B))
+    return -1;
+
+  uint64_t deps[PHI_K_LEN];
+
+  if (f == F_BLAKE2B)
+  {
+    /* kp || sum || I', at most 64 + 64 bytes */
+    uint8_t block[128];
+    blake2b_t s;
+    itsuku_blake2b(I, I_len, block + 64, 64);
+
+    // Step 1.a
+    for (int k = 0; k < n; k++)
+    {
+      put_be32(block + 56, (uint32_t) k);
+      put_be32(block + 60, p);
+      itsuku_blake2b(block + 56, 8 + 64, seg + k * x, x);
+    }
+
+    // Step 1.b
+    uint8_t *sum = block + 64 - x;
+    for (uint64_t k = n; k < l; k++)
+    {
+      phis_one(seed_to_int(seg + (k - 1) * x), k, n, deps);
+      unsigned carry = 0;
+      for (size_t b = 0; b < x; b++)
+      {
+        for (int d = 0; d < n; d++)
+          carry += seg[deps[d] * x + b];
+        sum[b] = (uint8_t) carry;
+        carry >>= 8;
+      }
+      blake2b_init(&s, x);
+      blake2b_update(&s, sum, x + 64);
+      blake2b_final(&s, seg + k * x);
+    }
+    return 0;
+  }
+
+  sha512_t s;
+  uint8_t kp[8];
+
+  // Step 1.a
+  for (int k = 0; k < n; k++)
+  {
+    put_be32(kp, (uint32_t) k);
+    put_be32(kp + 4, p);
+    sha512_init(&s);
+    sha512_update(&s, kp, 8);
+    sha512_update(&s, I, I_len);
+    sha512_final(&s, seg + k * x, x);
+  }
+
+  // Step 1.b
+  for (uint64_t k = n; k < l; k++)
+  {
+    phis_one(seed_to_int(seg + (k - 1) * x), k, n, deps);
+    sha512_init(&s);
+    for (int d = 0; d < n; d++)
+      sha512_update(&s, seg + deps[d] * x, x);
+    sha512_update(&s, I, I_len);
+    sha512_final(&s, seg + k * x, x);
+  }
+
+  return 0;
+}
+
+/*
+ * phis(seeds[c], ks[c], n) for c in [0, count), into out[c*n .. c*n+n-1]
+ * seeds are count 4-byte strings, packed
+ * return 0, or -1 on invalid n
+ */
+int itsuku_phis(const uint8_t *seeds, const uint64_t *ks, size_t count,
+                int n, uint64_t *out)
+{
+  if (n < 1 || n > PHI_K_LEN)
+    return -1;
+  for (size_t c = 0; c < count; c++)
+    phis_one(seed_to_int(seeds + 4 * c), ks[c], n, out + c * n);
+  return 0;
+}
@@ -1,3 +1,5 @@
+import os
+import json
 import pytest
 from itsuku import *
 from opening import openingForOneArray
@@ -53,6 +55,25 @@ def test_H():
 
 
 
+def test_hasher():
+    I = os.urandom(64)
+    hs = hasher(I)
+    # contexts are reused per challenge
+    assert hasher(I) is hs
+    a, b = os.urandom(64), os.urandom(32)
+    for size in [1, 16, 64]:
+        assert hs.direct(size, 3, 1) == H(size, int_to_4bytes(1) + int_to_4bytes(3) + I)
+        assert hs.indirect(size, [a, b]) == H(size, a + b + I)
+        assert hs.leaf(size, a) == H(size, a + I)
+        assert hs.node(size, a, b) == H(size, a + b + I)
+    # xor with padding on both sides
+    for v in [a, b, b'', b'\x01' * 100]:
+        assert hs.xor_I(v) == xor(v, I)
+    with pytest.raises(Exception):
+        Hasher(I, 'md5')
+    with pytest.raises(Exception):
+        Hasher(I, F='md5')
+
 def test_int_to_4bytes():
     # it should always return a 4 bytes string
     assert len(int_to_4bytes(0)) == 4
@@ -109,6 +130,32 @@ def test_build_X():
                     # asserting the validity of the constructed item
                     assert X[p*l+i] == H(x, hash_input + I)
 
+def test_F_blake2b():
+    from hashlib import blake2b
+    I = os.urandom(64)
+    Ib = blake2b(I).digest()
+    T, l, n, x = 2**6, 2**4, 4, 24
+    X = build_X(I, T, l, n, x, F='blake2b')
+    assert X != build_X(I, T, l, n, x)
+    for p in range(T // l):
+        for k in range(l):
+            if k < n:
+                data = int_to_4bytes(k) + int_to_4bytes(p)
+            else:
+                deps = phis(X[p*l+k-1][:4], k, n)
+                s = sum(int.from_bytes(X[p*l+j], 'little') for j in deps)
+                data = (s % 2**(8*x)).to_bytes(x, 'little')
+            # a single BLAKE2b block
+            assert len(data + Ib) <= 128
+            assert X[p*l+k] == blake2b(data + Ib, digest_size=x).digest()
+
+    # proofs are bound to F
+    T, l, n, x, M, L, S = 2**5, 2**4, 3, 8, 8, 6, 8
+    d = b'\x7f' + b'\xff' * (S-1)
+    pow, Omega, cnt = solvePoW(I, T, l, n, M, L, S, x, d, F='blake2b')
+    assert checkPoW(I, T, l, n, M, L, S, x, d, pow, F='blake2b') == (True, Omega)
+    assert checkPoW(I, T, l, n, M, L, S, x, d, pow)[1] != Omega
+
 def test_build_MT():
     M = 64
     x = 32
@@ -144,6 +191,54 @@ def test_build_MT():
             for j in range((2**i)-1, (2**(i-1))-2):
                 assert MT0[i] == value
 
+def test_build_X_MT(monkeypatch):
+    import native
+    M = 16
+    I = os.urandom(M)
+    for T in [1, 2**3, 2**6]:
+        for l in [t for t in [1, 2**2, 2**3, 2**6] if t <= T]:
+            for n in range(1, min(4, l) + 1):
+                X = build_X(I, T, l, n, 8)
+                MT = build_MT(I, X, M)
+                # with the native builder if available, on several threads
+                assert build_X_MT(I, T, l, n, 8, M, threads=2) == (X, MT)
+                # and with the python one
+                with monkeypatch.context() as m:
+                    m.setattr(native, 'lib', None)
+                    assert build_X_MT(I, T, l, n, 8, M) == (X, MT)
+
+def test_PartialMT():
+    from stats import Stats
+    from estimate import mt_levels, mt_memory
+    M = 16
+    I = os.urandom(M)
+    T, l, n = 2**6, 2**4, 3
+    X = build_X(I, T, l, n, 8)
+    MT = build_MT(I, X, M)
+    for levels in [1, 3, 7, 8]:
+        nX, B = build_X_MT(I, T, l, n, 8, M, levels=levels)
+        assert nX == X and len(B) == len(MT)
+        assert len(B.top) == min(2*T-1, 2**levels - 1)
+        assert [ B[i] for i in range(2*T-1) ] == MT
+        with pytest.raises(IndexError):
+            B[2*T-1]
+    # recomputing a node costs its subtree
+    nX, B = build_X_MT(I, T, l, n, 8, M, levels=2)
+    stats = Stats()
+    with instrument(stats):
+        assert B[3] == MT[3]
+    assert stats.hashes['leaf'] == T // 4 and stats.hashes['node'] == T // 4 - 1
+    # levels from a memory budget
+    assert mt_levels(T, M, 0) == 1
+    assert mt_levels(T, M, mt_memory(T, M, 5)) == 5
+    assert mt_levels(T, M, mt_memory(T, M, 5) - 1) == 4
+    assert mt_levels(T, M, 2**30) == 7
+    # same proofs
+    L, S, x = 6, 8, 8
+    d = b'\x7f' + b'\xff' * (S-1)
+    pow, Omega, cnt = solvePoW(I, T, l, n, M, L, S, x, d, mt_memory=mt_memory(T, M, 3))
+    assert checkPoW(I, T, l, n, M, L, S, x, d, pow) == (True, Omega)
+
 @pytest.mark.skip(reason="to be filled")
 def test_rebuild_MT():
     return None
@@ -346,7 +441,8 @@ def test_build_rZ():
                 if k >= T-1:
                     assert Z[k] == H( M, X[k-(T-1)]+I )
 
-            assert set(Z.keys()) == set(opening(T, get_provided_indexes(round_L, T, l, n)))
+            provided = get_provided_indexes(round_L, T, l, n)
+            assert set(Z.keys()) == set(openingForOneArray(T, provided))
 
 def clean_Z():
     Z = { 5: b'\x00', 8: b'\xfe', 14: b'\xa4' }
@@ -405,9 +501,89 @@ def test_importPoW():
 def test_solvePoW():
     return None
 
-@pytest.mark.skip(reason="to be filled")
 def test_checkPoW():
-    return None
+    I = os.urandom(16)
+    T, l, n, x, M, L, S = 2**5, 2**4, 3, 8, 8, 6, 8
+    d = b'\x7f' + b'\xff' * (S-1)
+    pow, Omega, cnt = solvePoW(I, T, l, n, M, L, S, x, d)
+    assert checkPoW(I, T, l, n, M, L, S, x, d, pow) == (True, Omega)
+    N, rL, rZ = importPoW(pow)
+    assert validatePoW(T, l, n, M, L, x, N, rL, rZ) <= hash_limit(T, L, n)
+    assert len(pow) <= proof_size_limit(T, L, n, x, M)
+
+    def reason(proof, **kwargs):
+        with pytest.raises(ProofError) as e:
+            checkPoW(I, T, l, n, M, L, S, x, d, proof, strict=True, **kwargs)
+        assert checkPoW(I, T, l, n, M, L, S, x, d, proof, **kwargs) == (False, None)
+        return e.value.reason
+
+    def changed(f):
+        N, rL, rZ = importPoW(pow)
+        r = f(N, rL, rZ)
+        if type(r) is tuple:
+            N, rL, rZ = r
+        return exportPoW(N, rL, rZ)
+
+    i = next(i for i in rL if i % l >= n)
+    assert reason('not json') == ProofError.MALFORMED
+    assert reason('{"N": "00", "L": []}') == ProofError.MALFORMED
+    assert reason(pow, max_size=len(pow)-1) == ProofError.TOO_LARGE
+    assert reason(pow, max_hashes=1) == ProofError.OVER_BUDGET
+    assert reason(changed(lambda N, rL, rZ: (b'\x00' * 65, rL, rZ))) == ProofError.BAD_NONCE
+    assert reason(changed(lambda N, rL, rZ: (N, {}, rZ))) == ProofError.BAD_COUNT
+    assert reason(changed(lambda N, rL, rZ: (N, dict(rL, **{ str(T+j): [] for j in range(L) }), rZ))) \
+        == ProofError.BAD_COUNT
+    assert reason(changed(lambda N, rL, rZ: rL.update({i + T: rL.pop(i)}))) == ProofError.BAD_INDEX
+    assert reason(changed(lambda N, rL, rZ: rL[i].pop())) == ProofError.BAD_ANTECEDENTS
+    assert reason(changed(lambda N, rL, rZ: rL[i].append(rL[i][0][:4]) or rL[i].pop(0))) \
+        == ProofError.BAD_SIZE
+    assert reason(changed(lambda N, rL, rZ: rZ.pop(min(rZ)))) == ProofError.BAD_OPENING
+    assert reason(changed(lambda N, rL, rZ: rZ.update({0: b'\x00' * M}))) == ProofError.BAD_INDEX
+    assert reason(changed(lambda N, rL, rZ: rZ.update({ j: v + b'\x00' for j, v in rZ.items() }))) \
+        == ProofError.BAD_SIZE
+
+    # consistent shape, but wrong values: hashing is needed to reject it
+    def tweak(N, rL, rZ):
+        rL[i][-1] = bytes([rL[i][-1][0] ^ 1]) + rL[i][-1][1:]
+    ok, nOmega = checkPoW(I, T, l, n, M, L, S, x, d, changed(tweak))
+    assert nOmega != Omega
+
+def test_Challenge():
+    from stats import Stats
+    I = os.urandom(16)
+    T, l, n, x, M, L, S = 2**5, 2**3, 3, 8, 8, 9, 8
+    d = b'\x7f' + b'\xff' * (S-1)
+    ch = Challenge(I, T, l, n, M, L, S, x, d)
+    assert ch.params() == (I, T, l, n, M, L, S, x, d) and ch.P == T // l
+    with pytest.raises(AttributeError):
+        ch.T = 2**6
+    # shared by the positional entry points
+    assert challenge(I, T, l, n, M, L, S, x, d) is challenge(*ch.params())
+    proofs = [ ch.solve() for k in range(8) ]
+    for pow, Omega, cnt in proofs:
+        assert checkPoW(I, T, l, n, M, L, S, x, d, pow) == (True, Omega)
+    # direct elements are computed once per challenge
+    ch = Challenge(I, T, l, n, M, L, S, x, d)
+    stats = Stats()
+    for pow, Omega, cnt in proofs:
+        assert ch.check(pow, stats=stats) == (True, Omega)
+    assert stats.hashes['direct'] == len(ch._direct) <= n * ch.P
+    stats = Stats()
+    for pow, Omega, cnt in proofs:
+        assert ch.check(pow, stats=stats) == (True, Omega)
+    assert stats.hashes['direct'] == 0
+    for k, v in ch._direct.items():
+        assert v == build_X(I, T, l, n, x)[k]
+    # validated once
+    for bad in [(I, T, 3, n, M, L, S, x, d), (I, T, l, 12, M, L, S, x, d),
+                (I, T, l, n, M, L, S, x, d[1:]), (I.hex(), T, l, n, M, L, S, x, d)]:
+        with pytest.raises(Exception):
+            Challenge(*bad)
+    # an unreachable difficulty can be checked, but not solved
+    ch = Challenge(I, T, l, n, M, L, S, x, b'\x00' * S)
+    assert ch.check(proofs[0][0]) == (False, proofs[0][1])
+    with pytest.raises(Exception):
+        ch.solve()
 
 @pytest.mark.skip(reason="to merge with other tests")
 def test_PoW():
@@ -519,3 +695,98 @@ def test_PoW():
             assert is_PoW_solved(d, OMEGA, S=S) == True
             # 2. The keys of round_L correspond the i that has been computed by compute_Y
             assert set(computed_i) == set(round_L.keys())
+
+def test_import():
+    # no work and no optional module loaded at import time
+    import sys, subprocess
+    from import_bench import loaded
+    assert loaded('itsuku') == []
+    code = "import itsuku; print(hasattr(itsuku, 'I'))"
+    out = subprocess.run([sys.executable, '-c', code], check=True,
+                         capture_output=True, text=True).stdout
+    assert out.strip() == 'False'
+
+# chi-square statistic of counts against a uniform law
+def chi2(counts):
+    e = sum(counts) / len(counts)
+    return sum((c - e) ** 2 / e for c in counts)
+
+def test_indexer():
+    from hashlib import sha512
+    Ys = [ sha512(b'%d' % k).digest() for k in range(2**15) ]
+    for T in [2**8, 1000]:
+        for version in INDEX_VERSIONS:
+            f = indexer(T, version)
+            counts = [0] * T
+            for y in Ys:
+                counts[f(y)] += 1
+            # within 6 standard deviations of T-1
+            assert chi2(counts) < T - 1 + 6 * (2 * (T - 1)) ** 0.5, (T, version)
+    # version 0 is the full modulo
+    assert all(indexer(1000, 0)(y) == int.from_bytes(y, 'big') % 1000
+               for y in Ys[:100])
+    # version 1: masked prefix, or multiply-shift
+    y = bytes(range(1, 65))
+    assert indexer(2**8, 1)(y) == 8
+    assert indexer(2**8, 1, 'little')(y) == 1
+    assert indexer(1000, 1)(y) == (0x0102030405060708 * 1000) >> 64
+    assert indexer(1000, 1)(b'\xff' * 64) == 999
+    assert indexer(1000, 1)(b'\x80') == 500
+    assert indexer(2**8, 1)(b'\x01\x02') == 2
+    with pytest.raises(Exception):
+        indexer(T, 2)
+
+def test_index_versions():
+    from search import search_batch
+    I = os.urandom(16)
+    # with a power of 2 T, version 1 takes the last bits of the 8 bytes
+    # prefix of Y, ie of its 8th byte for T = 2**6
+    T, l, n, x, M, L, S = 2**6, 2**4, 3, 8, 8, 6, 16
+    d = b'\x7f' + b'\xff' * (S-1)
+    X, B = build_X_MT(I, T, l, n, x, M)
+    nonces = [ os.urandom(8) for k in range(20) ]
+    for version in INDEX_VERSIONS:
+        res = [ compute_Y(I, X, T, L, S, N, B[0], index=version)[1:]
+                for N in nonces ]
+        assert search_batch(I, X, T, L, S, B[0], nonces, index=version) == res
+    N = nonces[0]
+    assert compute_Y(I, X, T, L, S, N, B[0], index=1)[2] == \
+        [ y[7] % T for y in compute_Y(I, X, T, L, S, N, B[0], index=1)[0][:L] ]
+    pow, Omega, cnt = solvePoW(I, T, l, n, M, L, S, x, d, index=1)
+    assert json.loads(pow)['V'] == 1
+    assert 'V' not in json.loads(solvePoW(I, T, l, n, M, L, S, x, d)[0])
+    assert checkPoW(I, T, l, n, M, L, S, x, d, pow) == (True, Omega)
+    assert checkPoW(I, T, l, n, M, L, S, x, d, pow, index=1) == (True, Omega)
+    pow, Omega, cnt = solvePoW(I, T, l, n, M, L, S, x, d, batch=4, index=1)
+    assert checkPoW(I, T, l, n, M, L, S, x, d, pow, index=1) == (True, Omega)
+
+    def reason(proof, **kwargs):
+        with pytest.raises(ProofError) as e:
+            checkPoW(I, T, l, n, M, L, S, x, d, proof, strict=True, **kwargs)
+        return e.value.reason
+    assert reason(pow, index=0) == ProofError.BAD_VERSION
+    data = json.loads(pow)
+    for V in [2, '1', True, None]:
+        assert reason(json.dumps(dict(data, V=V))) == ProofError.BAD_VERSION
+    # the version is bound to the proof
+    data['V'] = 0
+    assert checkPoW(I, T, l, n, M, L, S, x, d, json.dumps(data)) != \
+        (True, Omega)
+    with pytest.raises(Exception):
+        solvePoW(I, T, l, n, M, L, S, x, d, index=2)
+
+def test_checkPoW_bad_params():
+    from stats import Stats
+    I = os.urandom(16)
+    T, l, n, x, M, L, S = 2**5, 2**4, 3, 8, 8, 6, 8
+    d = b'\x7f' + b'\xff' * (S-1)
+    pow, Omega, cnt = solvePoW(I, T, l, n, M, L, S, x, d)
+    stats = Stats()
+    assert checkPoW(I, 48, l, n, M, L, S, x, d, pow, stats=stats) == (False, None)
+    assert checkPoW(I, T, l, n, M, L, S, x, b'\x00', pow) == (False, None)
+    assert dict(stats.rejections) == { ProofError.BAD_PARAMS: 1 }
+    with pytest.raises(ProofError) as e:
+        checkPoW(I, T, l, n, M, L, S, 100, d, pow, strict=True)
+    assert e.value.reason == ProofError.BAD_PARAMS
+    with pytest.raises(ParamError):
+        Challenge(I, T, 7, n, M, L, S, x, d)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+# known-answer vectors and differential harness
+#
+# Vectors are deterministic: I and the nonces are derived from the vector
+# number, over parameter sets covering all n up to len(PHI_K), odd sizes,
+# both F and all index versions. kat.json holds the reference answers (digests of X and B,
+# Y, Omega and selected indexes per nonce, and the exported proof), so that
+# a change of the reference itself is detected, and other implementations
+# can be checked without python.
+#
+# An engine is a set of functions with the reference signatures:
+#   build_X(I, T, l, n, x, F), build_MT(I, X, M),
+#   build_X_MT(I, T, l, n, x, M, F) -> (X, B),
+#   compute_Y(I, X, T, L, S, N, Psi, index) -> (Y, Omega, i), Y may be None
+# registered with register(name, **functions). differential() runs it on
+# the vectors against the reference and reports the first divergence.
+#
+# usage: kat.py generate [file]
+#        kat.py check [file]           reference against the corpus
+#        kat.py diff [engine...]       engines against the reference
+
+import os
+import sys
+import json
+from hashlib import sha512
+
+import itsuku
+from itsuku import PHI_K, build_X, build_MT, build_X_MT, compute_Y, \
+    build_rL, build_rZ, exportPoW
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kat.json')
+
+# (T, l, n, x, M, L, S, F, V), V being the index version
+PARAMS = \
+    [ (2**6, 2**4, n, 64, 64, 9, 64, 'H', 0) for n in range(1, len(PHI_K) + 1) ] + \
+    [ (2**5, 2**5, 4, 4, 4, 5, 4, 'H', 0), (2**7, 2**3, 3, 17, 13, 12, 19, 'H', 0),
+      (2**8, 2**8, 2, 32, 16, 30, 32, 'H', 0), (1, 1, 1, 8, 8, 3, 8, 'H', 0) ] + \
+    [ (2**6, 2**4, n, 64, 64, 9, 64, 'blake2b', 0) for n in [1, 4, len(PHI_K)] ] + \
+    [ (2**7, 2**3, 3, 17, 13, 12, 19, 'blake2b', 0) ] + \
+    [ (2**6, 2**4, 4, 64, 64, 9, 64, 'H', 1), (2**5, 2**5, 4, 4, 4, 5, 4, 'H', 1),
+      (2**7, 2**3, 3, 17, 13, 12, 19, 'H', 1), (1, 1, 1, 8, 8, 3, 8, 'H', 1),
+      (2**8, 2**8, 2, 32, 16, 30, 32, 'blake2b', 1) ]
+
+# number of nonces per vector
+NONCES = 4
+
+def _derive(label, k, size):
+    return sha512(b'itsuku kat %s %d' % (label, k)).digest()[:size]
+
+def _digest(values):
+    return sha512(b''.join(values)).hexdigest()
+
+# inputs of vector k
+def inputs(k):
+    T, l, n, x, M, L, S, F, V = PARAMS[k]
+    I = _derive(b'I', k, 64 if k % 2 == 0 else 16)
+    nonces = [ _derive(b'N', k * NONCES + j, 8) for j in range(NONCES) ]
+    return dict(k=k, I=I, T=T, l=l, n=n, x=x, M=M, L=L, S=S, F=F, V=V,
+                nonces=nonces)
+
+# reference answers of vector k
+def answer(k):
+    v = inputs(k)
+    I, T, l, n, x, M, L, S, F, V = \
+        (v[p] for p in ['I', 'T', 'l', 'n', 'x', 'M', 'L', 'S', 'F', 'V'])
+    X = build_X(I, T, l, n, x, F)
+    B = build_MT(I, X, M)
+    Ys = [ compute_Y(I, X, T, L, S, N, B[0], index=V) for N in v['nonces'] ]
+    # the proof of the first nonce, whatever its Omega
+    rL = build_rL(Ys[0][2], X, l, n)
+    proof = exportPoW(v['nonces'][0], rL, build_rZ(rL, B, T, l, n), V)
+    return dict(
+        params=dict(T=T, l=l, n=n, x=x, M=M, L=L, S=S, F=F, V=V),
+        I=I.hex(), nonces=[ N.hex() for N in v['nonces'] ],
+        X=_digest(X), X_first=X[0].hex(), X_last=X[-1].hex(),
+        B=_digest(B), Psi=B[0].hex(),
+        Y=[ { 'Y': _digest(Y), 'Omega': Omega.hex(), 'i': i }
+            for Y, Omega, i in Ys ],
+        proof=proof)
+
+def generate():
+    return [ answer(k) for k in range(len(PARAMS)) ]
+
+def write(path=CORPUS):
+    with open(path, 'w') as f:
+        json.dump(generate(), f, indent=1)
+        f.write('\n')
+
+def load(path=CORPUS):
+    with open(path) as f:
+        return json.load(f)
+
+# differences between the reference and the corpus, as strings
+def check(path=CORPUS):
+    corpus = load(path)
+    errors = []
+    if len(corpus) != len(PARAMS):
+        errors.append("corpus has %d vectors instead of %d" %
+                      (len(corpus), len(PARAMS)))
+    for k, expected in enumerate(corpus[:len(PARAMS)]):
+        got = answer(k)
+        for key in expected:
+            if got[key] != expected[key]:
+                errors.append("vector %d: %s differs" % (k, key))
+    return errors
+
+##
+## differential harness
+##
+
+ENGINES = {}
+
+OPS = ['build_X', 'build_MT', 'build_X_MT', 'compute_Y']
+
+def register(name, **functions):
+    unknown = set(functions) - set(OPS)
+    assert not unknown, "unexpected operations: %s" % sorted(unknown)
+    ENGINES[name] = functions
+
+# first differing element of two sequences, or None
+def _first(ref, got):
+    if len(ref) != len(got):
+        return "length %d instead of %d" % (len(got), len(ref))
+    for i, (a, b) in enumerate(zip(ref, got)):
+        if a != b:
+            return "[%d] is %s instead of %s" % \
+                (i, b.hex() if type(b) is bytes else b,
+                 a.hex() if type(a) is bytes else a)
+    return None
+
+# run engine on vectors (default all), return the first divergence as a
+# string, or None if it agrees with the reference
+def differential(engine, vectors=None):
+    ops = ENGINES[engine] if type(engine) is str else engine
+    for k in (range(len(PARAMS)) if vectors is None else vectors):
+        v = inputs(k)
+        I, T, l, n, x, M, L, S, F, V = \
+            (v[p] for p in ['I', 'T', 'l', 'n', 'x', 'M', 'L', 'S', 'F', 'V'])
+        where = "vector %d %s" % (k, PARAMS[k])
+        X = build_X(I, T, l, n, x, F)
+        B = build_MT(I, X, M)
+        checks = []
+        if 'build_X' in ops:
+            checks.append(('build_X', X, ops['build_X'](I, T, l, n, x, F)))
+        if 'build_MT' in ops:
+            checks.append(('build_MT', B, ops['build_MT'](I, X, M)))
+        if 'build_X_MT' in ops:
+            nX, nB = ops['build_X_MT'](I, T, l, n, x, M, F)
+            checks += [ ('build_X_MT X', X, nX),
+                        ('build_X_MT B', B, [ nB[i] for i in range(len(nB)) ]) ]
+        if 'compute_Y' in ops:
+            for N in v['nonces']:
+                Y, Omega, i = compute_Y(I, X, T, L, S, N, B[0], index=V)
+                nY, nOmega, ni = ops['compute_Y'](I, X, T, L, S, N, B[0], V)
+                if nY is not None:
+                    checks.append(('compute_Y Y', Y, nY))
+                checks += [ ('compute_Y Omega', [Omega], [nOmega]),
+                            ('compute_Y i', i, ni) ]
+        for op, ref, got in checks:
+            diff = _first(ref, got)
+            if diff is not None:
+                return "%s: %s %s" % (where, op, diff)
+    return None
+
+# engines of this tree
+
+def _native_build_X(I, T, l, n, x, F):
+    import native
+    if native.lib is None:
+        raise Exception("native accelerator not available")
+    return native.build_X(I, T, l, n, x, 2, F)
+
+def _search_Y(I, X, T, L, S, N, Psi, index):
+    from search import search_batch
+    # the batch search does not return Y
+    [(Omega, i)] = search_batch(I, X, T, L, S, Psi, [N], index=index)
+    return None, Omega, i
+
+register('native', build_X=_native_build_X)
+register('fast', build_X=lambda I, T, l, n, x, F:
+         itsuku.fast_build_X(I, T, l, n, x, F=F))
+register('fused', build_X_MT=lambda I, T, l, n, x, M, F:
+         build_X_MT(I, T, l, n, x, M, F=F))
+register('partial', build_X_MT=lambda I, T, l, n, x, M, F:
+         build_X_MT(I, T, l, n, x, M, F=F, levels=3))
+register('search', compute_Y=_search_Y)
+
+def main(argv):
+    cmd = argv[0] if argv else 'check'
+    if cmd == 'generate':
+        write(argv[1] if len(argv) > 1 else CORPUS)
+    elif cmd == 'check':
+        errors = check(argv[1] if len(argv) > 1 else CORPUS)
+        for e in errors:
+            print(e)
+        return 1 if errors else 0
+    elif cmd == 'diff':
+        failed = 0
+        for name in argv[1:] or sorted(ENGINES):
+            diff = differential(name)
+            print("%s: %s" % (name, diff or "ok"))
+            failed += diff is not None
+        return 1 if failed else 0
+    else:
+        print("usage: kat.py generate|check [file] | diff [engine...]",
+              file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,52 @@
+import pytest
+import kat
+from itsuku import PHI_K, INDEX_VERSIONS
+
+def test_corpus():
+    # the reference still gives the recorded answers
+    assert kat.check() == []
+
+def test_params():
+    ns = set(p[2] for p in kat.PARAMS)
+    assert ns == set(range(1, len(PHI_K) + 1))
+    assert set(p[7] for p in kat.PARAMS) == {'H', 'blake2b'}
+    assert set(p[8] for p in kat.PARAMS) == set(INDEX_VERSIONS)
+
+def test_inputs():
+    assert kat.inputs(3) == kat.inputs(3)
+    assert kat.inputs(3)['I'] != kat.inputs(4)['I']
+    assert len(set(kat.inputs(3)['nonces'])) == kat.NONCES
+
+def test_index_vectors():
+    # the proofs of index version 1 vectors record it
+    import json
+    for k, v in enumerate(kat.load()):
+        assert json.loads(v['proof']).get('V', 0) == kat.PARAMS[k][8]
+
+def test_check_detects(tmp_path):
+    corpus = kat.load()
+    corpus[2]['Y'][1]['i'] = corpus[2]['Y'][1]['i'][::-1]
+    corpus[5]['X'] = '00' * 64
+    path = str(tmp_path / 'kat.json')
+    import json
+    with open(path, 'w') as f:
+        json.dump(corpus, f)
+    assert kat.check(path) == ["vector 2: Y differs", "vector 5: X differs"]
+
+def test_differential_reports_first():
+    import itsuku
+    def build_X(I, T, l, n, x, F):
+        X = itsuku.build_X(I, T, l, n, x, F)
+        if T > 1:
+            X[T // 2] = bytes(x)
+        return X
+    diff = kat.differential({ 'build_X': build_X }, vectors=[0, 1])
+    assert diff.startswith("vector 0 ")
+    assert "build_X [32] is " + "00" * 64 + " instead of " in diff
+
+@pytest.mark.parametrize('engine', sorted(kat.ENGINES))
+def test_engines(engine, request):
+    # the accelerator built in a temporary directory, see conftest.py
+    if engine == 'native':
+        request.getfixturevalue('lib')
+    assert kat.differential(engine) is None
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+# optional native accelerator, compiled from itsuku_native.c
+#
+# "make native" (or native.build()) compiles _itsuku_native.so next to this
+# file, which is then loaded with ctypes at import. lib is None if it is not
+# available, in which case callers must use the Python reference.
+# Set ITSUKU_NATIVE=0 in the environment to ignore the library.
+
+import os
+import ctypes
+from ctypes import c_int, c_size_t, c_uint32, c_uint64, c_char_p, c_void_p, POINTER
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join(_DIR, 'itsuku_native.c')
+LIBRARY = os.path.join(_DIR, '_itsuku_native.so')
+
+# must match ITSUKU_NATIVE_VERSION in itsuku_native.c
+VERSION = 3
+
+# compile the library with the C compiler into path, then (re)load it
+def build(cc=None, path=LIBRARY):
+    import subprocess
+    cc = cc or os.environ.get('CC', 'cc')
+    subprocess.run([cc, '-O3', '-shared', '-fPIC', '-o', path, SOURCE],
+                   check=True)
+    return load(path)
+
+def _declare(lib):
+    lib.itsuku_native_version.argtypes = []
+    lib.itsuku_native_version.restype = c_int
+    lib.itsuku_phi.argtypes = [c_uint32, c_uint64]
+    lib.itsuku_phi.restype = c_uint64
+    lib.itsuku_phis.argtypes = \
+        [c_char_p, POINTER(c_uint64), c_size_t, c_int, POINTER(c_uint64)]
+    lib.itsuku_phis.restype = c_int
+    lib.itsuku_sha512.argtypes = [c_char_p, c_size_t, c_void_p, c_size_t]
+    lib.itsuku_sha512.restype = None
+    lib.itsuku_blake2b.argtypes = [c_char_p, c_size_t, c_void_p, c_size_t]
+    lib.itsuku_blake2b.restype = None
+    lib.itsuku_build_segment.argtypes = \
+        [c_char_p, c_size_t, c_uint32, c_uint64, c_int, c_size_t, c_int, c_void_p]
+    lib.itsuku_build_segment.restype = c_int
+
+# load the library at path if present and up to date, else return None
+def load(path=LIBRARY):
+    global lib
+    lib = None
+    if os.environ.get('ITSUKU_NATIVE', '1') == '0' or \
+       not os.path.exists(path):
+        return None
+    try:
+        l = ctypes.CDLL(path)
+        l.itsuku_native_version.restype = c_int
+        if l.itsuku_native_version() != VERSION:
+            # stale build, ignore it
+            return None
+        _declare(l)
+    except (OSError, AttributeError):
+        return None
+    lib = l
+    return lib
+
+lib = load()
+
+# phi(seed, i) with a 4 bytes seed
+def phi(seed, i):
+    assert type(seed) == bytes and len(seed) == 4
+    if not 0 <= i < 2**64:
+        raise Exception("invalid index i=%d" % i)
+    return lib.itsuku_phi(int.from_bytes(seed, 'big'), i)
+
+# [ phis(seeds[c], ks[c], n) for c in range(len(ks)) ]
+def phis_bulk(seeds, ks, n):
+    count = len(ks)
+    assert len(seeds) == count
+    data = b''.join(seeds)
+    assert len(data) == 4 * count, "seeds must be 4 bytes long"
+    for k in ks:
+        if not 0 <= k < 2**32:
+            raise Exception("invalid index k=%d" % k)
+    out = (c_uint64 * (count * n))()
+    if lib.itsuku_phis(data, (c_uint64 * count)(*ks), count, n, out) != 0:
+        raise Exception("unexpected number of dependencies: %d" % n)
+    out = list(out)
+    return [ out[c*n:(c+1)*n] for c in range(count) ]
+
+# sha512(data).digest()[:size]
+def sha512(data, size=64):
+    assert 0 <= size <= 64
+    out = ctypes.create_string_buffer(size)
+    lib.itsuku_sha512(data, len(data), out, size)
+    return out.raw
+
+# blake2b(data, digest_size=size).digest()
+def blake2b(data, size=64):
+    assert 1 <= size <= 64
+    out = ctypes.create_string_buffer(size)
+    lib.itsuku_blake2b(data, len(data), out, size)
+    return out.raw
+
+# itsuku.F_METHODS, as passed to itsuku_build_segment
+_F = { 'H': 0, 'blake2b': 1 }
+
+# ctypes view of buf[offset:offset+size], for a writable buffer (bytearray, mmap...)
+def _view(buf, offset, size):
+    assert 0 <= offset and offset + size <= len(buf)
+    return (ctypes.c_char * size).from_buffer(buf, offset)
+
+# build segment p of X, l elements of x bytes, into buf[offset:offset+l*x]
+# the GIL is released during the computation, so that several threads
+# may build distinct segments concurrently
+def build_segment(I, p, l, n, x, buf, offset=0, F='H'):
+    # p is a 4 bytes integer, as packed by the Python reference
+    if not 0 <= p < 2**32:
+        raise Exception("invalid segment index p=%d" % p)
+    seg = _view(buf, offset, l * x)
+    if lib.itsuku_build_segment(I, len(I), p, l, n, x, _F[F],
+                                ctypes.addressof(seg)) != 0:
+        raise Exception("invalid segment parameters l=%d n=%d x=%d" % (l, n, x))
+
+# segment p of X as a list of l elements
+def X_segment(I, p, l, n, x, F='H'):
+    buf = bytearray(l * x)
+    build_segment(I, p, l, n, x, buf, 0, F)
+    buf = memoryview(buf)
+    return [ buf[k*x:(k+1)*x].tobytes() for k in range(l) ]
+
+# build X as a flat buffer of T*x bytes, segments being run on threads
+def build_X_buffer(I, T, l, n, x, threads=None, buf=None, F='H'):
+    P = T // l
+    assert P * l == T, "T must be a multiple of l"
+    if buf is None:
+        buf = bytearray(T * x)
+    assert len(buf) >= T * x
+    threads = min(threads or os.cpu_count() or 1, P)
+    if threads <= 1:
+        for p in range(P):
+            build_segment(I, p, l, n, x, buf, p * l * x, F)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(threads) as pool:
+            # list() to propagate exceptions
+            list(pool.map(lambda p: build_segment(I, p, l, n, x, buf,
+                                                  p * l * x, F),
+                          range(P)))
+    return buf
+
+# same as itsuku.build_X
+def build_X(I, T, l, n, x, threads=None, F='H'):
+    buf = memoryview(build_X_buffer(I, T, l, n, x, threads, F=F))
+    return [ buf[i*x:(i+1)*x].tobytes() for i in range(T) ]
@@ -0,0 +1,93 @@
+import pytest
+import os
+import random
+import native
+import itsuku
+from itsuku import phi, phis, PHI_K, _phis_bulk
+
+# lib (see conftest.py) loads the accelerator built in a temporary directory
+
+def random_seeds(count):
+    return [ os.urandom(4) for c in range(count) ] + \
+        [ b'\x00' * 4, b'\xff' * 4, b'\x80\x00\x00\x00', b'\x00\x00\x00\x01' ]
+
+def test_native_phi(lib):
+    seeds = random_seeds(200)
+    for seed in seeds:
+        for i in [1, 2, 3, 1000, 2**15, 2**25, 2**32 - 1, 2**32]:
+            assert native.phi(seed, i) == phi(seed, i)
+            assert 0 <= native.phi(seed, i) < i
+
+def test_native_phis_bulk(lib):
+    seeds = random_seeds(500)
+    ks = [ random.randrange(1, 2**32) for s in seeds ]
+    for n in range(1, len(PHI_K) + 1):
+        assert native.phis_bulk(seeds, ks, n) == _phis_bulk(seeds, ks, n)
+    assert native.phis_bulk([], [], 4) == []
+    with pytest.raises(Exception):
+        native.phis_bulk(seeds, ks, len(PHI_K) + 1)
+    with pytest.raises(AssertionError):
+        native.phis_bulk([b'\x00' * 3], [4], 4)
+    # indexes do not wrap around the 32 bits of the C parameter
+    for k in [-1, 2**32, 2**33, 2**40]:
+        with pytest.raises(Exception):
+            native.phis_bulk([b'\xff' * 4], [k], len(PHI_K))
+
+def test_phis_bulk():
+    # whichever implementation is selected, it matches phis
+    seeds = random_seeds(50)
+    ks = [ random.randrange(1, 2**20) for s in seeds ]
+    for n in [1, 4, len(PHI_K)]:
+        assert itsuku.phis_bulk(seeds, ks, n) == \
+            [ phis(s, k, n) for s, k in zip(seeds, ks) ]
+
+def test_native_sha512(lib):
+    from hashlib import sha512
+    # around block and padding boundaries
+    for size in [0, 1, 111, 112, 113, 127, 128, 129, 255, 256, 1000]:
+        data = os.urandom(size)
+        assert native.sha512(data) == sha512(data).digest()
+        assert native.sha512(data, 13) == sha512(data).digest()[:13]
+
+def test_native_blake2b(lib):
+    from hashlib import blake2b
+    for size in [0, 1, 72, 127, 128, 129, 256, 1000]:
+        data = os.urandom(size)
+        assert native.blake2b(data) == blake2b(data).digest()
+        for x in [1, 4, 17, 64]:
+            assert native.blake2b(data, x) == blake2b(data, digest_size=x).digest()
+
+# differential test against the reference build_X
+def test_native_build_X(lib):
+    from itsuku import build_X, fast_build_X, F_METHODS
+    for F in F_METHODS:
+        for I in [os.urandom(64), os.urandom(7), b'']:
+            for T, l in [(2**5, 2**5), (2**6, 2**4), (2**8, 2**3)]:
+                for n in range(1, min(len(PHI_K), l) + 1):
+                    for x in [4, 17, 64]:
+                        X = build_X(I, T, l, n, x, F)
+                        assert native.build_X(I, T, l, n, x, 1, F) == X
+                        assert native.build_X(I, T, l, n, x, 3, F) == X
+                        assert fast_build_X(I, T, l, n, x, F=F) == X
+
+def test_native_build_segment(lib):
+    from itsuku import build_X
+    I = os.urandom(64)
+    T, l, n, x = 2**6, 2**4, 4, 16
+    X = build_X(I, T, l, n, x)
+    # caller provided buffer, with an offset
+    buf = bytearray(l * x + 5)
+    native.build_segment(I, 2, l, n, x, buf, 5)
+    assert bytes(buf[5:]) == b''.join(X[2*l:3*l])
+    with pytest.raises(AssertionError):
+        native.build_segment(I, 2, l, n, x, buf, 6)
+    with pytest.raises(Exception):
+        native.build_segment(I, 0, l, n, 3, bytearray(l * 3))
+    with pytest.raises(Exception):
+        native.build_segment(I, 0, l, l + 1, x, buf)
+    # segment indexes do not wrap around, as with the Python reference
+    for p in [-1, 2**32, 2**32 + 2]:
+        with pytest.raises(Exception):
+            native.build_segment(I, p, l, n, x, buf)
+        with pytest.raises(Exception):
+            itsuku._build_X_segment(itsuku.hasher(I), p, l, n, x)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+# memory placement of X and the Merkle tree, and CPU affinity
+#
+# The search reads X at random (compute_Y), so it is bound by memory
+# latency: TLB misses with 4K pages, and remote accesses on NUMA machines
+# when X was first touched by a thread of another node. A Layout builds X
+# and B as flat buffers of fixed size elements (Flat) in anonymous memory
+# advised for transparent huge pages, from a thread pinned to the CPUs of
+# one NUMA node, so that the pages are allocated on that node, and keeps
+# the solving thread pinned there. Searchers on several nodes each build
+# their own copy, eg distributed.spawn(..., layouts=[Layout(node=k)...]).
+#
+#   proof, Omega, counter = solvePoW(..., layout=Layout(node=0))
+#   distributed.work(host, port, load=Layout(node=1).load)
+#
+# Everything degrades to a no-op where not supported (no madvise, no
+# sched_setaffinity, no NUMA information): the results are the same.
+
+import os
+import mmap
+import threading
+import contextvars
+
+import itsuku
+from itsuku import hasher, _build_X_segment
+
+HUGEPAGE = getattr(mmap, 'MADV_HUGEPAGE', None)
+
+# anonymous memory of size bytes, advised for huge pages if huge
+def alloc(size, huge=True):
+    buf = mmap.mmap(-1, max(size, 1))
+    if huge and HUGEPAGE is not None and hasattr(buf, 'madvise'):
+        try:
+            buf.madvise(HUGEPAGE)
+        except OSError:
+            # transparent huge pages disabled
+            pass
+    return buf
+
+# "0-3,8,10-11" -> {0, 1, 2, 3, 8, 10, 11}
+def _cpulist(s):
+    cpus = set()
+    for part in s.strip().split(','):
+        if part:
+            low, _, high = part.partition('-')
+            cpus.update(range(int(low), int(high or low) + 1))
+    return cpus
+
+# CPUs allowed for this process, None if unknown
+def affinity():
+    if not hasattr(os, 'sched_getaffinity'):
+        return None
+    return os.sched_getaffinity(0)
+
+# { node: CPUs } of the NUMA nodes with allowed CPUs, one node 0 if unknown
+def nodes(root='/sys/devices/system/node'):
+    allowed = affinity()
+    res = {}
+    try:
+        names = os.listdir(root)
+    except OSError:
+        names = []
+    for name in names:
+        if not name.startswith('node') or not name[4:].isdigit():
+            continue
+        try:
+            with open(os.path.join(root, name, 'cpulist')) as f:
+                cpus = _cpulist(f.read())
+        except OSError:
+            continue
+        if allowed is not None:
+            cpus &= allowed
+        if cpus:
+            res[int(name[4:])] = cpus
+    if not res:
+        res[0] = allowed or set(range(os.cpu_count() or 1))
+    return res
+
+# restrict the calling thread to cpus (None: no change), return the previous
+# set, or None if affinity is not supported
+def pin(cpus):
+    if cpus is None or not hasattr(os, 'sched_setaffinity'):
+        return None
+    previous = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, cpus)
+    return previous
+
+# pin the calling thread for the enclosed block
+class pinned:
+
+    def __init__(self, cpus):
+        self.cpus = cpus
+
+    def __enter__(self):
+        self.previous = pin(self.cpus)
+        return self
+
+    def __exit__(self, *exc):
+        pin(self.previous)
+        return False
+
+# run f() on a new thread pinned to cpus, so that the memory it touches
+# first is allocated on their node (threads it starts inherit the affinity)
+# in the caller's context, for its instrumentation
+def _on(cpus, f):
+    res = []
+    context = contextvars.copy_context()
+    def run():
+        try:
+            with pinned(cpus):
+                res.append((True, context.run(f)))
+        except BaseException as e:
+            res.append((False, e))
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+    ok, value = res[0]
+    if not ok:
+        raise value
+    return value
+
+# count elements of size bytes in a flat buffer, as a sequence of bytes
+class Flat:
+
+    __slots__ = ('buf', 'size', 'count')
+
+    def __init__(self, buf, size, count):
+        assert len(buf) >= size * count
+        self.buf, self.size, self.count = buf, size, count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return self.buf[i*self.size:(i+1)*self.size]
+
+    def __setitem__(self, i, value):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        assert len(value) == self.size
+        self.buf[i*self.size:(i+1)*self.size] = value
+
+# copy of a sequence of elements of size bytes
+def flat(values, size, huge=True):
+    X = Flat(alloc(len(values) * size, huge), size, len(values))
+    for i, v in enumerate(values):
+        X[i] = v
+    return X
+
+# same values as itsuku.build_X, in a Flat
+def build_X_flat(I, T, l, n, x, F=itsuku.F, huge=True, threads=None):
+    import native
+    P = T // l
+    assert P * l == T, "T must be a multiple of l"
+    buf = alloc(T * x, huge)
+    if native.lib is not None:
+        native.build_X_buffer(I, T, l, n, x, threads, buf, F)
+    else:
+        hs = hasher(I, F=F)
+        for p in range(P):
+            buf[p*l*x:(p+1)*l*x] = b''.join(_build_X_segment(hs, p, l, n, x))
+    collector = itsuku.active_stats()
+    if collector is not None:
+        collector.hashes['direct'] += n * P
+        collector.hashes['indirect'] += (l - n) * P
+    return Flat(buf, x, T)
+
+# same values as itsuku.build_MT, in a Flat
+def build_MT_flat(I, X, M, huge=True):
+    T = len(X)
+    B = Flat(alloc((2*T - 1) * M, huge), M, 2*T - 1)
+    hs = hasher(I)
+    leaf, node = hs.leaf, hs.node
+    for i in range(T):
+        B[i + T - 1] = leaf(M, X[i])
+    for i in range(T-2, -1, -1):
+        B[i] = node(M, B[2*i+1], B[2*i+2])
+    collector = itsuku.active_stats()
+    if collector is not None:
+        collector.hashes['leaf'] += T
+        collector.hashes['node'] += T - 1
+    return B
+
+# placement policy: NUMA node (None: any CPU), huge pages
+class Layout:
+
+    def __init__(self, node=None, huge=True, threads=None):
+        self.node, self.huge, self.threads = node, huge, threads
+
+    # CPUs of the node, None for no pinning
+    def cpus(self):
+        if self.node is None:
+            return None
+        all_nodes = nodes()
+        if self.node not in all_nodes:
+            raise Exception("no allowed CPU on NUMA node %s" % self.node)
+        return all_nodes[self.node]
+
+    # X and B as Flat, first touched on the node
+    def build_X_MT(self, I, T, l, n, x, M, F=itsuku.F):
+        def build():
+            X = build_X_flat(I, T, l, n, x, F, self.huge, self.threads)
+            return X, build_MT_flat(I, X, M, self.huge)
+        return _on(self.cpus(), build)
+
+    # keep the calling thread on the node for the enclosed block
+    def pinned(self):
+        return pinned(self.cpus())
+
+    # for distributed.work: pins the worker to the node for good
+    def load(self, I, T, l, n, M, L, S, x, d, F):
+        pin(self.cpus())
+        return self.build_X_MT(I, T, l, n, x, M, F)
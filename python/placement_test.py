@@ -0,0 +1,68 @@
+import os
+import pytest
+import native
+import placement
+from placement import Flat, Layout, build_X_flat, build_MT_flat
+from itsuku import build_X, build_MT, solvePoW, checkPoW, F_METHODS
+
+params = (2**8, 2**4, 4, 64, 9, 64, 64, b'\x00' + b'\xff' * 63)
+
+def test_cpulist():
+    assert placement._cpulist("0-3,8,10-11\n") == {0, 1, 2, 3, 8, 10, 11}
+    assert placement._cpulist("") == set()
+
+def test_nodes(tmp_path):
+    allowed = placement.affinity()
+    cpu = min(allowed)
+    for k, cpus in [(0, "%d" % cpu), (1, "%d-%d" % (cpu, cpu + 1)),
+                    (2, "%d" % (max(allowed) + 1))]:
+        os.mkdir(tmp_path / ('node%d' % k))
+        (tmp_path / ('node%d' % k) / 'cpulist').write_text(cpus + '\n')
+    os.mkdir(tmp_path / 'power')
+    nodes = placement.nodes(str(tmp_path))
+    # node 2 has no allowed cpu
+    assert set(nodes) == {0, 1}
+    assert nodes[0] == {cpu}
+    assert placement.nodes(str(tmp_path / 'none')) == { 0: allowed }
+
+def test_pinned():
+    before = placement.affinity()
+    cpu = min(before)
+    with placement.pinned({cpu}):
+        assert placement.affinity() == {cpu}
+    assert placement.affinity() == before
+    with placement.pinned(None):
+        assert placement.affinity() == before
+
+def test_Flat():
+    X = placement.flat([b'ab', b'cd', b'ef'], 2)
+    assert len(X) == 3 and list(X) == [b'ab', b'cd', b'ef']
+    X[1] = b'xy'
+    assert X[1] == b'xy'
+    with pytest.raises(IndexError):
+        X[3]
+    with pytest.raises(AssertionError):
+        X[0] = b'abc'
+    assert len(placement.alloc(5 * 2**20)) == 5 * 2**20
+
+@pytest.mark.parametrize('F', F_METHODS)
+def test_build_flat(F, monkeypatch):
+    I = os.urandom(64)
+    T, l, n, x, M = 2**7, 2**4, 3, 17, 13
+    X = build_X(I, T, l, n, x, F)
+    assert list(build_X_flat(I, T, l, n, x, F)) == X
+    monkeypatch.setattr(native, 'lib', None)
+    fX = build_X_flat(I, T, l, n, x, F, huge=False)
+    assert list(fX) == X
+    assert list(build_MT_flat(I, fX, M)) == build_MT(I, X, M)
+
+def test_Layout():
+    I = os.urandom(64)
+    node = min(placement.nodes())
+    layout = Layout(node=node)
+    proof, Omega, counter = solvePoW(I, *params, layout=layout)
+    assert checkPoW(I, *params, proof) == (True, Omega)
+    with pytest.raises(Exception):
+        solvePoW(I, *params, layout=layout, mt_memory=2**12)
+    with pytest.raises(Exception):
+        Layout(node=max(placement.nodes()) + 1).cpus()
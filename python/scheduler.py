@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+# multi-challenge solver scheduler with memory admission control
+#
+# Each solvePoW holds X and a Merkle tree, so the footprint of a job is
+# known from (T, x, M) and its mt_memory or layout before it starts. Jobs
+# are admitted while their predicted footprints fit in the memory budget,
+# the others wait in a queue ordered by priority (higher first), then
+# deadline (earlier first), then submission. Admission is in queue order: a
+# large job at the head is not overtaken by smaller ones, so that it cannot
+# starve, but queued jobs past their deadline are dropped wherever they are.
+# Admitted jobs share one worker pool, a process pool by default.
+#
+#   with Scheduler(memory=2**30, workers=4) as s:
+#       f = s.submit(I, T, l, n, M, L, S, x, d, priority=1)
+#       proof, Omega, counter = f.result()
+
+import time
+import heapq
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, CancelledError
+
+from itsuku import solvePoW, ParamError
+import estimate
+
+class Scheduler:
+
+    # memory: budget in bytes
+    # executor: shared pool, a ProcessPoolExecutor(workers) by default
+    # solve: the solver, called as solve(I, T, l, n, M, L, S, x, d, **kwargs)
+    def __init__(self, memory, workers=None, executor=None, solve=solvePoW):
+        self.memory = memory
+        self.used = 0
+        self.executor = executor or ProcessPoolExecutor(workers)
+        self._own = executor is None
+        self._solve = solve
+        self._queue = []
+        self._seq = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        # notified when a job ends
+        self._idle = threading.Condition(self._lock)
+
+    # queue a solve job, return a Future of solvePoW's result
+    # deadline is a time.monotonic() date, a job still queued then fails
+    # with TimeoutError; an impossible job, or one which cannot fit in the
+    # budget, is refused (see estimate.check). The footprint accounts for
+    # the mt_memory and layout arguments of solvePoW in kwargs.
+    def submit(self, I, T, l, n, M, L, S, x, d, priority=0, deadline=None,
+               **kwargs):
+        estimate.check(T, l, n, x, M, L, S, d)
+        memory = estimate.footprint(T, x, M, kwargs.get('mt_memory'),
+                                    kwargs.get('layout'))
+        if memory > self.memory:
+            raise ParamError("impossible job: needs %d bytes, over the %d "
+                             "bytes budget" % (memory, self.memory))
+        future = Future()
+        job = (I, T, l, n, M, L, S, x, d)
+        with self._lock:
+            key = (-priority, deadline if deadline is not None else float('inf'),
+                   self._seq)
+            self._seq += 1
+            heapq.heappush(self._queue, (key, memory, deadline, job, kwargs,
+                                         future))
+        self._admit()
+        return future
+
+    # drop the queued jobs past their deadline, wherever they are in the
+    # queue, and start queued jobs while the head fits
+    def _admit(self):
+        start = []
+        with self._lock:
+            now = time.monotonic()
+            expired = [ e for e in self._queue
+                        if e[2] is not None and now > e[2] ]
+            if expired:
+                self._queue = [ e for e in self._queue
+                                if e[2] is None or now <= e[2] ]
+                heapq.heapify(self._queue)
+            while self._queue:
+                key, memory, deadline, job, kwargs, future = self._queue[0]
+                if self.used + memory > self.memory:
+                    break
+                heapq.heappop(self._queue)
+                # False if cancelled while queued
+                if future.set_running_or_notify_cancel():
+                    self.used += memory
+                    self._active += 1
+                    start.append((memory, job, kwargs, future))
+            self._idle.notify_all()
+        # outside of the lock, as callbacks of finished jobs take it
+        for e in expired:
+            # unless cancelled while queued
+            if e[5].set_running_or_notify_cancel():
+                e[5].set_exception(TimeoutError("deadline passed"))
+        for memory, job, kwargs, future in start:
+            try:
+                inner = self.executor.submit(self._solve, *job, **kwargs)
+            except RuntimeError as e:
+                # the pool was shut down
+                with self._lock:
+                    self.used -= memory
+                    self._active -= 1
+                    self._idle.notify_all()
+                future.set_exception(e)
+                continue
+            inner.add_done_callback(
+                lambda f, memory=memory, future=future:
+                    self._done(f, memory, future))
+
+    def _done(self, inner, memory, future):
+        with self._lock:
+            self.used -= memory
+            self._active -= 1
+            self._idle.notify_all()
+        if inner.cancelled():
+            future.set_exception(CancelledError())
+        elif inner.exception() is not None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(inner.result())
+        self._admit()
+
+    # number of (queued, running) jobs
+    def load(self):
+        with self._lock:
+            return len(self._queue), self._active
+
+    # wait for the queued and running jobs if wait, then stop the pool
+    def shutdown(self, wait=True):
+        if wait:
+            with self._idle:
+                self._idle.wait_for(
+                    lambda: not self._queue and self._active == 0)
+        if self._own:
+            self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
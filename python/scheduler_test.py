@@ -0,0 +1,108 @@
+import os
+import time
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from itsuku import checkPoW, solvePoW
+from scheduler import Scheduler
+from estimate import memory as footprint
+import estimate
+
+def test_scheduler_PoW():
+    T, l, n, x, M, L, S = 2**5, 2**4, 3, 8, 8, 4, 8
+    d = b'\x3f' + b'\xff' * (S-1)
+    with Scheduler(2 * footprint(T, x, M), workers=2) as s:
+        challenges = [ os.urandom(16) for k in range(3) ]
+        futures = [ (I, s.submit(I, T, l, n, M, L, S, x, d))
+                    for I in challenges ]
+        for I, f in futures:
+            proof, Omega, counter = f.result()
+            assert checkPoW(I, T, l, n, M, L, S, x, d, proof) == (True, Omega)
+    with pytest.raises(Exception):
+        Scheduler(footprint(T, x, M) - 1, executor=ThreadPoolExecutor(1)) \
+            .submit(b'', T, l, n, M, L, S, x, d)
+
+def test_scheduler_admission():
+    # solver recording the memory used and start order, blocked until released
+    lock, order, peak = threading.Lock(), [], [0]
+    release = threading.Event()
+    def solve(I, T, l, n, M, L, S, x, d):
+        with lock:
+            order.append(I)
+            peak[0] = max(peak[0], s.used)
+        release.wait()
+        return I
+    unit = footprint(2**4, 8, 8)
+    # room for a small and a big job, but not a third one
+    budget = unit + footprint(2**5, 8, 8) + unit // 2
+    s = Scheduler(budget, executor=ThreadPoolExecutor(8), solve=solve)
+    try:
+        _admission(s, unit, release, order, peak)
+    finally:
+        release.set()
+        s.executor.shutdown()
+
+def _admission(s, unit, release, order, peak):
+    D = b'\x80' + b'\xff' * 7
+    small = lambda I, **kw: s.submit(I, 2**4, 2**4, 3, 8, 4, 8, 8, D, **kw)
+    big = lambda I, **kw: s.submit(I, 2**5, 2**4, 3, 8, 4, 8, 8, D, **kw)
+    fs = [small('a'), big('b')]
+    # the budget is full: the others are queued
+    assert s.load() == (0, 2) and s.used == unit + footprint(2**5, 8, 8)
+    fs += [small('c'), small('d', priority=1), small('e', priority=1, deadline=0),
+           small('f', deadline=time.monotonic() + 60)]
+    # the expired one is dropped at once
+    assert s.load() == (3, 2)
+    release.set()
+    assert [ f.result() for f in fs[:4] ] == ['a', 'b', 'c', 'd']
+    with pytest.raises(TimeoutError):
+        fs[4].result()
+    assert fs[5].result() == 'f'
+    s.shutdown()
+    # by priority, then deadline, then submission
+    assert order == ['a', 'b', 'd', 'f', 'c']
+    assert peak[0] <= s.memory and s.used == 0
+
+def test_scheduler_deadlines():
+    # a job queued behind a head waiting for memory still expires
+    release = threading.Event()
+    def solve(I, T, l, n, M, L, S, x, d):
+        release.wait()
+        return I
+    D = b'\x80' + b'\xff' * 7
+    s = Scheduler(footprint(2**5, 8, 8), executor=ThreadPoolExecutor(4),
+                  solve=solve)
+    try:
+        small = lambda I, **kw: s.submit(I, 2**4, 2**4, 3, 8, 4, 8, 8, D, **kw)
+        big = lambda I, **kw: s.submit(I, 2**5, 2**4, 3, 8, 4, 8, 8, D, **kw)
+        a, b = small('a'), big('b', priority=1)
+        c = small('c', deadline=time.monotonic() + 0.05)
+        assert s.load() == (2, 1)
+        time.sleep(0.1)
+        # the next admission pass drops it, the head still waiting
+        d = small('d')
+        assert isinstance(c.exception(timeout=5), TimeoutError)
+        assert s.load() == (2, 1)
+        release.set()
+        assert [ f.result() for f in [a, b, d] ] == ['a', 'b', 'd']
+    finally:
+        release.set()
+        s.executor.shutdown()
+
+def test_scheduler_partial_tree():
+    T, l, n, x, M, L, S = 2**6, 2**4, 3, 8, 8, 4, 8
+    d = b'\x3f' + b'\xff' * (S-1)
+    partial = estimate.footprint(T, x, M, mt_memory=2**9)
+    assert partial < footprint(T, x, M)
+    used = []
+    def solve(*job, **kwargs):
+        used.append(s.used)
+        return solvePoW(*job, **kwargs)
+    s = Scheduler(partial, executor=ThreadPoolExecutor(1), solve=solve)
+    with s:
+        with pytest.raises(Exception):
+            s.submit(b'I', T, l, n, M, L, S, x, d)
+        proof, Omega, counter = \
+            s.submit(b'I', T, l, n, M, L, S, x, d, mt_memory=2**9).result()
+    assert used == [partial]
+    assert checkPoW(b'I', T, l, n, M, L, S, x, d, proof) == (True, Omega)
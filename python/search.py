@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# transposed (lockstep) nonce search, the "Transposed search" of
+# costs/mtp_hardware.py
+#
+# Instead of running compute_Y for one nonce at a time, K search states
+# advance together one Y step at a time: at each step, their X reads are
+# done in index order, so that accesses to the same segment are grouped,
+# and their hashes are computed as one batch.
+# Results are the same as compute_Y for each nonce.
+#
+# This is a model of the access pattern of a hardware or native searcher,
+# not a speed-up in CPython: X holds references to bytes objects, so sorting
+# the reads buys no cache locality, and the per step lists and sort cost
+# about what the batched loops save. search_bench.py measures it: at T=2^16
+# and L=9, batches of 16 to 256 nonces run from about 25% slower to 15%
+# faster than compute_Y one at a time, depending on K and on the run.
+
+import os
+from hashlib import sha512
+import itsuku
+from itsuku import hasher
+
+# run the searches for all nonces in lockstep
+# return the list of (Omega, i) in nonces order
+# index is the version of the derivation of X indexes, see itsuku.indexer
+def search_batch(I, X, T, L, S, Psi, nonces, byte_order='big', index=0):
+    xor_I = hasher(I).xor_I
+    # versions 0 and 1 (power of 2 T, S >= 8) inlined, as in compute_Y
+    unpack = None
+    if index == 1 and T & (T-1) == 0 and S >= 8:
+        unpack, mask = itsuku._PREFIX[byte_order].unpack_from, T - 1
+    elif index != 0:
+        to_index = itsuku.indexer(T, index, byte_order)
+    K = len(nonces)
+    # Y values of each state, Y[j][s] for state s
+    Y = [ [ sha512(N + Psi + I).digest()[:S] for N in nonces ] ]
+    idx = []
+    for j in range(1, L+1):
+        Yp = Y[-1]
+        # Step 5.a for all states
+        if index == 0:
+            ij = [ int.from_bytes(y, byte_order) % T for y in Yp ]
+        elif unpack is not None:
+            ij = [ unpack(y)[0] & mask for y in Yp ]
+        else:
+            ij = [ to_index(y) for y in Yp ]
+        idx.append(ij)
+        # grouped X reads, in index order
+        Xs = [None] * K
+        for s in sorted(range(K), key=ij.__getitem__):
+            Xs[s] = X[ij[s]]
+        # Step 5.b, one batch of hashes
+        Y.append([ sha512(y + xor_I(v)).digest()[:S] for y, v in zip(Yp, Xs) ])
+    res = []
+    for s in range(K):
+        Ys = [ Yj[s] for Yj in Y ]
+        Omega = sha512(xor_I(b''.join(Ys[:0:-1] if len(Ys) % 2 == 1
+                                      else Ys[::-1]))).digest()[:S]
+        res.append((Omega, [ ij[s] for ij in idx ]))
+    collector = itsuku.active_stats()
+    if collector is not None:
+        collector.hashes['Y'] += K * (L + 2)
+    return res
+
+# random 8 bytes nonces, as solvePoW
+def random_nonces(K):
+    return [ os.urandom(8) for k in range(K) ]
+
+# search K nonces at a time until Omega < d
+# return the first winning nonce (in batch order), its Omega, its X indexes,
+# and the number of nonces evaluated
+def transposed_search(I, X, T, L, S, Psi, d, K=64, nonces=random_nonces,
+                      index=0):
+    assert K >= 1
+    counter = 0
+    while True:
+        batch = nonces(K)
+        counter += len(batch)
+        for N, (Omega, i) in zip(batch, search_batch(I, X, T, L, S, Psi, batch,
+                                                     index=index)):
+            if Omega < d:
+                return N, Omega, i, counter
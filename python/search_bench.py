@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# one at a time against transposed search, per batch size
+#
+# time the search of the same nonces with compute_Y, then with search_batch
+# for each batch size K. In CPython the X reads are object references, so
+# sorting them brings no cache locality: what a batch saves is interpreter
+# overhead per step, which the sort and the per state lists about cancel.
+#
+# usage: search_bench.py [p] [L] [nonces] [K...]
+#   eg: search_bench.py 16 9 2048 1 4 16 64 256
+
+import os
+import sys
+import time
+
+from itsuku import build_X_MT, compute_Y
+from search import search_batch
+
+def timed(f, runs=5):
+    best = None
+    for r in range(runs):
+        start = time.perf_counter()
+        f()
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    return best
+
+def main(argv):
+    p = int(argv[0]) if len(argv) > 0 else 16
+    L = int(argv[1]) if len(argv) > 1 else 9
+    count = int(argv[2]) if len(argv) > 2 else 2048
+    Ks = [ int(K) for K in argv[3:] ] or [4, 8, 16, 32, 64, 128, 256]
+    T, l, n, x, M, S = 2**p, 2**min(p, 10), 4, 64, 64, 64
+    I = os.urandom(64)
+    X, B = build_X_MT(I, T, l, n, x, M)
+    nonces = [ os.urandom(8) for k in range(count) ]
+    def single():
+        for N in nonces:
+            compute_Y(I, X, T, L, S, N, B[0])
+    def batched(K):
+        for k in range(0, count, K):
+            search_batch(I, X, T, L, S, B[0], nonces[k:k+K])
+    base = timed(single)
+    print("T=2^%d L=%d %d nonces" % (p, L, count))
+    print("one at a time: %.3fs" % base)
+    for K in Ks:
+        t = timed(lambda: batched(K))
+        print("K=%d: %.3fs (x%.2f)" % (K, t, base / t))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,52 @@
+import os
+from math import ceil, log
+from itsuku import *
+from search import search_batch, transposed_search
+from stats import Stats
+
+def test_search_batch():
+    M, x, S = 64, 32, 16
+    I = os.urandom(M)
+    for T, l, n in [(2**5, 2**4, 3), (2**7, 2**5, 4)]:
+        L = ceil(3.3*log(T,2))
+        X, B = build_X_MT(I, T, l, n, x, M)
+        for K in [1, 2, 17]:
+            nonces = [ os.urandom(8) for k in range(K) ]
+            res = search_batch(I, X, T, L, S, B[0], nonces)
+            assert len(res) == K
+            # same results as the one at a time search
+            for N, (Omega, i) in zip(nonces, res):
+                Y, nOmega, ni = compute_Y(I, X, T, L, S, N, B[0])
+                assert Omega == nOmega and i == ni
+    # on an even L too
+    res = search_batch(I, X, T, 4, S, B[0], [b'\x00' * 8])
+    Y, Omega, i = compute_Y(I, X, T, 4, S, b'\x00' * 8, B[0])
+    assert res == [(Omega, i)]
+
+def test_transposed_search():
+    M, x, S, L = 16, 16, 8, 6
+    I = os.urandom(M)
+    T, l, n = 2**5, 2**4, 3
+    X, B = build_X_MT(I, T, l, n, x, M)
+    d = b'\x10' + b'\xff' * (S-1)
+    stats = Stats()
+    with instrument(stats):
+        N, Omega, i, cnt = transposed_search(I, X, T, L, S, B[0], d, K=8)
+    assert Omega < d and cnt % 8 == 0
+    assert stats.hashes['Y'] == cnt * (L+2)
+    assert compute_Y(I, X, T, L, S, N, B[0])[1:] == (Omega, i)
+
+    # first winning nonce in batch order
+    counter = iter(range(2**32))
+    nonces = lambda K: [ next(counter).to_bytes(8, 'big') for k in range(K) ]
+    N, Omega, i, cnt = transposed_search(I, X, T, L, S, B[0], d, 4, nonces)
+    for c in range(int.from_bytes(N, 'big')):
+        assert compute_Y(I, X, T, L, S, c.to_bytes(8, 'big'), B[0])[1] >= d
+
+def test_solvePoW_batch():
+    I = os.urandom(16)
+    T, l, n, x, M, L, S = 2**5, 2**4, 3, 8, 8, 4, 8
+    d = b'\x3f' + b'\xff' * (S-1)
+    pow, Omega, cnt = solvePoW(I, T, l, n, M, L, S, x, d, batch=16)
+    assert cnt % 16 == 0
+    assert checkPoW(I, T, l, n, M, L, S, x, d, pow) == (True, Omega)
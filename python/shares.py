@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# streaming search of shares under several thresholds
+#
+# solvePoW stops at the first Omega < d. For pooled mining, search_shares
+# builds X and its Merkle tree once, then keeps searching and yields a
+# Share for every nonce whose Omega is under any of the thresholds, eg an
+# easy share target and the real difficulty. Nonces are 8 bytes big endian
+# counters, searched batch at a time (see search.py). The search runs on its
+# own thread, so that it goes on while the consumer handles a share, and
+# proofs are assembled on worker threads so that the search does not wait
+# for them. Shares are yielded in nonce order once their proof is ready. At
+# most backlog shares wait for the consumer, the search blocks beyond, and
+# closing the generator stops it.
+#
+#   for share in search_shares(I, T, l, n, M, L, S, x, [easy, d], until=d):
+#       submit(share.N, share.proof)
+
+import os
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import itsuku
+from itsuku import build_X_MT, build_rL, build_rZ, exportPoW, instrument
+from search import search_batch
+
+# met: the thresholds (in the given order) Omega is under
+Share = namedtuple('Share', ['N', 'Omega', 'proof', 'met'])
+
+def _proof(X, B, T, l, n, N, i, index):
+    rL = build_rL(i, X, l, n)
+    return exportPoW(N, rL, build_rZ(rL, B, T, l, n), index)
+
+# shares of challenge I under thresholds (S bytes each), as a generator
+# start: first nonce counter, random by default
+# count: stop after count nonces, None to search forever
+# until: stop after a share under this threshold, eg the real difficulty
+# workers: threads assembling proofs
+# backlog: shares found and not yet consumed, beyond which the search waits
+#   for the consumer, so that a slow consumer does not pile up proofs
+# if stats (a stats.Stats) is given, it is filled along the search
+# index selects the derivation of X indexes, see itsuku.indexer
+# The arguments are checked at the call, X is built on the first next().
+def search_shares(I, T, l, n, M, L, S, x, thresholds, F=itsuku.F, batch=64,
+                  start=None, count=None, until=None, workers=1, stats=None,
+                  index=itsuku.INDEX, backlog=64):
+    if not thresholds or any(len(t) != S for t in thresholds):
+        raise Exception("thresholds must be %d bytes" % S)
+    if until is not None and until not in thresholds:
+        raise Exception("until must be one of the thresholds")
+    if index not in itsuku.INDEX_VERSIONS:
+        raise Exception("unexpected index version %s" % index)
+    assert batch >= 1 and workers >= 1 and backlog >= 1
+    # validates the parameters
+    itsuku.challenge(I, T, l, n, M, L, S, x, max(thresholds), F)
+    if start is None:
+        start = int.from_bytes(os.urandom(8), 'big')
+    return _search_shares(I, T, l, n, M, L, S, x, thresholds, F, batch,
+                          start, count, until, workers, stats, index, backlog)
+
+def _search_shares(I, T, l, n, M, L, S, x, thresholds, F, batch, start, count,
+                   until, workers, stats, index, backlog):
+    easiest = max(thresholds)
+    with instrument(stats):
+        X, B = build_X_MT(I, T, l, n, x, M, F=F)
+    Psi = B[0]
+    # (N, Omega, met, proof future) in nonce order, then None at the end of
+    # the search, or the exception which ended it
+    found = queue.Queue(backlog)
+    stop = threading.Event()
+
+    # wait for room in found, False if the consumer is gone
+    def put(item):
+        while not stop.is_set():
+            try:
+                found.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def search(pool):
+        k = 0
+        while not stop.is_set() and (count is None or k < count):
+            K = batch if count is None else min(batch, count - k)
+            nonces = [ ((start + k + j) % 2**64).to_bytes(8, 'big')
+                       for j in range(K) ]
+            k += K
+            with instrument(stats):
+                res = search_batch(I, X, T, L, S, Psi, nonces, index=index)
+            if stats is not None:
+                stats.count(attempts=K)
+            for N, (Omega, i) in zip(nonces, res):
+                if Omega < easiest:
+                    met = tuple(t for t in thresholds if Omega < t)
+                    if not put((N, Omega, met,
+                                pool.submit(_proof, X, B, T, l, n, N, i,
+                                            index))):
+                        return
+                    if until is not None and Omega < until:
+                        return
+
+    def run(pool):
+        try:
+            search(pool)
+        except BaseException as e:
+            put(e)
+        else:
+            put(None)
+
+    with ThreadPoolExecutor(workers) as pool:
+        searcher = threading.Thread(target=run, args=(pool,), daemon=True)
+        searcher.start()
+        try:
+            while True:
+                share = found.get()
+                if share is None:
+                    break
+                if isinstance(share, BaseException):
+                    raise share
+                N, Omega, met, proof = share
+                yield Share(N, Omega, proof.result(), met)
+        finally:
+            stop.set()
+            searcher.join()
+    if stats is not None:
+        stats.emit()
@@ -0,0 +1,95 @@
+import os
+import time
+import pytest
+from shares import search_shares, Share
+from itsuku import build_X_MT, compute_Y, checkPoW
+from stats import Stats
+
+T, l, n, M, L, S, x = 2**8, 2**4, 4, 64, 9, 64, 64
+easy = b'\x20' + b'\xff' * 63
+hard = b'\x04' + b'\xff' * 63
+
+def omegas(I, nonces):
+    X, B = build_X_MT(I, T, l, n, x, M)
+    return [ compute_Y(I, X, T, L, S, N, B[0])[1] for N in nonces ]
+
+def test_shares():
+    I = os.urandom(64)
+    nonces = [ k.to_bytes(8, 'big') for k in range(300) ]
+    expected = [ (N, Omega) for N, Omega in zip(nonces, omegas(I, nonces))
+                 if Omega < easy ]
+    stats = Stats()
+    shares = list(search_shares(I, T, l, n, M, L, S, x, [hard, easy],
+                                start=0, count=300, batch=32, workers=2,
+                                stats=stats))
+    assert [ (s.N, s.Omega) for s in shares ] == expected
+    assert stats.attempts == 300
+    for s in shares:
+        assert s.met == ((hard, easy) if s.Omega < hard else (easy,))
+        for d in s.met:
+            assert checkPoW(I, T, l, n, M, L, S, x, d, s.proof) == \
+                (True, s.Omega)
+
+def test_until():
+    I = os.urandom(64)
+    shares = list(search_shares(I, T, l, n, M, L, S, x, [easy, hard],
+                                start=0, until=hard, batch=16))
+    assert shares[-1].met == (easy, hard)
+    assert all(s.met == (easy,) for s in shares[:-1])
+    # nonces are consecutive counters
+    Ns = [ int.from_bytes(s.N, 'big') for s in shares ]
+    assert Ns == sorted(Ns)
+
+def test_thresholds():
+    I = os.urandom(64)
+    with pytest.raises(Exception):
+        next(search_shares(I, T, l, n, M, L, S, x, [b'\x01'], count=1))
+    with pytest.raises(Exception):
+        next(search_shares(I, T, l, n, M, L, S, x, [easy], until=hard))
+    # wraps around the nonce space
+    shares = list(search_shares(I, T, l, n, M, L, S, x, [b'\xff' * 64],
+                                start=2**64 - 2, count=4))
+    assert [ s.N for s in shares ] == \
+        [ (2**64 - 2).to_bytes(8, 'big'), b'\xff' * 8, bytes(8),
+          (1).to_bytes(8, 'big') ]
+
+def test_background():
+    I = os.urandom(64)
+    stats = Stats()
+    shares = search_shares(I, T, l, n, M, L, S, x, [b'\xff' * 64], start=0,
+                           count=256, batch=16, stats=stats, backlog=256)
+    first = next(shares)
+    assert first.N == bytes(8)
+    # the search goes on while the consumer holds a share
+    for k in range(1000):
+        if stats.attempts == 256:
+            break
+        time.sleep(0.01)
+    assert stats.attempts == 256
+    assert len(list(shares)) == 255
+    # closing the generator stops an endless search
+    shares = search_shares(I, T, l, n, M, L, S, x, [easy], batch=16)
+    next(shares)
+    shares.close()
+
+def test_backlog():
+    I = os.urandom(64)
+    stats = Stats()
+    shares = search_shares(I, T, l, n, M, L, S, x, [b'\xff' * 64], start=0,
+                           count=256, batch=16, stats=stats, backlog=4)
+    next(shares)
+    # the search waits for the consumer within the first batch
+    time.sleep(0.2)
+    assert stats.attempts == 16
+    assert len(list(shares)) == 255
+    assert stats.attempts == 256
+
+def test_eager_checks():
+    I = os.urandom(64)
+    # bad arguments fail at the call, not on the first next()
+    with pytest.raises(Exception):
+        search_shares(I, T, l, n, M, L, S, x, [b'\x01'])
+    with pytest.raises(Exception):
+        search_shares(I, T + 1, l, n, M, L, S, x, [easy])
+    with pytest.raises(Exception):
+        search_shares(I, T, l, n, M, L, S, x, [easy], index=2)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# opt-in instrumentation of the PoW hot paths
+#
+# a Stats object collects:
+# - hashes: number of H calls per call site (direct, indirect, leaf, node, Y...)
+# - timers: cumulated seconds per stage (X, MT, search, proof...)
+# - attempts: number of nonces tried by the search
+# - rejections: number of rejected proofs per reason (see itsuku.ProofError)
+#
+# it is only updated while active (see itsuku.instrument), so that the cost
+# when disabled is a single test per hash call site. A collector may be
+# shared by threads: instrument counts into a private one, merged on exit,
+# and the other updates (count, merge, stages) take its lock.
+
+import time
+import threading
+from collections import Counter
+
+class Stats:
+
+    def __init__(self, hook=None):
+        self.hashes = Counter()
+        self.timers = Counter()
+        self.attempts = 0
+        self.rejections = Counter()
+        # export hook, called with as_dict() on emit()
+        self.hook = hook
+        self._lock = threading.Lock()
+
+    # time a stage: "with stats.stage('X'): ..."
+    def stage(self, name):
+        return _Stage(self, name)
+
+    # add attempts, a rejection reason and hashes per call site
+    def count(self, attempts=0, rejection=None, **hashes):
+        with self._lock:
+            self.attempts += attempts
+            if rejection is not None:
+                self.rejections[rejection] += 1
+            self.hashes.update(hashes)
+
+    # nonces tried per second of search
+    def attempts_per_sec(self):
+        t = self.timers['search']
+        return self.attempts / t if t > 0 else 0.0
+
+    def total_hashes(self):
+        return sum(self.hashes.values())
+
+    # plain data, suitable for json or a metrics pipeline
+    def as_dict(self):
+        return {
+            'hashes': dict(self.hashes),
+            'timers': dict(self.timers),
+            'attempts': self.attempts,
+            'attempts_per_sec': self.attempts_per_sec(),
+            'rejections': dict(self.rejections)
+        }
+
+    # push collected values to the export hook, if any
+    def emit(self):
+        if self.hook is not None:
+            self.hook(self.as_dict())
+
+    # accumulate another collector, eg from a worker
+    def merge(self, other):
+        with self._lock:
+            self.hashes.update(other.hashes)
+            self.timers.update(other.timers)
+            self.attempts += other.attempts
+            self.rejections.update(other.rejections)
+
+    def __repr__(self):
+        return "Stats(%s)" % self.as_dict()
+
+class _Stage:
+
+    def __init__(self, stats, name):
+        self.stats, self.name = stats, name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with self.stats._lock:
+            self.stats.timers[self.name] += elapsed
+        return False
@@ -0,0 +1,80 @@
+from itsuku import *
+from stats import Stats
+
+def test_stats_disabled():
+    # no collector is active by default
+    import itsuku
+    assert itsuku.active_stats() is None
+    X = build_X(os.urandom(64), 2**4, 2**4, 2, 16)
+    assert itsuku.active_stats() is None
+
+def test_stats_build():
+    I = os.urandom(64)
+    T, l, n, x, M = 2**5, 2**3, 3, 16, 16
+    P = T // l
+    stats = Stats()
+    with instrument(stats):
+        X = build_X(I, T, l, n, x)
+        B = build_MT(I, X, M)
+    assert stats.hashes['direct'] == n * P
+    assert stats.hashes['indirect'] == T - n * P
+    assert stats.hashes['leaf'] == T
+    assert stats.hashes['node'] == T - 1
+    assert stats.total_hashes() == 3*T - 1
+
+def test_stats_PoW():
+    I = os.urandom(16)
+    T, l, n, x, M, L, S = 2**5, 2**4, 3, 8, 8, 4, 8
+    d = b'\x3f' + b'\xff' * (S-1)
+    exported = []
+    stats = Stats(hook=exported.append)
+    pow, Omega, cnt = solvePoW(I, T, l, n, M, L, S, x, d, stats=stats)
+    assert stats.attempts == cnt
+    assert stats.hashes['Y'] == cnt * (L+2)
+    for stage in ['build', 'search', 'proof']:
+        assert stage in stats.timers
+    assert stats.attempts_per_sec() > 0
+    assert len(exported) == 1 and exported[0]['attempts'] == cnt
+
+    cstats = Stats(hook=exported.append)
+    ok, nOmega = checkPoW(I, T, l, n, M, L, S, x, d, pow, stats=cstats)
+    assert ok and nOmega == Omega
+    assert cstats.attempts == 1
+    assert cstats.hashes['Y'] == L+2
+    assert cstats.hashes['leaf'] > 0
+    assert len(exported) == 2
+
+    stats.merge(cstats)
+    assert stats.attempts == cnt + 1
+
+def test_stats_threads():
+    import threading
+    import itsuku
+    I = os.urandom(16)
+    T, l, n, x, M, L, S = 2**5, 2**4, 3, 8, 8, 4, 8
+    d = b'\x3f' + b'\xff' * (S-1)
+    pow, Omega, cnt = solvePoW(I, T, l, n, M, L, S, x, d)
+    stats = Stats()
+    def run():
+        for k in range(200):
+            checkPoW(I, T, l, n, M, L, S, x, d, pow, stats=stats)
+        # other threads do not see this one's collector
+        assert itsuku.active_stats() is None
+    threads = [ threading.Thread(target=run) for t in range(4) ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert itsuku.active_stats() is None
+    assert stats.attempts == 800
+    assert stats.hashes['Y'] == 800 * (L+2)
+
+def test_stats_layout():
+    from placement import Layout
+    I = os.urandom(16)
+    T, l, n, x, M, L, S = 2**5, 2**4, 3, 8, 8, 4, 8
+    d = b'\x3f' + b'\xff' * (S-1)
+    stats = Stats()
+    solvePoW(I, T, l, n, M, L, S, x, d, stats=stats, layout=Layout())
+    # the build runs on another thread
+    assert stats.hashes['leaf'] == T and stats.hashes['node'] == T - 1
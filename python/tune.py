@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+# self-calibrating parameter tuner
+#
+# calibrate() measures, on this machine and at small scale, the cost per
+# element of building X and its Merkle tree and the cost of one search
+# attempt (compute_Y). recommend() extrapolates them to the requested T and
+# chooses the difficulty d (and possibly L) so that the median solve time
+# hits a target, with the distribution of the number of attempts.
+#
+# usage: tune.py target T [l=.. n=.. x=.. M=.. L=.. S=.. memory=..]
+
+import os
+import time
+from math import log, ceil, floor
+from collections import namedtuple
+
+from itsuku import build_X_MT, compute_Y
+import estimate
+from estimate import success_probability, footprint
+
+# seconds per X element (build X and Merkle tree) and per search attempt
+Calibration = namedtuple('Calibration', ['T', 'L', 'per_element', 'per_attempt'])
+
+Recommendation = namedtuple('Recommendation', [
+    'd',          # difficulty, S bytes
+    'L',          # search length
+    'p',          # probability of success of one attempt
+    'attempts',   # { 'mean', 'median', 'p90', 'p99' } number of attempts
+    'setup',      # expected build time, in seconds
+    'solve',      # expected median solve time, including setup
+    'memory'      # estimated footprint in bytes
+])
+
+# measure building and search costs at small scale
+# with segments of l elements, at most T
+def calibrate(T=2**12, l=None, n=4, x=64, M=64, L=9, S=64, attempts=200):
+    l = min(l or 2**10, T)
+    I = os.urandom(64)
+    start = time.perf_counter()
+    X, B = build_X_MT(I, T, l, n, x, M)
+    per_element = (time.perf_counter() - start) / T
+    start = time.perf_counter()
+    for a in range(attempts):
+        compute_Y(I, X, T, L, S, a.to_bytes(8, 'big'), B[0])
+    per_attempt = (time.perf_counter() - start) / attempts
+    return Calibration(T, L, per_element, per_attempt)
+
+# number of attempts needed with probability q, for a success probability p
+def attempts_quantile(p, q):
+    if p >= 1.0:
+        return 1
+    return max(1, ceil(log(1.0 - q) / log(1.0 - p)))
+
+def attempts_distribution(p):
+    return {
+        'mean': 1.0 / p,
+        'median': attempts_quantile(p, 0.5),
+        'p90': attempts_quantile(p, 0.9),
+        'p99': attempts_quantile(p, 0.99)
+    }
+
+# difficulty d for a success probability p
+def difficulty(p, S):
+    v = min(256 ** S - 1, max(1, floor(p * 256 ** S)))
+    return v.to_bytes(S, 'big')
+
+# recommend d for a median solve time of target seconds
+# if Ls is given, choose the largest L of Ls with at least min_attempts
+# median attempts, so that the search is not dominated by luck
+# if memory is given, parameters whose footprint exceeds it are rejected
+def recommend(target, T, l, n, x, M, L, S, memory=None, calib=None,
+              Ls=None, min_attempts=2**10):
+    mem = footprint(T, x, M)
+    if memory is not None and mem > memory:
+        raise Exception("footprint %d bytes over the memory budget %d" %
+                        (mem, memory))
+    if calib is None:
+        calib = calibrate(l=l, n=n, x=x, M=M, L=L, S=S)
+    setup = calib.per_element * T
+    if setup >= target:
+        raise Exception("target %.3fs below the expected setup time %.3fs" %
+                        (target, setup))
+    best = None
+    for L in sorted(Ls or [L]):
+        # attempt cost grows with the L+2 hashes of compute_Y
+        per_attempt = calib.per_attempt * (L + 2) / (calib.L + 2)
+        median = (target - setup) / per_attempt
+        # median of a geometric law is about log(2)/p
+        p = min(1.0, log(2) / max(median, 1.0))
+        d = difficulty(p, S)
+        p = success_probability(d)
+        dist = attempts_distribution(p)
+        rec = Recommendation(d, L, p, dist, setup,
+                             setup + dist['median'] * per_attempt, mem)
+        if best is None or dist['median'] >= min_attempts:
+            best = rec
+    return best
+
+# "1024" or "2**10"
+def _int(s):
+    if '**' in s:
+        b, e = s.split('**', 1)
+        return int(b) ** int(e)
+    return int(s)
+
+def main(argv):
+    if len(argv) < 2:
+        print("usage: tune.py target T [l=.. n=.. x=.. M=.. L=.. S=.. memory=..]")
+        return 1
+    target, T = float(argv[0]), _int(argv[1])
+    opts = dict(l=min(T, 2**15), n=4, x=64, M=64, L=9, S=64, memory=None)
+    for a in argv[2:]:
+        k, v = a.split('=', 1)
+        assert k in opts, "unexpected option %s" % k
+        opts[k] = _int(v)
+    r = recommend(target, T, **opts)
+    print("T=%d l=%d n=%d x=%d M=%d S=%d target=%.3fs" %
+          (T, opts['l'], opts['n'], opts['x'], opts['M'], opts['S'], target))
+    print("d=%s L=%d p=%.3g" % (r.d.hex(), r.L, r.p))
+    print("attempts: mean=%.0f median=%d p90=%d p99=%d" %
+          (r.attempts['mean'], r.attempts['median'], r.attempts['p90'],
+           r.attempts['p99']))
+    print("setup=%.3fs median solve=%.3fs memory=%.1fMiB" %
+          (r.setup, r.solve, r.memory / 2**20))
+    return 0
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,50 @@
+import os
+import pytest
+from tune import *
+from itsuku import solvePoW
+
+def test_distribution():
+    assert attempts_quantile(1.0, 0.5) == 1
+    assert attempts_quantile(0.5, 0.5) == 1
+    assert attempts_quantile(0.5, 0.9) == 4
+    d = attempts_distribution(2**-12)
+    assert d['mean'] == 2**12
+    assert d['median'] < d['p90'] < d['p99']
+    assert abs(d['median'] - log(2) * 2**12) < 2
+
+def test_difficulty():
+    for S in [1, 8, 64]:
+        for p in [2**-4, 0.5, 0.01]:
+            assert abs(success_probability(difficulty(p, S)) - p) <= 256**-S
+    # as in test.py
+    assert success_probability(b'\x00\x0f' + b'\xff' * 6) < 2**-12
+    assert difficulty(1.0, 2) == b'\xff\xff'
+
+def test_recommend():
+    calib = Calibration(T=2**10, L=9, per_element=1e-6, per_attempt=1e-5)
+    r = recommend(10.0, 2**20, 2**10, 4, 64, 64, 9, 64, calib=calib)
+    assert r.L == 9 and len(r.d) == 64
+    assert abs(r.setup - 2**20 * 1e-6) < 1e-9
+    assert abs(r.solve - 10.0) < 0.01
+    assert r.memory == footprint(2**20, 64, 64)
+    with pytest.raises(Exception):
+        recommend(10.0, 2**20, 2**10, 4, 64, 64, 9, 64, calib=calib,
+                  memory=2**20)
+    assert recommend(10.0, 2**20, 2**10, 4, 64, 64, 9, 64, calib=calib,
+                     memory=r.memory) == r
+    # longer searches while the median number of attempts stays large enough
+    r = recommend(10.0, 2**20, 2**10, 4, 64, 64, 9, 64, calib=calib,
+                  Ls=[9, 16, 2**16, 2**20])
+    assert r.L == 16 and r.attempts['median'] >= 2**10
+    with pytest.raises(Exception):
+        recommend(0.5, 2**20, 2**10, 4, 64, 64, 9, 64, calib=calib)
+
+def test_calibrate():
+    c = calibrate(T=2**6, n=3, x=8, M=8, L=4, S=8, attempts=10)
+    assert c.per_element > 0 and c.per_attempt > 0
+    # the caller's l, bounded by the calibration T
+    for l in [2**2, 2**10]:
+        assert calibrate(T=2**6, l=l, n=3, x=8, M=8, L=4, S=8,
+                         attempts=1).T == 2**6
+    r = recommend(1.0, 2**6, 2**6, 3, 8, 8, 4, 8, calib=c)
+    assert r.solve > r.setup
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+# cache of verification verdicts, for proofs submitted several times
+#
+# Entries are keyed by one H of the challenge context (see
+# itsuku.Challenge.context), the size and work limits, and the proof, and
+# hold the verdict of checkPoW: (ok, Omega, reason), reason being the
+# ProofError reason of a rejected proof. At most size entries are kept,
+# the least recently used is evicted first, and entries expire ttl seconds
+# after being stored if ttl is given.
+#
+#   cache = VerifyCache(size=2**16, ttl=600)
+#   ok, Omega = checkPoW(I, T, l, n, M, L, S, x, d, proof, cache=cache)
+
+import time
+import threading
+from hashlib import sha512
+from collections import OrderedDict
+
+class VerifyCache:
+
+    def __init__(self, size=4096, ttl=None, clock=time.monotonic):
+        assert size >= 1
+        self.size, self.ttl, self.clock = size, ttl, clock
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        # key -> (date, verdict), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # key of a proof, str or bytes, for a challenge context
+    def key(self, context, proof):
+        if type(proof) is str:
+            proof = proof.encode()
+        return sha512(context + proof).digest()
+
+    # verdict for key, or None
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and \
+               self.clock() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, verdict):
+        with self._lock:
+            self._entries[key] = (self.clock(), verdict)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def as_dict(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+    def __repr__(self):
+        return "VerifyCache(%s)" % self.as_dict()
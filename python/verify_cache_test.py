@@ -0,0 +1,78 @@
+import os
+import pytest
+from verify_cache import VerifyCache
+from itsuku import solvePoW, checkPoW, ProofError, challenge
+from stats import Stats
+
+params = (2**8, 2**4, 4, 64, 9, 64, 64, b'\x00' + b'\xff' * 63)
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+def test_lru():
+    c = VerifyCache(size=2)
+    c.put(b'a', 1)
+    c.put(b'b', 2)
+    assert c.get(b'a') == 1
+    c.put(b'c', 3)
+    # b was the least recently used
+    assert c.get(b'b') is None
+    assert c.get(b'a') == 1 and c.get(b'c') == 3
+    assert c.as_dict() == { 'size': 2, 'hits': 3, 'misses': 1,
+                            'evictions': 1, 'expirations': 0 }
+
+def test_ttl():
+    clock = Clock()
+    c = VerifyCache(ttl=10, clock=clock)
+    c.put(b'a', 1)
+    clock.now = 10
+    assert c.get(b'a') == 1
+    clock.now = 10.5
+    assert c.get(b'a') is None
+    assert len(c) == 0
+    assert (c.hits, c.misses, c.expirations) == (1, 1, 1)
+
+def test_checkPoW():
+    I = os.urandom(64)
+    proof, Omega, counter = solvePoW(I, *params)
+    cache = VerifyCache()
+    stats = Stats()
+    assert checkPoW(I, *params, proof, cache=cache) == (True, Omega)
+    assert checkPoW(I, *params, proof, stats=stats, cache=cache) == \
+        (True, Omega)
+    # one hash for the key, no rebuilding
+    assert dict(stats.hashes) == { 'cache': 1 }
+    assert stats.attempts == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+    # other challenges, limits or proofs are other entries
+    T, l, n, M, L, S, x, d = params
+    assert checkPoW(I, T, l, n, M, L, S, x, b'\xff' * 64, proof,
+                    cache=cache) == (True, Omega)
+    assert checkPoW(I, *params, proof, max_hashes=10**6, cache=cache) == \
+        (True, Omega)
+    assert checkPoW(I, *params, proof, max_hashes=10, cache=cache) == \
+        (False, None)
+    assert checkPoW(I, *params, proof + ' ', cache=cache) == (True, Omega)
+    assert cache.misses == 5 and len(cache) == 5
+
+def test_rejections():
+    I = os.urandom(64)
+    proof, Omega, counter = solvePoW(I, *params)
+    bad = proof.replace('"N": "', '"N": "00')
+    cache = VerifyCache()
+    assert checkPoW(I, *params, bad, cache=cache) == (False, None)
+    stats = Stats()
+    with pytest.raises(ProofError) as e:
+        checkPoW(I, *params, bad, stats=stats, strict=True, cache=cache)
+    assert cache.hits == 1
+    reason = e.value.reason
+    assert reason != ProofError.MALFORMED
+    assert dict(stats.rejections) == { reason: 1 }
+    # oversized proofs are not hashed
+    ch = challenge(I, *params)
+    big = ' ' * (ch.max_size + 1)
+    assert checkPoW(I, *params, big, cache=cache) == (False, None)
+    assert cache.misses == 1 and len(cache) == 1